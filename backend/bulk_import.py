@@ -0,0 +1,96 @@
+import codecs
+import csv
+import json
+import os
+
+from pydantic import ValidationError
+
+import models
+import schemas
+
+# Parsing and validation for POST /users/{user_id}/properties/import.
+#
+# The request body is read as a stream of NDJSON lines (one property object per
+# line) or CSV records (header row naming schemas.PropertyCreate fields), so
+# imports of any size are handled in constant memory. Rows that fail to parse
+# or validate are reported by line number and skipped; the rest are inserted in
+# chunks by crud.bulk_create_properties.
+
+IMPORT_CHUNK_SIZE = int(os.getenv("PROPERTY_IMPORT_CHUNK_SIZE", "1000"))
+MAX_IMPORT_CHUNK_SIZE = 10000
+MAX_REPORTED_ERRORS = int(os.getenv("PROPERTY_IMPORT_MAX_ERRORS", "1000"))
+
+_PROPERTY_TYPES = {property_type.name for property_type in models.PropertyType}
+
+
+def detect_format(content_type: str | None) -> str:
+    return "csv" if content_type and "csv" in content_type else "ndjson"
+
+
+async def iter_lines(chunks):
+    """Yield (line number, text) for each line of a UTF-8 byte stream."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    line_number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            line_number += 1
+            yield line_number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield line_number + 1, pending.rstrip("\r")
+
+
+async def iter_ndjson(chunks):
+    """Yield (line number, parsed object or None, error or None) per non-blank line."""
+    async for line_number, line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, None, f"invalid JSON: {exc}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "expected a JSON object"
+            continue
+        yield line_number, record, None
+
+
+async def iter_csv(chunks):
+    """Yield (line number, record dict or None, error or None) per CSV record after the header."""
+    header = None
+    record_lines = []
+    start_line = 0
+    async for line_number, line in iter_lines(chunks):
+        if not record_lines:
+            start_line = line_number
+            if not line.strip():
+                continue
+        record_lines.append(line)
+        text = "\n".join(record_lines)
+        if text.count('"') % 2:
+            continue  # a quoted field continues on the next line
+        record_lines = []
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start_line, None, f"expected {len(header)} fields, got {len(values)}"
+            continue
+        yield start_line, {name: value for name, value in zip(header, values) if value != ""}, None
+    if record_lines:
+        yield start_line, None, "unterminated quoted field"
+
+
+def validate(record: dict) -> tuple[schemas.PropertyCreate | None, list[str]]:
+    try:
+        property = schemas.PropertyCreate.model_validate(record)
+    except ValidationError as exc:
+        return None, [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()]
+    if property.property_type not in _PROPERTY_TYPES:
+        return None, [f"property_type: must be one of {', '.join(sorted(_PROPERTY_TYPES))}"]
+    return property, []
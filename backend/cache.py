@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+
+# TTLCache instances live in the worker process, so invalidating one only
+# reaches the worker that performed the write; the TTL bounds how long other
+# workers can serve a stale entry.
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+# Public read endpoints. RESPONSE_CACHE_URL selects the backend: unset or
+# "memory://" keeps responses in process, "redis://..." shares them (and their
+# invalidation) between workers and requires the `redis` package.
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "memory://")
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire `ttl` seconds after being set.
+    Hits and misses are exported to /metrics as `<name>_cache_hits_total` / `_misses_total`.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = metrics.counter(f"{name}_cache_hits_total", f"{name} cache lookups served from the cache")
+        self.misses = metrics.counter(f"{name}_cache_misses_total", f"{name} cache lookups that missed")
+        metrics.gauge(f"{name}_cache_hit_ratio", f"Share of {name} cache lookups that hit", self.hit_ratio)
+        metrics.gauge(f"{name}_cache_entries", f"Entries held in the {name} cache", lambda: len(self._data))
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits.inc()
+                    return value
+                del self._data[key]
+        self.misses.inc()
+        return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def hit_ratio(self) -> float:
+        lookups = self.hits.value + self.misses.value
+        return round(self.hits.value / lookups, 4) if lookups else 0.0
+
+
+# Authenticated users by username, as schemas.User (see main.get_current_user)
+user_cache = TTLCache("user", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+
+class MemoryBackend:
+    """Per-process response store; also the stand-in for Redis in development and tests."""
+
+    remote = False
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache("response", maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value):
+        self._entries.set(key, value)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+
+
+class RedisBackend:
+    """Response store shared by all workers through Redis (or any server speaking its protocol)."""
+
+    remote = True
+    GENERATION_KEY = "response-cache:generation"
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("RESPONSE_CACHE_URL points at Redis but the 'redis' package is not installed.")
+        self._client = redis.Redis.from_url(url)
+        self._ttl = max(1, int(ttl))
+        self.hits = metrics.counter("response_cache_hits_total", "response cache lookups served from the cache")
+        self.misses = metrics.counter("response_cache_misses_total", "response cache lookups that missed")
+
+    def get(self, key):
+        raw = self._client.get(f"response-cache:{key}")
+        if raw is None:
+            self.misses.inc()
+            return None
+        self.hits.inc()
+        return json.loads(raw)
+
+    def set(self, key, value):
+        self._client.set(f"response-cache:{key}", json.dumps(value), ex=self._ttl)
+
+    def generation(self) -> int:
+        return int(self._client.get(self.GENERATION_KEY) or 0)
+
+    def bump_generation(self):
+        self._client.incr(self.GENERATION_KEY)
+
+
+class ResponseCache:
+    """
+    Cache of serialized JSON responses for anonymous GET endpoints.
+
+    Keys combine the request path, its normalized query string and a generation
+    number. Any write to listing data bumps the generation (see invalidate()), so
+    every entry cached before the write is bypassed and left to expire.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def _call(self, fn, *args):
+        if self.backend.remote:
+            return await run_in_threadpool(fn, *args)
+        return fn(*args)
+
+    async def key(self, path: str, query_items) -> str:
+        params = sorted((name, value) for name, value in query_items if value != "")
+        generation = await self._call(self.backend.generation)
+        return f"{generation}:{path}?{json.dumps(params, separators=(',', ':'))}"
+
+    async def get(self, key: str) -> dict | None:
+        return await self._call(self.backend.get, key)
+
+    async def set(self, key: str, body: bytes, headers: dict) -> dict:
+        entry = {
+            "body": body.decode(),
+            "headers": headers,
+            "etag": '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+        }
+        await self._call(self.backend.set, key, entry)
+        return entry
+
+    def invalidate(self):
+        # Called from crud after a commit, off the event loop (see crud._after_commit)
+        self.backend.bump_generation()
+
+
+def _response_cache_backend():
+    if RESPONSE_CACHE_URL.startswith("memory://"):
+        return MemoryBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS)
+    if RESPONSE_CACHE_URL.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL_SECONDS)
+    raise ValueError(f"Unsupported RESPONSE_CACHE_URL '{RESPONSE_CACHE_URL}'.")
+
+
+response_cache = ResponseCache(_response_cache_backend())
@@ -1,16 +1,164 @@
-from sqlalchemy.orm import Session
+import base64
+import binascii
+import contextvars
+import functools
+import json
+from sqlalchemy import String, and_, bindparam, case, cast, delete, func, insert, literal, or_, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, Query, defer, selectinload
 import models
 import schemas
-from passlib.context import CryptContext
+import events
+import geo
+import recommendations
+import scheduling
+import search
+from cache import response_cache, user_cache
 from fastapi import HTTPException
 from models import User, Property, Image, Favorite, VisitRequest, VisitRequestStatus
 from datetime import datetime
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# --- Query loading profiles ---
+# schemas.Property serializes `agent` and `images`, so every query returning
+# properties for a response must load both up front. selectinload issues one
+# extra SELECT per relationship for the whole result set instead of one per row.
+# The full-text document is never part of a response, so it is not loaded.
+PROPERTY_RESPONSE_OPTIONS = (
+    selectinload(models.Property.agent),
+    selectinload(models.Property.images).selectinload(models.Image.variants),
+    defer(models.Property.search_vector),
+)
+
+
+IMAGE_RESPONSE_OPTIONS = (
+    selectinload(models.Image.variants),
+)
+
+
+# --- Side effects of writes ---
+# Invalidating the response cache and publishing events are network calls with
+# the Redis backends. Under AsyncSession.run_sync crud runs on the event-loop
+# thread, so crud_async wraps the call in collect_side_effects() and runs them
+# in a worker thread once it returns. Called any other way, they run at once.
+_pending_side_effects = contextvars.ContextVar("pending_side_effects", default=None)
+
+
+def _after_commit(fn, *args):
+    pending = _pending_side_effects.get()
+    if pending is None:
+        fn(*args)
+    else:
+        pending.append(functools.partial(fn, *args))
+
+
+def collect_side_effects(fn):
+    """
+    Wrap a crud function to return (result, exception, side effects) instead of
+    running its side effects; the exception it raised, if any, is returned so
+    the side effects of the writes it committed before still run.
+    """
+    @functools.wraps(fn)
+    def wrapper(db, *args, **kwargs):
+        pending = []
+        token = _pending_side_effects.set(pending)
+        try:
+            return fn(db, *args, **kwargs), None, pending
+        except Exception as exc:
+            return None, exc, pending
+        finally:
+            _pending_side_effects.reset(token)
+    return wrapper
+
+
+def _upsert_insert(db: Session, model):
+    # INSERT supporting on_conflict_do_nothing/do_update (PostgreSQL and SQLite)
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def query_properties(db: Session):
+    return db.query(models.Property).options(*PROPERTY_RESPONSE_OPTIONS)
+
+
+# --- Keyset pagination ---
+# Pages are addressed by an opaque cursor holding the sort key and id of the
+# last row served, so fetching page N costs the same as fetching page 1.
+MAX_PAGE_SIZE = 100
+
+# Sort orders usable with cursors: name -> (sort column, descending)
+PROPERTY_SORTS = {
+    "newest": (models.Property.created_at, True),
+    "price": (models.Property.price, False),
+    "popular": (models.Property.favorites_count, True),
+}
+
+
+def encode_cursor(sort: str, value, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps({"s": sort, "v": value, "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, column=None):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if data["s"] != sort:
+            raise ValueError("cursor was issued for a different sort order")
+        value = data["v"]
+        if column is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        return value, int(data["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def paginate_properties(query: Query, sort: str = "newest", cursor: str | None = None, limit: int = 10,
+                        sort_key: tuple | None = None):
+    """
+    Apply keyset pagination to a property query.
+    Returns the page of rows and the cursor for the next page (None on the last page).
+
+    `sort_key` is a (SQL expression, descending) pair for orders that are not a
+    plain column, e.g. search relevance or distance. The expression is added to
+    the query's columns as `sort_value`, so the returned rows are (Property, ..., sort_value).
+    """
+    if sort_key is None:
+        if sort not in PROPERTY_SORTS:
+            raise HTTPException(status_code=400, detail=f"Sort must be one of {set(PROPERTY_SORTS)}")
+        column, descending = PROPERTY_SORTS[sort]
+    else:
+        column, descending = sort_key
+        query = query.add_columns(column.label("sort_value"))
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    key = tuple_(column, models.Property.id)
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort, column if sort_key is None else None)
+        query = query.filter(key < tuple_(value, last_id) if descending else key > tuple_(value, last_id))
+
+    if descending:
+        query = query.order_by(column.desc(), models.Property.id.desc())
+    else:
+        query = query.order_by(column.asc(), models.Property.id.asc())
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    last_property = last if isinstance(last, models.Property) else last[0]
+    if sort_key is None:
+        return rows, encode_cursor(sort, getattr(last_property, column.key), last_property.id)
+    return rows, encode_cursor(sort, last.sort_value, last_property.id)
+
 
 # --- User CRUD operations ---
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+# Passwords arrive already hashed (see hashing.py) so bcrypt never runs inside a DB call
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
     db_user = models.User(username=user.username,
                           hashed_password=hashed_password,
                           name=user.name,
@@ -36,7 +184,7 @@ def get_properties_by_user(db: Session, username: str):
         raise HTTPException(status_code=404, detail="User not found")
 
     # Query properties owned by the agent
-    return db.query(models.Property).filter(models.Property.agent_id == user.id).all()
+    return query_properties(db).filter(models.Property.agent_id == user.id).all()
 
 
 def get_users(db: Session):
@@ -46,19 +194,24 @@ def get_users(db: Session):
     return users
 
 
-def update_user(db: Session, user_id: int, user_update: schemas.UserCreate):
+def update_user(db: Session, user_id: int, user_update: schemas.UserCreate, hashed_password: str):
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
 
     if not db_user:
         return None
 
+    previous_username = db_user.username
     db_user.username = user_update.username
-    db_user.hashed_password = pwd_context.hash(user_update.password)
+    db_user.hashed_password = hashed_password
     db_user.name = user_update.name
     db_user.surname = user_update.surname
     db_user.role = user_update.role
 
     db.commit()
+    # Drop the cached identity only after the commit so it can't be re-filled with old data
+    user_cache.invalidate(previous_username)
+    user_cache.invalidate(user_update.username)
+    _after_commit(response_cache.invalidate)  # users appear as `agent` in cached property responses
     db.refresh(db_user)
     return db_user
 
@@ -69,8 +222,21 @@ def delete_user(db: Session, user_id: int):
     if not db_user:
         return None
 
+    username = db_user.username
+    # The user's favorites and visit requests are deleted with them (ORM cascade)
+    for favorite in db_user.favorites:
+        _adjust_counters(db, favorite.property_id, favorites=-1)
+    queue_similarity_rebuild(db, [favorite.property_id for favorite in db_user.favorites])
+    for visit_request in db_user.visit_requests:
+        if visit_request.status == models.VisitRequestStatus.pending:
+            _adjust_counters(db, visit_request.property_id, pending_visits=-1)
+    db.query(models.SavedSearchMatch).filter(
+        models.SavedSearchMatch.user_id == user_id).delete(synchronize_session=False)
+    db.query(models.SavedSearch).filter(models.SavedSearch.user_id == user_id).delete(synchronize_session=False)
     db.delete(db_user)
     db.commit()
+    user_cache.invalidate(username)
+    _after_commit(response_cache.invalidate)
     return True
 
 
@@ -85,24 +251,65 @@ def create_property(db: Session, property: schemas.PropertyCreate, agent_id: int
         bedrooms=property.bedrooms,
         bathrooms=property.bathrooms,
         size=property.size,
+        latitude=property.latitude,
+        longitude=property.longitude,
+        geohash=geo.geohash_or_none(property.latitude, property.longitude),
         agent_id=agent_id  # Associate the property with the agent
     )
+    db_property.search_vector = search.search_vector(db, property.title, property.description, property.location)
     db.add(db_property)
+    db.flush()
+    match_saved_searches(db, [db_property.id])
     db.commit()
+    _after_commit(response_cache.invalidate)
     db.refresh(db_property)
-    return db_property
+    search.index_property(db, db_property)
+    return get_property(db, db_property.id)
+
+
+def bulk_create_properties(db: Session, properties: list[schemas.PropertyCreate], agent_id: int) -> int:
+    """
+    Insert validated properties for an agent in one executemany statement and
+    commit. Rolls back and re-raises on database errors so the caller can report
+    the chunk as failed.
+    """
+    created_at = datetime.utcnow()
+    rows = [{**property.model_dump(), "agent_id": agent_id, "created_at": created_at,
+             "geohash": geo.geohash_or_none(property.latitude, property.longitude)} for property in properties]
+    statement = insert(models.Property.__table__)
+    if search.is_postgres(db):
+        # tsvector computed by the database from each row's own fields
+        statement = statement.values(search_vector=search.search_vector(
+            db, bindparam("document_title"), bindparam("document_description"), bindparam("document_location")
+        ))
+        for row in rows:
+            row.update(document_title=row["title"], document_description=row["description"],
+                       document_location=row["location"])
+    else:
+        for row in rows:
+            row["search_vector"] = search.search_vector(db, row["title"], row["description"], row["location"])
+    try:
+        property_ids = db.execute(statement.returning(models.Property.__table__.c.id), rows).scalars().all()
+        match_saved_searches(db, property_ids)
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+    _after_commit(response_cache.invalidate)
+    search.reload_index(db)
+    return len(rows)
 
 
 def get_property(db: Session, property_id: int):
-    return db.query(models.Property).filter(models.Property.id == property_id).first()
+    return query_properties(db).filter(models.Property.id == property_id).first()
 
 
 def get_properties_by_agent(db: Session, agent_id: int):
-    return db.query(models.Property).filter(models.Property.agent_id == agent_id).all()
+    return query_properties(db).filter(models.Property.agent_id == agent_id).all()
 
 
-def get_all_properties(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Property).offset(skip).limit(limit).all()
+def get_all_properties(db: Session, sort: str = "newest", cursor: str | None = None, limit: int = 10):
+    return paginate_properties(query_properties(db), sort=sort, cursor=cursor, limit=limit)
 
 
 def update_property(db: Session, property_id: int, property_update: schemas.PropertyCreate):
@@ -119,10 +326,21 @@ def update_property(db: Session, property_id: int, property_update: schemas.Prop
     db_property.bedrooms = property_update.bedrooms
     db_property.bathrooms = property_update.bathrooms
     db_property.size = property_update.size
+    # Coordinates are kept unless the update includes them
+    if {"latitude", "longitude"} & property_update.model_fields_set:
+        db_property.latitude = property_update.latitude
+        db_property.longitude = property_update.longitude
+        db_property.geohash = geo.geohash_or_none(property_update.latitude, property_update.longitude)
+    db_property.search_vector = search.search_vector(
+        db, property_update.title, property_update.description, property_update.location)
+    db.flush()
+    rematch_saved_searches(db, db_property.id)
 
     db.commit()
+    _after_commit(response_cache.invalidate)
     db.refresh(db_property)
-    return db_property
+    search.index_property(db, db_property)
+    return get_property(db, db_property.id)
 
 
 def delete_property(db: Session, property_id: int):
@@ -131,53 +349,316 @@ def delete_property(db: Session, property_id: int):
     if not db_property:
         return None
 
+    # Images go with the property (ORM cascade), releasing their blobs
+    _release_blobs(db, [image.content_hash for image in db_property.images])
+    db.query(models.SavedSearchMatch).filter(
+        models.SavedSearchMatch.property_id == property_id).delete(synchronize_session=False)
+    _remove_similarities(db, property_id)
     db.delete(db_property)
     db.commit()
+    _after_commit(response_cache.invalidate)
+    search.unindex_property(db, property_id)
     return True
 
 
-def search_properties(
-        db: Session,
+def property_filters(
         location: str | None = None,
         min_price: float | None = None,
         max_price: float | None = None,
         property_type: str | None = None,
         bedrooms: int | None = None,
-        bathrooms: int | None = None
+        bathrooms: int | None = None,
+        status: str | None = None
 ):
-
-    return db.query(models.Property).filter(
+    """Filter criteria shared by search_properties and export_properties."""
+    return (
         # Only add filters for non-None values
         models.Property.location.ilike(f"%{location}%") if location else True,
         models.Property.price >= min_price if min_price is not None else True,
         models.Property.price <= max_price if max_price is not None else True,
         models.Property.property_type == property_type if property_type else True,  # Use Enum
+        models.Property.status == status if status else True,
         models.Property.bedrooms >= bedrooms if bedrooms is not None else True,
         models.Property.bathrooms >= bathrooms if bathrooms is not None else True
-    ).all()
+    )
+
+
+def geo_filters(
+        lat: float | None = None,
+        lng: float | None = None,
+        radius_km: float | None = None,
+        bbox: str | None = None
+):
+    """Radius and bounding-box criteria shared by search_properties and export_properties."""
+    criteria = []
+    if bbox:
+        try:
+            criteria.append(geo.bbox_filter(*geo.parse_bbox(bbox)))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox must be west,south,east,north in degrees")
+    if radius_km is not None:
+        if lat is None or lng is None:
+            raise HTTPException(status_code=400, detail="Searching by radius requires lat and lng")
+        if radius_km <= 0:
+            raise HTTPException(status_code=400, detail="radius_km must be positive")
+        criteria.append(geo.radius_filter(lat, lng, radius_km))
+    return criteria
+
+
+def search_properties(
+        db: Session,
+        location: str | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        property_type: str | None = None,
+        bedrooms: int | None = None,
+        bathrooms: int | None = None,
+        status: str | None = None,
+        q: str | None = None,
+        sort: str | None = None,
+        cursor: str | None = None,
+        limit: int = 50,
+        lat: float | None = None,
+        lng: float | None = None,
+        radius_km: float | None = None,
+        bbox: str | None = None
+):
+    # Full-text queries are ordered by relevance unless another sort is requested
+    sort = sort or ("relevance" if q else "newest")
+    if sort == "relevance" and not q:
+        raise HTTPException(status_code=400, detail="Sorting by relevance requires a search query (q)")
+    sort_key = None
+    criteria = geo_filters(lat, lng, radius_km, bbox)
+    if sort == "distance":
+        if lat is None or lng is None:
+            raise HTTPException(status_code=400, detail="Sorting by distance requires lat and lng")
+        sort_key = (geo.squared_distance(lat, lng), False)
+        # Listings without coordinates have no distance, and a NULL sort key cannot go in a cursor
+        criteria += [models.Property.latitude.isnot(None), models.Property.longitude.isnot(None)]
+
+    query = query_properties(db).filter(
+        *property_filters(location, min_price, max_price, property_type, bedrooms, bathrooms, status),
+        *criteria
+    )
+    if not q:
+        rows, next_cursor = paginate_properties(query, sort=sort, cursor=cursor, limit=limit, sort_key=sort_key)
+        properties = rows if sort_key is None else [row[0] for row in rows]
+    elif search.is_postgres(db):
+        properties, next_cursor = _full_text_search_postgres(db, query, q, sort, cursor, limit, sort_key)
+    else:
+        properties, next_cursor = _full_text_search_fallback(db, query, q, sort, cursor, limit, sort_key)
+
+    if lat is not None and lng is not None:
+        for db_property in properties:
+            if db_property.latitude is not None and db_property.longitude is not None:
+                db_property.distance_km = round(
+                    geo.haversine_km(lat, lng, db_property.latitude, db_property.longitude), 3)
+    return properties, next_cursor
+
+
+def _full_text_search_postgres(db: Session, query: Query, q: str, sort: str, cursor: str | None, limit: int,
+                               sort_key: tuple | None):
+    rank = search.ts_rank(q)
+    query = query.filter(search.ts_match(q)).add_columns(rank.label("rank"))
+    if sort == "relevance":
+        sort_key = (rank, True)
+    rows, next_cursor = paginate_properties(query, sort=sort, cursor=cursor, limit=limit, sort_key=sort_key)
+
+    properties = []
+    for row in rows:
+        db_property = row[0]
+        db_property.rank = row.rank
+        properties.append(db_property)
+    headlines = search.ts_headlines(db, q, [p.id for p in properties])
+    for db_property in properties:
+        db_property.headline = headlines.get(db_property.id)
+    return properties, next_cursor
+
+
+def _full_text_search_fallback(db: Session, query: Query, q: str, sort: str, cursor: str | None, limit: int,
+                               sort_key: tuple | None):
+    # Rank with the in-process inverted index, then apply the SQL filters to the matches
+    scores = search.fallback_search(db, q)
+    if not scores:
+        return [], None
+    query = query.filter(models.Property.id.in_(scores))
+
+    if sort == "relevance":
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        keys = sorted(((scores[pid], pid) for (pid,) in query.with_entities(models.Property.id)), reverse=True)
+        if cursor:
+            last_key = decode_cursor(cursor, sort)
+            keys = [key for key in keys if key < last_key]
+        page = keys[:limit]
+        next_cursor = encode_cursor(sort, *keys[limit - 1]) if len(keys) > limit else None
+        by_id = {p.id: p for p in query_properties(db).filter(models.Property.id.in_([pid for _, pid in page]))}
+        properties = [by_id[pid] for _, pid in page]
+    else:
+        rows, next_cursor = paginate_properties(query, sort=sort, cursor=cursor, limit=limit, sort_key=sort_key)
+        properties = rows if sort_key is None else [row[0] for row in rows]
+
+    terms = set(search.tokenize(q))
+    for db_property in properties:
+        db_property.rank = scores[db_property.id]
+        db_property.headline = search.highlight(
+            " — ".join(filter(None, [db_property.title, db_property.location, db_property.description])), terms)
+    return properties, next_cursor
+
+
+# Export loads only what the export rows contain, see export.py
+PROPERTY_EXPORT_OPTIONS = (
+    selectinload(models.Property.agent),
+    selectinload(models.Property.images),
+    defer(models.Property.search_vector),
+)
+
+
+def export_properties(
+        db: Session,
+        location: str | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        property_type: str | None = None,
+        bedrooms: int | None = None,
+        bathrooms: int | None = None,
+        status: str | None = None,
+        q: str | None = None,
+        lat: float | None = None,
+        lng: float | None = None,
+        radius_km: float | None = None,
+        bbox: str | None = None,
+        batch_size: int = 1000
+):
+    """
+    Iterate every property matching the search_properties filters, in id order,
+    `batch_size` rows at a time from a server-side cursor.
+    """
+    query = db.query(models.Property).options(*PROPERTY_EXPORT_OPTIONS).filter(
+        *property_filters(location, min_price, max_price, property_type, bedrooms, bathrooms, status),
+        *geo_filters(lat, lng, radius_km, bbox),
+        text_match_filter(db, q) if q else True
+    )
+    return query.order_by(models.Property.id).yield_per(batch_size)
+
+
+def text_match_filter(db: Session, q: str):
+    """Criterion matching properties found by a full-text query (unranked)."""
+    if search.is_postgres(db):
+        return search.ts_match(q)
+    return models.Property.id.in_(search.fallback_search(db, q))
+
+
+# --- Search facets ---
+# Upper bounds of the price bands reported by search_facets; the last band is open-ended
+PRICE_FACET_BANDS = (50000, 100000, 200000, 300000, 500000, 1000000)
+MAX_BEDROOM_FACET = 5  # 5 and more bedrooms are counted together
+
+
+def _price_band_label(low, high) -> str:
+    if low is None:
+        return f"<{high}"
+    return f"{low}-{high}" if high is not None else f"{low}+"
+
+
+def search_facets(
+        db: Session,
+        location: str | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        property_type: str | None = None,
+        bedrooms: int | None = None,
+        bathrooms: int | None = None,
+        status: str | None = None,
+        q: str | None = None,
+        lat: float | None = None,
+        lng: float | None = None,
+        radius_km: float | None = None,
+        bbox: str | None = None
+) -> dict:
+    """
+    Counts per property type, status, bedroom count and price band of the
+    properties matching the search_properties filters. Every bucket is a
+    conditional aggregate of one SELECT, so the matching rows are read once.
+    """
+    buckets = []  # (facet, value, condition)
+    for member in models.PropertyType:
+        buckets.append(("property_type", member.value, models.Property.property_type == member))
+    for member in models.ListingStatus:
+        buckets.append(("status", member.value, models.Property.status == member))
+    for count in range(MAX_BEDROOM_FACET):
+        buckets.append(("bedrooms", str(count), models.Property.bedrooms == count))
+    buckets.append(("bedrooms", f"{MAX_BEDROOM_FACET}+", models.Property.bedrooms >= MAX_BEDROOM_FACET))
+    bounds = (None,) + PRICE_FACET_BANDS + (None,)
+    for low, high in zip(bounds, bounds[1:]):
+        condition = and_(models.Property.price >= low if low is not None else True,
+                         models.Property.price < high if high is not None else True)
+        buckets.append(("price", _price_band_label(low, high), condition))
+
+    columns = [func.count(models.Property.id)]
+    columns += [func.coalesce(func.sum(case((condition, 1), else_=0)), 0) for _, _, condition in buckets]
+    row = db.query(*columns).filter(
+        *property_filters(location, min_price, max_price, property_type, bedrooms, bathrooms, status),
+        *geo_filters(lat, lng, radius_km, bbox),
+        text_match_filter(db, q) if q else True
+    ).one()
+
+    facets = {"total": row[0], "property_type": {}, "status": {}, "bedrooms": {}, "price": {}}
+    for (facet, value, _), count in zip(buckets, row[1:]):
+        facets[facet][value] = count
+    return facets
 
 
 # --- Image CRUD operations ---
 
-def create_image(db: Session, image: schemas.ImageCreate, property_id: int):
+def create_image(db: Session, image: schemas.ImageCreate, property_id: int,
+                 content_hash: str | None = None, size_bytes: int | None = None):
     """
     Create a new image associated with a specific property.
+    For content-addressed uploads, the image takes a reference on its blob in
+    the same transaction (see storage.py).
     """
+    if content_hash is not None:
+        _reference_blob(db, content_hash, image.url, size_bytes)
     db_image = models.Image(
         url=image.url,
-        property_id=property_id
+        property_id=property_id,
+        content_hash=content_hash
     )
     db.add(db_image)
     db.commit()
-    db.refresh(db_image)
-    return db_image
+    _after_commit(response_cache.invalidate)
+    return get_image(db, property_id, db_image.id)
+
+
+def _reference_blob(db: Session, content_hash: str, path: str, size_bytes: int | None):
+    # Insert-or-increment in one statement so concurrent uploads of the same content cannot race
+    statement = _upsert_insert(db, models.ImageBlob).values(
+        content_hash=content_hash, path=path, size_bytes=size_bytes, ref_count=1, updated_at=func.now()
+    )
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[models.ImageBlob.content_hash],
+        set_={"ref_count": models.ImageBlob.ref_count + 1, "updated_at": func.now()}
+    ))
+
+
+def _release_blobs(db: Session, content_hashes: list[str]):
+    # One decrement per released image; blobs reaching zero are left for storage.collect_garbage()
+    counts = {}
+    for content_hash in content_hashes:
+        if content_hash is not None:
+            counts[content_hash] = counts.get(content_hash, 0) + 1
+    for content_hash, count in counts.items():
+        db.query(models.ImageBlob).filter(models.ImageBlob.content_hash == content_hash).update(
+            {"ref_count": models.ImageBlob.ref_count - count, "updated_at": func.now()},
+            synchronize_session=False
+        )
 
 
 def get_image(db: Session, property_id: int, image_id: int):
     """
     Retrieve a single image by its ID and associated property_id.
     """
-    return db.query(models.Image).filter(
+    return db.query(models.Image).options(*IMAGE_RESPONSE_OPTIONS).filter(
         models.Image.id == image_id,
         models.Image.property_id == property_id
     ).first()
@@ -185,7 +666,7 @@ def get_images_by_property(db: Session, property_id: int):
     """
     Retrieve all images associated with a specific property.
     """
-    return db.query(models.Image).filter(models.Image.property_id == property_id).all()
+    return db.query(models.Image).options(*IMAGE_RESPONSE_OPTIONS).filter(models.Image.property_id == property_id).all()
 
 
 def delete_image(db: Session, image_id: int):
@@ -197,66 +678,417 @@ def delete_image(db: Session, image_id: int):
     if not db_image:
         return None
 
+    _release_blobs(db, [db_image.content_hash])
     db.delete(db_image)
     db.commit()
+    _after_commit(response_cache.invalidate)
     return True
 
+# --- Property counters ---
+# Property.favorites_count and pending_visits_count are adjusted in the same
+# transaction as the row that changes them, with an in-place increment so
+# concurrent writers don't lose updates. Listing responses pick the new values
+# up when their cache entries expire rather than invalidating the cache on
+# every favorite.
+def _adjust_counters(db: Session, property_id: int, favorites: int = 0, pending_visits: int = 0):
+    values = {}
+    if favorites:
+        values["favorites_count"] = models.Property.favorites_count + favorites
+    if pending_visits:
+        values["pending_visits_count"] = models.Property.pending_visits_count + pending_visits
+    if values:
+        db.query(models.Property).filter(models.Property.id == property_id).update(values, synchronize_session=False)
+
+
+def reconcile_property_counters(db: Session) -> int:
+    """Recompute every property's counters from the source tables. Returns the number of corrected rows."""
+    favorites = db.query(func.count(models.Favorite.id)).filter(
+        models.Favorite.property_id == models.Property.id).scalar_subquery()
+    pending_visits = db.query(func.count(models.VisitRequest.id)).filter(
+        models.VisitRequest.property_id == models.Property.id,
+        models.VisitRequest.status == models.VisitRequestStatus.pending).scalar_subquery()
+    corrected = db.query(models.Property).filter(
+        (models.Property.favorites_count != favorites) | (models.Property.pending_visits_count != pending_visits)
+    ).update({"favorites_count": favorites, "pending_visits_count": pending_visits}, synchronize_session=False)
+    db.commit()
+    if corrected:
+        _after_commit(response_cache.invalidate)
+    return corrected
+
+
 # --- Favorite CRUD operations ---
+# Adding and removing are idempotent: adding an existing favorite or removing a
+# missing one changes nothing (and leaves the counters alone).
+
+
 def add_favorite(db: Session, user_id: int, property_id: int):
-    favorite = models.Favorite(user_id=user_id, property_id=property_id)
-    db.add(favorite)
-    db.commit()
-    db.refresh(favorite)
-    return favorite
+    if not update_favorites(db, user_id, add=[property_id])["added"] and get_property(db, property_id) is None:
+        raise HTTPException(status_code=404, detail="Property not found")
+    return db.query(models.Favorite).filter_by(user_id=user_id, property_id=property_id).first()
 
 def remove_favorite(db: Session, user_id: int, property_id: int):
-    favorite = db.query(models.Favorite).filter_by(user_id=user_id, property_id=property_id).first()
-    if favorite:
-        db.delete(favorite)
-        db.commit()
-        return True
-    raise HTTPException(status_code=404, detail="Favorite not found")
+    update_favorites(db, user_id, remove=[property_id])
+    return True
+
+
+def update_favorites(db: Session, user_id: int, add: list[int] = (), remove: list[int] = (),
+                     check: list[int] = ()) -> dict:
+    """
+    Add and remove favorites in one transaction and report which of `check` are
+    favorited afterwards. Returns {"added", "removed", "favorited"} id lists, where
+    added/removed only list the ids that actually changed.
+    """
+    added = _insert_favorites(db, user_id, add) if add else []
+    removed = _delete_favorites(db, user_id, remove) if remove else []
+    queue_similarity_rebuild(db, added + removed)
+    db.commit()
+    favorited = favorited_property_ids(db, user_id, check) if check else set()
+    return {"added": sorted(added), "removed": sorted(removed), "favorited": sorted(favorited)}
+
+
+def _insert_favorites(db: Session, user_id: int, property_ids: list[int]) -> list[int]:
+    # One INSERT ... ON CONFLICT DO NOTHING for every existing property; RETURNING gives the new rows
+    existing = [pid for (pid,) in db.query(models.Property.id).filter(models.Property.id.in_(set(property_ids)))]
+    if not existing:
+        return []
+    statement = _upsert_insert(db, models.Favorite.__table__).values(
+        [{"user_id": user_id, "property_id": pid} for pid in existing]
+    ).on_conflict_do_nothing(index_elements=["user_id", "property_id"]).returning(models.Favorite.property_id)
+    added = [pid for (pid,) in db.execute(statement)]
+    if added:
+        db.query(models.Property).filter(models.Property.id.in_(added)).update(
+            {"favorites_count": models.Property.favorites_count + 1}, synchronize_session=False)
+    return added
+
+
+def _delete_favorites(db: Session, user_id: int, property_ids: list[int]) -> list[int]:
+    statement = delete(models.Favorite.__table__).where(
+        models.Favorite.user_id == user_id,
+        models.Favorite.property_id.in_(set(property_ids))
+    ).returning(models.Favorite.property_id)
+    removed = [pid for (pid,) in db.execute(statement)]
+    if removed:
+        db.query(models.Property).filter(models.Property.id.in_(removed)).update(
+            {"favorites_count": models.Property.favorites_count - 1}, synchronize_session=False)
+    return removed
+
+
+def favorited_property_ids(db: Session, user_id: int, property_ids: list[int]) -> set[int]:
+    """The subset of property_ids the user has favorited (served by the unique_favorite index)."""
+    return {pid for (pid,) in db.query(models.Favorite.property_id).filter(
+        models.Favorite.user_id == user_id,
+        models.Favorite.property_id.in_(set(property_ids))
+    )}
+
+
 
 def get_favorites(db: Session, user_id: int):
-    return db.query(models.Property).join(models.Favorite).filter(models.Favorite.user_id == user_id).all()
+    return query_properties(db).join(models.Favorite).filter(models.Favorite.user_id == user_id).all()
+
+
+# --- Recommendations (see recommendations.py) ---
+
+def queue_similarity_rebuild(db: Session, property_ids: list[int]):
+    """Mark listings whose favorites changed for the next recommendations rebuild (caller commits)."""
+    property_ids = {pid for pid in property_ids if pid is not None}
+    if not property_ids:
+        return
+    now = datetime.utcnow()
+    statement = _upsert_insert(db, models.PropertySimilarityQueue).values(
+        [{"property_id": pid, "queued_at": now} for pid in property_ids])
+    db.execute(statement.on_conflict_do_update(index_elements=["property_id"], set_={"queued_at": now}))
+
+
+def _remove_similarities(db: Session, property_id: int):
+    # Listings that recommended the deleted one get recomputed without it
+    similarity = models.PropertySimilarity
+    neighbours = [pid for (pid,) in db.query(similarity.property_id).filter(
+        similarity.similar_property_id == property_id)]
+    db.query(similarity).filter(or_(similarity.property_id == property_id,
+                                    similarity.similar_property_id == property_id)).delete(synchronize_session=False)
+    db.query(models.PropertySimilarityQueue).filter(
+        models.PropertySimilarityQueue.property_id == property_id).delete(synchronize_session=False)
+    queue_similarity_rebuild(db, neighbours)
+
+
+def get_similar_properties(db: Session, property_id: int, limit: int = 10):
+    """Listings most often favorited by the same users, best first; None if the property does not exist."""
+    if db.query(models.Property.id).filter(models.Property.id == property_id).first() is None:
+        return None
+    similarity = models.PropertySimilarity
+    limit = max(1, min(limit, recommendations.RECOMMENDATIONS_TOP_K))
+    return query_properties(db).join(similarity, similarity.similar_property_id == models.Property.id).filter(
+        similarity.property_id == property_id
+    ).order_by(similarity.score.desc(), models.Property.id).limit(limit).all()
 
 
 def create_visit_request(db: Session, visit_request: schemas.VisitRequestCreate, user_id: int):
+    agent_id = db.query(models.Property.agent_id).filter(models.Property.id == visit_request.property_id).first()
+    if agent_id is None:
+        raise HTTPException(status_code=404, detail="Property not found")
+    if find_visit_conflict(db, agent_id[0], visit_request.visit_time):
+        raise HTTPException(status_code=409, detail="The agent already has a visit booked at this time")
     db_visit_request = models.VisitRequest(
         property_id=visit_request.property_id,
         user_id=user_id,
         email=visit_request.email,
         message=visit_request.message,
-        visit_date=visit_request.visit_date,  # Assuming visit_date is a datetime
-        visit_time=visit_request.visit_time,  # Assuming visit_time is a datetime
+        visit_date=scheduling.to_utc_naive(visit_request.visit_date),
+        visit_time=scheduling.to_utc_naive(visit_request.visit_time),
         created_at=datetime.utcnow(),
         status=models.VisitRequestStatus.pending,  # Default status
+        agent_id=agent_id[0],
     )
     db.add(db_visit_request)
+    _adjust_counters(db, visit_request.property_id, pending_visits=1)
     db.commit()
     db.refresh(db_visit_request)
+    _publish_visit_request("visit_request.created", db_visit_request)
     return db_visit_request
 
 
+def _publish_visit_request(event_type: str, visit_request: VisitRequest):
+    # Pushed to the agent's open event streams (see events.py)
+    if visit_request.agent_id is not None:
+        data = schemas.VisitRequestResponse.model_validate(visit_request, from_attributes=True).model_dump(mode="json")
+        _after_commit(events.publish, f"agent:{visit_request.agent_id}", event_type, data)
+
+
 def get_visit_requests_for_property(db: Session, property_id: int):
     return db.query(VisitRequest).filter(VisitRequest.property_id == property_id).all()
 
 
 
-def get_visit_requests_for_agent(db: Session, agent_id: int):
-    return (
-        db.query(VisitRequest)
-        .join(Property, Property.id == VisitRequest.property_id)
-        .filter(Property.agent_id == agent_id)
-        .all()
+# Agent inbox: newest first, keyset-paginated on (created_at, id) so every page
+# is a range scan of ix_visit_requests_agent_[status_]created.
+def get_visit_requests_for_agent(
+        db: Session,
+        agent_id: int,
+        status: VisitRequestStatus | None = None,
+        created_after: datetime | None = None,
+        created_before: datetime | None = None,
+        cursor: str | None = None,
+        limit: int = 50
+):
+    """Returns the page of visit requests and the cursor for the next page (None on the last page)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(VisitRequest).filter(
+        VisitRequest.agent_id == agent_id,
+        VisitRequest.status == status if status else True,
+        VisitRequest.created_at >= created_after if created_after else True,
+        VisitRequest.created_at < created_before if created_before else True
     )
+    if cursor:
+        value, last_id = decode_cursor(cursor, "inbox", VisitRequest.created_at)
+        query = query.filter(tuple_(VisitRequest.created_at, VisitRequest.id) < tuple_(value, last_id))
+    rows = query.order_by(VisitRequest.created_at.desc(), VisitRequest.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor("inbox", rows[-1].created_at, rows[-1].id)
+
+
+def count_visit_requests_for_agent(db: Session, agent_id: int) -> dict:
+    """Visit requests per status for an agent (an index-only GROUP BY)."""
+    counts = {member.value: 0 for member in models.VisitRequestStatus}
+    rows = db.query(VisitRequest.status, func.count()).filter(
+        VisitRequest.agent_id == agent_id).group_by(VisitRequest.status)
+    for status, count in rows:
+        if status is not None:
+            counts[status.value] = count
+    counts["total"] = sum(counts.values())
+    return counts
 
 def get_visit_requests_for_user(db: Session, user_id: int):
     return db.query(models.VisitRequest).filter(models.VisitRequest.user_id == user_id).all()
+
+
+def get_visit_request(db: Session, request_id: int):
+    return db.query(models.VisitRequest).filter(models.VisitRequest.id == request_id).first()
+
+
+# --- Visit scheduling (see scheduling.py) ---
+
+def find_visit_conflict(db: Session, agent_id: int, visit_time: datetime, exclude_id: int | None = None):
+    """The agent's accepted visit overlapping a visit at `visit_time`, or None."""
+    start, end = scheduling.visit_interval(visit_time)
+    return db.query(VisitRequest).filter(
+        VisitRequest.agent_id == agent_id,
+        VisitRequest.status == models.VisitRequestStatus.accepted,
+        # every visit lasts VISIT_DURATION, so overlapping ones start within it of `start`
+        VisitRequest.visit_time > start - scheduling.VISIT_DURATION,
+        VisitRequest.visit_time < end,
+        VisitRequest.id != exclude_id if exclude_id is not None else True
+    ).first()
+
+
+def property_availability(db: Session, property_ids: list[int], days: int = 14) -> dict[int, list[datetime]]:
+    """
+    Free visit slots for each of the properties over the next `days` days, from
+    two queries whatever the number of properties. Unknown ids are left out.
+    """
+    agents = dict(db.query(Property.id, Property.agent_id).filter(Property.id.in_(property_ids)))
+    candidates = scheduling.slots(min(days, scheduling.MAX_AVAILABILITY_DAYS))
+    if not agents or not candidates:
+        return {property_id: [] for property_id in property_ids if property_id in agents}
+
+    booked = {agent_id: [] for agent_id in agents.values()}
+    visits = db.query(VisitRequest.agent_id, VisitRequest.visit_time).filter(
+        VisitRequest.agent_id.in_(booked),
+        VisitRequest.status == models.VisitRequestStatus.accepted,
+        VisitRequest.visit_time > candidates[0][0] - scheduling.VISIT_DURATION,
+        VisitRequest.visit_time < candidates[-1][1]
+    )
+    for agent_id, visit_time in visits:
+        booked[agent_id].append(scheduling.visit_interval(visit_time))
+
+    free = {agent_id: scheduling.free_slots(candidates, scheduling.IntervalIndex(intervals))
+            for agent_id, intervals in booked.items()}
+    return {property_id: free[agents[property_id]] for property_id in property_ids if property_id in agents}
+
+
 def update_visit_request_status(db: Session, request_id: int, status: VisitRequestStatus):
-    visit_request = db.query(VisitRequest).filter(VisitRequest.id == request_id).first()
+    # Lock the row so concurrent status changes adjust the pending counter once. The
+    # caller may already have loaded it, so refresh it from the locked read: the
+    # identity map would otherwise hand back the status seen before the lock.
+    visit_request = db.query(VisitRequest).filter(VisitRequest.id == request_id) \
+        .with_for_update().populate_existing().first()
+    if visit_request and status == models.VisitRequestStatus.accepted \
+            and visit_request.status != models.VisitRequestStatus.accepted:
+        # Lock the agent too, so two overlapping requests cannot be accepted concurrently
+        db.query(User.id).filter(User.id == visit_request.agent_id).with_for_update().first()
+        if find_visit_conflict(db, visit_request.agent_id, visit_request.visit_time, exclude_id=visit_request.id):
+            db.rollback()
+            raise HTTPException(status_code=409, detail="The agent already has a visit booked at this time")
     if visit_request:
+        was_pending = visit_request.status == models.VisitRequestStatus.pending
+        is_pending = status == models.VisitRequestStatus.pending
         visit_request.status = status
+        _adjust_counters(db, visit_request.property_id, pending_visits=int(is_pending) - int(was_pending))
         db.commit()
         db.refresh(visit_request)
-    return visit_request
\ No newline at end of file
+        _publish_visit_request("visit_request.updated", visit_request)
+    return visit_request
+
+
+# --- Saved searches ---
+# New and updated listings are matched against every saved search by one
+# INSERT ... SELECT joining them to saved_searches. The join condition leads
+# with ix_saved_searches_match (match_type, max_price): for each listing the
+# database range-scans the searches of its type (or any type) whose price
+# ceiling is at least its price or unset, and checks the remaining criteria on
+# those rows only. Most searches set a budget and leave the floor open, so the
+# scan stays close to the number of actual matches even with millions of searches.
+MAX_SAVED_SEARCHES_PER_USER = 50
+
+
+def create_saved_search(db: Session, user_id: int, saved_search: schemas.SavedSearchCreate):
+    for field, enum in (("property_type", models.PropertyType), ("status", models.ListingStatus)):
+        value = getattr(saved_search, field)
+        if value is not None and value not in enum.__members__:
+            raise HTTPException(status_code=400, detail=f"{field} must be one of {set(enum.__members__)}")
+    count = db.query(func.count(models.SavedSearch.id)).filter(models.SavedSearch.user_id == user_id).scalar()
+    if count >= MAX_SAVED_SEARCHES_PER_USER:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SAVED_SEARCHES_PER_USER} saved searches per user")
+
+    db_saved_search = models.SavedSearch(
+        **saved_search.model_dump(),
+        user_id=user_id,
+        match_type=saved_search.property_type or "*"
+    )
+    db.add(db_saved_search)
+    db.commit()
+    db.refresh(db_saved_search)
+    return db_saved_search
+
+
+def get_saved_searches(db: Session, user_id: int):
+    return db.query(models.SavedSearch).filter(
+        models.SavedSearch.user_id == user_id).order_by(models.SavedSearch.id).all()
+
+
+def delete_saved_search(db: Session, user_id: int, saved_search_id: int):
+    db_saved_search = db.query(models.SavedSearch).filter(
+        models.SavedSearch.id == saved_search_id, models.SavedSearch.user_id == user_id).first()
+    if not db_saved_search:
+        return None
+    db.query(models.SavedSearchMatch).filter(
+        models.SavedSearchMatch.saved_search_id == saved_search_id).delete(synchronize_session=False)
+    db.delete(db_saved_search)
+    db.commit()
+    return True
+
+
+def _like_escape(value):
+    # LIKE wildcards in a column value, escaped for `escape="\\"`
+    for char in ("\\", "%", "_"):
+        value = func.replace(value, char, "\\" + char)
+    return value
+
+
+def _saved_search_matches(listing, saved):
+    """Join condition between listings and the saved searches they match."""
+    return and_(
+        or_(saved.match_type == cast(listing.property_type, String), saved.match_type == "*"),
+        or_(saved.max_price.is_(None), saved.max_price >= listing.price),
+        or_(saved.min_price.is_(None), saved.min_price <= listing.price),
+        or_(saved.bedrooms.is_(None), saved.bedrooms <= listing.bedrooms),
+        or_(saved.bathrooms.is_(None), saved.bathrooms <= listing.bathrooms),
+        or_(saved.status.is_(None), saved.status == cast(listing.status, String)),
+        or_(saved.location.is_(None),
+            listing.location.ilike("%" + _like_escape(saved.location) + "%", escape="\\"))
+    )
+
+
+def match_saved_searches(db: Session, property_ids: list[int]) -> int:
+    """
+    Record the saved searches the properties now match, in the caller's
+    transaction. Listings already recorded for a search are skipped, so an
+    update only adds searches it newly matches. Returns the number of new matches.
+    """
+    if not property_ids:
+        return 0
+    listing, saved = models.Property, models.SavedSearch
+    matches = select(saved.id, saved.user_id, listing.id, literal(datetime.utcnow())).select_from(listing).join(
+        saved, _saved_search_matches(listing, saved)
+    ).where(listing.id.in_(property_ids))
+    statement = _upsert_insert(db, models.SavedSearchMatch).from_select(
+        ["saved_search_id", "user_id", "property_id", "created_at"], matches
+    ).on_conflict_do_nothing(index_elements=["saved_search_id", "property_id"])
+    return db.execute(statement).rowcount
+
+
+def rematch_saved_searches(db: Session, property_id: int) -> int:
+    """
+    After an update, drop the listing's matches with searches it no longer
+    matches and record the new ones (caller commits). Matches that still hold
+    keep their created_at, so an edit does not move the listing up the feeds.
+    """
+    listing, saved = models.Property, models.SavedSearch
+    still_matching = select(saved.id).join(listing, _saved_search_matches(listing, saved)).where(
+        listing.id == property_id)
+    db.query(models.SavedSearchMatch).filter(
+        models.SavedSearchMatch.property_id == property_id,
+        models.SavedSearchMatch.saved_search_id.not_in(still_matching)
+    ).delete(synchronize_session=False)
+    return match_saved_searches(db, [property_id])
+
+
+# The user's feed of matched listings, newest first, keyset-paginated on (created_at, id)
+def get_saved_search_matches(db: Session, user_id: int, saved_search_id: int | None = None,
+                             cursor: str | None = None, limit: int = 20):
+    """Returns the page of matches and the cursor for the next page (None on the last page)."""
+    match = models.SavedSearchMatch
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(match).options(selectinload(match.property).options(*PROPERTY_RESPONSE_OPTIONS)).filter(
+        match.user_id == user_id,
+        match.saved_search_id == saved_search_id if saved_search_id is not None else True
+    )
+    if cursor:
+        value, last_id = decode_cursor(cursor, "matches", match.created_at)
+        query = query.filter(tuple_(match.created_at, match.id) < tuple_(value, last_id))
+    rows = query.order_by(match.created_at.desc(), match.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor("matches", rows[-1].created_at, rows[-1].id)
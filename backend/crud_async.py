@@ -0,0 +1,86 @@
+import functools
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import crud
+from database import run_in_session
+
+# Awaitable variants of the crud functions for use in route handlers.
+# Each takes the same arguments as its crud counterpart and accepts either a
+# Session (run in a worker thread) or an AsyncSession (run via run_sync), so
+# handlers never block the event loop on database IO. run_sync runs on the
+# event-loop thread, so there the cache invalidations and event publishes of a
+# write are collected and run in a worker thread after it returns.
+
+
+def _awaitable(fn):
+    collecting = crud.collect_side_effects(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(db, *args, **kwargs):
+        if not isinstance(db, AsyncSession):
+            return await run_in_session(db, fn, *args, **kwargs)
+        result, exc, side_effects = await run_in_session(db, collecting, *args, **kwargs)
+        if side_effects:
+            await run_in_threadpool(_run_all, side_effects)
+        if exc is not None:
+            raise exc
+        return result
+    return wrapper
+
+
+def _run_all(side_effects):
+    for side_effect in side_effects:
+        side_effect()
+
+
+# --- User CRUD operations ---
+create_user = _awaitable(crud.create_user)
+get_user = _awaitable(crud.get_user)
+get_user_by_id = _awaitable(crud.get_user_by_id)
+get_properties_by_user = _awaitable(crud.get_properties_by_user)
+get_users = _awaitable(crud.get_users)
+update_user = _awaitable(crud.update_user)
+delete_user = _awaitable(crud.delete_user)
+
+# --- Property CRUD operations ---
+create_property = _awaitable(crud.create_property)
+bulk_create_properties = _awaitable(crud.bulk_create_properties)
+get_property = _awaitable(crud.get_property)
+get_properties_by_agent = _awaitable(crud.get_properties_by_agent)
+get_all_properties = _awaitable(crud.get_all_properties)
+update_property = _awaitable(crud.update_property)
+delete_property = _awaitable(crud.delete_property)
+search_properties = _awaitable(crud.search_properties)
+search_facets = _awaitable(crud.search_facets)
+
+# --- Image CRUD operations ---
+create_image = _awaitable(crud.create_image)
+get_image = _awaitable(crud.get_image)
+get_images_by_property = _awaitable(crud.get_images_by_property)
+delete_image = _awaitable(crud.delete_image)
+
+# --- Favorite CRUD operations ---
+add_favorite = _awaitable(crud.add_favorite)
+remove_favorite = _awaitable(crud.remove_favorite)
+update_favorites = _awaitable(crud.update_favorites)
+favorited_property_ids = _awaitable(crud.favorited_property_ids)
+get_similar_properties = _awaitable(crud.get_similar_properties)
+get_favorites = _awaitable(crud.get_favorites)
+
+# --- Visit request CRUD operations ---
+create_visit_request = _awaitable(crud.create_visit_request)
+get_visit_request = _awaitable(crud.get_visit_request)
+get_visit_requests_for_property = _awaitable(crud.get_visit_requests_for_property)
+get_visit_requests_for_agent = _awaitable(crud.get_visit_requests_for_agent)
+count_visit_requests_for_agent = _awaitable(crud.count_visit_requests_for_agent)
+get_visit_requests_for_user = _awaitable(crud.get_visit_requests_for_user)
+update_visit_request_status = _awaitable(crud.update_visit_request_status)
+property_availability = _awaitable(crud.property_availability)
+
+# --- Saved search operations ---
+create_saved_search = _awaitable(crud.create_saved_search)
+get_saved_searches = _awaitable(crud.get_saved_searches)
+delete_saved_search = _awaitable(crud.delete_saved_search)
+get_saved_search_matches = _awaitable(crud.get_saved_search_matches)
@@ -1,8 +1,18 @@
+import contextlib
 import os
+import threading
+import time
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from starlette.concurrency import run_in_threadpool
+
+import metrics
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -12,6 +22,153 @@ URL_DATABASE = os.getenv("DATABASE_URL")
 if not URL_DATABASE:
     raise ValueError("DATABASE_URL is not set in environment variables.")
 
-engine = create_engine(URL_DATABASE)
+# DATABASE_ASYNC=1 serves requests through an AsyncEngine (asyncpg on PostgreSQL,
+# aiosqlite on SQLite). Otherwise requests use the synchronous engine and every
+# crud call runs in a worker thread (see crud_async.py). Migrations and scripts
+# always use the synchronous engine.
+USE_ASYNC_DATABASE = os.getenv("DATABASE_ASYNC", "0").lower() in ("1", "true", "yes")
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}' databases.")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+# Connection pool settings. In sync mode every request holding a session occupies
+# one connection, so DB_POOL_SIZE + DB_MAX_OVERFLOW bounds concurrent database work
+# per worker process; callers beyond that wait up to DB_POOL_TIMEOUT seconds.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; -1 disables
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # PostgreSQL only; 0 disables
+
+
+def instrumented_pool(base, prefix: str):
+    """
+    Subclass of a QueuePool class that records, under `<prefix>_*` in metrics.py,
+    how long checkouts take (including waiting for a free connection), how many
+    callers are waiting and how many gave up after the pool timeout.
+
+    Only checkouts that find the pool exhausted (every pooled and overflow
+    connection in use) count as waiting; the others return without blocking.
+    """
+    checkout_seconds = metrics.histogram(f"{prefix}_checkout_seconds",
+                                         "Time to obtain a pooled connection, including waiting")
+    timeouts = metrics.counter(f"{prefix}_timeouts_total", "Checkouts that failed after waiting DB_POOL_TIMEOUT")
+    waiting = [0]
+    lock = threading.Lock()
+    metrics.gauge(f"{prefix}_waiting", "Callers currently waiting for a pooled connection", lambda: waiting[0])
+
+    class InstrumentedPool(base):
+        def _exhausted(self) -> bool:
+            # max_overflow -1 means unlimited overflow: a checkout never has to wait
+            return self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+
+        def _do_get(self):
+            started = time.perf_counter()
+            blocked = self._exhausted()
+            if blocked:
+                with lock:
+                    waiting[0] += 1
+            try:
+                return super()._do_get()
+            except PoolTimeoutError:
+                timeouts.inc()
+                raise
+            finally:
+                if blocked:
+                    with lock:
+                        waiting[0] -= 1
+                checkout_seconds.observe(time.perf_counter() - started)
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    return InstrumentedPool
+
+
+def register_pool_gauges(prefix: str, get_pool):
+    # get_pool is called on every read so the gauges follow the pool across engine.dispose()
+    metrics.gauge(f"{prefix}_size", "Configured pool size", lambda: get_pool().size())
+    metrics.gauge(f"{prefix}_checked_out", "Connections currently in use", lambda: get_pool().checkedout())
+    metrics.gauge(f"{prefix}_checked_in", "Idle connections in the pool", lambda: get_pool().checkedin())
+    metrics.gauge(f"{prefix}_overflow", "Connections open beyond the pool size (negative: unopened pool slots)",
+                  lambda: get_pool().overflow())
+
+
+def engine_options(url: str, pool_class) -> dict:
+    url = make_url(url)
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        # SQLite connections are used from worker threads, one request at a time
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            return options  # in-memory databases use a single shared connection, not a QueuePool
+    elif DB_STATEMENT_TIMEOUT_MS and url.get_backend_name() == "postgresql":
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    options.update(
+        poolclass=pool_class,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    return options
+
+
+engine = create_engine(URL_DATABASE, **engine_options(URL_DATABASE, instrumented_pool(QueuePool, "db_pool")))
+if isinstance(engine.pool, QueuePool):
+    register_pool_gauges("db_pool", lambda: engine.pool)
 SessionLocal = sessionmaker(autocommit=False,autoflush=False,bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+async_engine = None
+AsyncSessionLocal = None
+if USE_ASYNC_DATABASE:
+    async_url = async_database_url(URL_DATABASE)
+    async_engine = create_async_engine(
+        async_url, **engine_options(async_url, instrumented_pool(AsyncAdaptedQueuePool, "db_async_pool")))
+    if isinstance(async_engine.pool, QueuePool):
+        register_pool_gauges("db_async_pool", lambda: async_engine.pool)
+    # Objects are serialized after the commit, when lazy IO is no longer possible,
+    # so they must not be expired by it.
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+@contextlib.asynccontextmanager
+async def session_scope():
+    """
+    A session closed on exit: an AsyncSession when DATABASE_ASYNC is enabled, a
+    Session otherwise (crud_async accepts either).
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def run_in_session(db, fn, *args, **kwargs):
+    """
+    Call a synchronous session function without blocking the event loop:
+    through AsyncSession.run_sync for async sessions, or in a worker thread otherwise.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from starlette.concurrency import run_in_threadpool
+
+import models
+import storage
+from database import SessionLocal
+
+# Resized, re-encoded copies of uploaded images ("variants"), generated in a
+# process pool after the upload response has been sent and recorded in
+# image_variants. GET /images/{name}?w=... serves the closest variant in the
+# best format the client accepts, falling back to the original.
+#
+# Pillow is optional: without it no variants are generated and the originals
+# are served as before.
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = os.path.join(storage.IMAGES_DIR, "variants")
+IMAGE_VARIANT_WIDTHS = tuple(sorted(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(",")))
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+
+# Output formats by preference: (format name, file extension, MIME type, save options)
+VARIANT_FORMATS = (
+    ("AVIF", "avif", "image/avif", {"quality": 50}),
+    ("WEBP", "webp", "image/webp", {"quality": 75, "method": 4}),
+    ("JPEG", "jpg", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+)
+MIME_TYPES = {extension: mime for _, extension, mime, _ in VARIANT_FORMATS}
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def variant_filename(source_filename: str, width: int, extension: str) -> str:
+    stem = os.path.splitext(source_filename)[0]
+    return f"{stem}_{width}.{extension}"
+
+
+def _render_variants(source_path: str) -> list[dict]:
+    # Runs in a worker process
+    from PIL import Image as PILImage, ImageOps
+
+    PILImage.init()
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    source_filename = os.path.basename(source_path)
+    rendered = []
+    with PILImage.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        for width in IMAGE_VARIANT_WIDTHS:
+            if width >= original.width and width != IMAGE_VARIANT_WIDTHS[0]:
+                break  # never upscale; the smallest width is always produced
+            height = max(1, round(original.height * min(width, original.width) / original.width))
+            resized = original.resize((min(width, original.width), height), PILImage.LANCZOS)
+            for format_name, extension, _, options in VARIANT_FORMATS:
+                if format_name not in PILImage.SAVE:
+                    continue
+                image = resized.convert("RGB") if format_name == "JPEG" and resized.mode != "RGB" else resized
+                path = os.path.join(VARIANTS_DIR, variant_filename(source_filename, width, extension))
+                if not os.path.exists(path):  # already rendered for another image with the same content
+                    temp_path = f"{path}.{os.getpid()}.tmp"
+                    image.save(temp_path, format=format_name, **options)
+                    os.replace(temp_path, path)
+                rendered.append({"width": width, "format": extension, "path": path,
+                                 "size_bytes": os.path.getsize(path)})
+    return rendered
+
+
+def _executor_instance() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS)
+    return _executor
+
+
+def _record_variants(image_id: int, rendered: list[dict]):
+    db = SessionLocal()
+    try:
+        if db.get(models.Image, image_id) is None:
+            return  # image deleted while its variants were rendering
+        for variant in rendered:
+            db.add(models.ImageVariant(
+                image_id=image_id,
+                width=variant["width"],
+                format=variant["format"],
+                url="/" + variant["path"].replace(os.sep, "/"),
+                size_bytes=variant["size_bytes"],
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def create_variants(image_id: int, source_path: str):
+    """Background task: render and record the variants of an uploaded image."""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        logger.info("Pillow is not installed; skipping image variants for image %s", image_id)
+        return
+    try:
+        rendered = await asyncio.get_running_loop().run_in_executor(_executor_instance(), _render_variants, source_path)
+    except Exception:
+        logger.exception("Could not render variants for image %s", image_id)
+        return
+    await run_in_threadpool(_record_variants, image_id, rendered)
+
+    from cache import response_cache
+    response_cache.invalidate()  # image listings now include the variants
+
+
+def negotiate(filename: str, width: int | None, accept: str,
+              requested_format: str | None = None) -> tuple[str | None, bool]:
+    """
+    Path of the variant of IMAGES_DIR/filename to serve for a request, or None
+    to serve the original, and whether it is the variant the request asks for
+    rather than a fallback while better ones are missing or not yet rendered.
+    Picks the smallest generated width that covers `width`, in the explicitly
+    requested format or the best one in `accept`.
+    """
+    if width is None and requested_format is None:
+        return None, True
+    if requested_format is not None:
+        extensions = [requested_format.lower().replace("jpeg", "jpg")]
+    else:
+        extensions = [extension for _, extension, mime, _ in VARIANT_FORMATS
+                      if mime in accept or extension == "jpg"]
+
+    candidates = [w for w in IMAGE_VARIANT_WIDTHS if width is None or w >= width] or [IMAGE_VARIANT_WIDTHS[-1]]
+    if width is None:
+        candidates = candidates[::-1]  # format only: largest variant
+    preferred = True
+    for candidate in candidates:
+        for extension in extensions:
+            path = os.path.join(VARIANTS_DIR, variant_filename(filename, candidate, extension))
+            if os.path.exists(path):
+                return path, preferred
+            preferred = False
+    return None, False
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+import metrics
+
+# In-process publish/subscribe for server-sent events (see main.py, GET
+# /users/{user_id}/agent-visit-requests/events).
+#
+# crud publishes an event on a channel (e.g. "agent:42") after each commit.
+# It is encoded once as a server-sent event frame; every open event stream in
+# the worker holds a Subscription with a bounded queue, and a publish appends
+# the frame to the queues of the channel's subscriptions. A subscriber that
+# falls EVENTS_QUEUE_SIZE messages behind has its backlog replaced by a single
+# "resync" event, telling the client to refetch.
+#
+# EVENTS_URL selects the broker: unset or "memory://" delivers within the
+# worker that published (enough for a single worker, and the stand-in for
+# development and tests); "redis://..." relays messages through Redis pub/sub
+# so streams on every worker receive them, and requires the `redis` package.
+EVENTS_URL = os.getenv("EVENTS_URL", "memory://")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+# Reconnect delay of the Redis listener, doubled after each failure up to the maximum
+EVENTS_RECONNECT_SECONDS = float(os.getenv("EVENTS_RECONNECT_SECONDS", "1"))
+EVENTS_RECONNECT_MAX_SECONDS = float(os.getenv("EVENTS_RECONNECT_MAX_SECONDS", "30"))
+
+RESYNC = "event: resync\ndata: {}\n\n"
+
+_published = metrics.counter("events_published_total", "Messages published to the event broker")
+_dropped = metrics.counter("events_dropped_total", "Messages dropped because a subscriber fell behind")
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Queue of event frames for one event stream, filled from any thread."""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+
+    def put(self, message: str):
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass  # the stream's event loop has shut down
+
+    def _put(self, message: str):
+        if self._queue.full():
+            while not self._queue.empty():
+                self._queue.get_nowait()
+                _dropped.inc()
+            message = RESYNC
+        self._queue.put_nowait(message)
+
+    async def get(self) -> str:
+        return await self._queue.get()
+
+
+class MemoryBroker:
+    """Delivers messages to the subscriptions of this worker."""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        metrics.gauge("events_subscribers", "Open event streams in this worker", self.subscriber_count)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, channel: str, message: str):
+        _published.inc()
+        self._deliver(channel, message)
+
+    def _deliver(self, channel: str, message: str):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+class RedisBroker(MemoryBroker):
+    """
+    Publishes through Redis. Each worker keeps one pattern subscription open in
+    a background thread and hands what it receives to its local subscriptions.
+    """
+
+    PREFIX = "events:"
+
+    def __init__(self, url: str):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("EVENTS_URL points at Redis but the 'redis' package is not installed.")
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channel: str, message: str):
+        _published.inc()
+        self._client.publish(self.PREFIX + channel, message)
+
+    def subscribe(self, channel: str) -> Subscription:
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="events-listener", daemon=True)
+                self._listener.start()
+        return super().subscribe(channel)
+
+    def _listen(self):
+        delay = EVENTS_RECONNECT_SECONDS
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.PREFIX + "*")
+                delay = EVENTS_RECONNECT_SECONDS
+                for item in pubsub.listen():
+                    channel = item["channel"].decode()[len(self.PREFIX):]
+                    self._deliver(channel, item["data"].decode())
+            except Exception:
+                # Connection lost: messages published meanwhile are missed, so
+                # ask every local stream to resync once reconnected
+                logger.exception("Event listener lost its Redis subscription; reconnecting in %.1fs", delay)
+                time.sleep(delay)
+                delay = min(delay * 2, EVENTS_RECONNECT_MAX_SECONDS)
+                with self._lock:
+                    channels = list(self._subscriptions)
+                for channel in channels:
+                    self._deliver(channel, RESYNC)
+
+
+def _broker():
+    if EVENTS_URL.startswith("memory://"):
+        return MemoryBroker()
+    if EVENTS_URL.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(EVENTS_URL)
+    raise ValueError(f"Unsupported EVENTS_URL '{EVENTS_URL}'.")
+
+
+broker = _broker()
+
+
+def publish(channel: str, event_type: str, data: dict):
+    broker.publish(channel, f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n")
@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+import os
+
+import crud
+import storage
+from database import SessionLocal
+
+# Streaming listing export for partners (GET /properties/export).
+#
+# Rows are read from a server-side cursor (crud.export_properties) and written
+# to the response in batches as they arrive, so memory use does not depend on
+# the size of the table. The generator opens its own session because it runs
+# after the request's dependencies have been cleaned up; Starlette iterates it
+# in a worker thread.
+
+EXPORT_BATCH_SIZE = int(os.getenv("PROPERTY_EXPORT_BATCH_SIZE", "1000"))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+CSV_COLUMNS = (
+    "id", "title", "description", "price", "location", "property_type", "bedrooms", "bathrooms", "size",
+    "status", "created_at", "agent_id", "agent_username", "agent_name", "agent_surname", "image_urls",
+)
+
+
+def _record(db_property) -> dict:
+    agent = db_property.agent
+    return {
+        "id": db_property.id,
+        "title": db_property.title,
+        "description": db_property.description,
+        "price": db_property.price,
+        "location": db_property.location,
+        "property_type": db_property.property_type.value if db_property.property_type else None,
+        "bedrooms": db_property.bedrooms,
+        "bathrooms": db_property.bathrooms,
+        "size": db_property.size,
+        "status": db_property.status.value if db_property.status else None,
+        "created_at": db_property.created_at.isoformat() if db_property.created_at else None,
+        "agent": {"id": agent.id, "username": agent.username, "name": agent.name, "surname": agent.surname}
+        if agent else None,
+        "image_urls": [storage.public_url(image.url) for image in db_property.images if image.url],
+    }
+
+
+def _ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def _csv_lines(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+    for record in records:
+        buffer.seek(0)
+        buffer.truncate()
+        agent = record.pop("agent") or {}
+        record.update(agent_id=agent.get("id"), agent_username=agent.get("username"),
+                      agent_name=agent.get("name"), agent_surname=agent.get("surname"),
+                      image_urls=" ".join(record["image_urls"]))
+        writer.writerow(record[column] for column in CSV_COLUMNS)
+        yield buffer.getvalue()
+
+
+def iter_export(export_format: str, **filters):
+    """
+    Return an iterator over the encoded export in chunks of about
+    EXPORT_BATCH_SIZE rows. Invalid filters raise here, before anything is streamed.
+    """
+    crud.geo_filters(filters.get("lat"), filters.get("lng"), filters.get("radius_km"), filters.get("bbox"))
+    encode = _csv_lines if export_format == "csv" else _ndjson_lines
+    return _chunks(encode, filters)
+
+
+def _chunks(encode, filters):
+    db = SessionLocal()
+    try:
+        rows = crud.export_properties(db, batch_size=EXPORT_BATCH_SIZE, **filters)
+        batch = []
+        for line in encode(_record(db_property) for db_property in rows):
+            batch.append(line)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield "".join(batch)
+                batch.clear()
+        if batch:
+            yield "".join(batch)
+    finally:
+        db.close()
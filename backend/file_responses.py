@@ -0,0 +1,162 @@
+import os
+import re
+from email.utils import parsedate_to_datetime
+
+import anyio
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+import metrics
+
+# File responses for GET /images with HTTP caching and byte ranges:
+#
+# - ETag/Last-Modified on every response, answered with 304 Not Modified for
+#   If-None-Match/If-Modified-Since.
+# - Single-range Range requests (206, or 416 when unsatisfiable), honouring If-Range.
+# - Content-addressed files (named by the hash of their content, see storage.py)
+#   never change, so they are sent with a year-long immutable Cache-Control and
+#   their name as a strong ETag; other files are revalidated after IMAGE_CACHE_MAX_AGE.
+#   A fallback served in place of a variant that does not exist yet is only
+#   cached for IMAGE_FALLBACK_MAX_AGE, so the URL picks up the variant once rendered.
+# - The body is handed to the server with the ASGI pathsend/zerocopysend
+#   extensions where the server offers them (sendfile), else read in chunks.
+
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", "86400"))
+IMAGE_FALLBACK_MAX_AGE = int(os.getenv("IMAGE_FALLBACK_MAX_AGE", "60"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Original (<sha256>.<ext>) or variant (<sha256>_<width>.<ext>) names
+_CONTENT_ADDRESSED_RE = re.compile(r"^[0-9a-f]{64}(_\d+)?\.[a-z0-9]{1,10}$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+_not_modified = metrics.counter("image_not_modified_total", "Image requests answered with 304 Not Modified")
+_partial = metrics.counter("image_range_requests_total", "Image requests answered with 206 Partial Content")
+_zero_copy = metrics.counter("image_zero_copy_sends_total", "Image bodies handed to the server for sendfile")
+
+
+def is_immutable(path: str) -> bool:
+    return bool(_CONTENT_ADDRESSED_RE.match(os.path.basename(path)))
+
+
+class ImageFileResponse(FileResponse):
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, stat_result: os.stat_result, byte_range: tuple[int, int] | None = None, **kwargs):
+        super().__init__(path, stat_result=stat_result, **kwargs)
+        self.byte_range = byte_range
+        if byte_range is not None:
+            start, end = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        start, end = self.byte_range or (0, self.stat_result.st_size - 1)
+        extensions = scope.get("extensions") or {}
+
+        if scope["method"].upper() == "HEAD" or end < start:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif self.byte_range is None and "http.response.pathsend" in extensions:
+            _zero_copy.inc()
+            await send({"type": "http.response.pathsend", "path": os.path.realpath(self.path)})
+        elif "http.response.zerocopysend" in extensions:
+            _zero_copy.inc()
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopysend", "file": file,
+                            "offset": start, "count": end - start + 1, "more_body": False})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break  # file truncated underneath us
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _etag_matches(etag: str, header: str) -> bool:
+    return header.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def _not_modified_since(last_modified: str, header: str | None) -> bool:
+    if header is None:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (start, end) of a single "bytes=" range, inclusive. Returns None for headers
+    to ignore (multiple ranges, other units) and raises ValueError when the
+    range cannot be satisfied.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError
+    return start, end
+
+
+async def file_response(request: Request, path: str, media_type: str | None = None,
+                        headers: dict | None = None, fallback: bool = False) -> Response:
+    """
+    Serve `path` for the request. `fallback` marks a file served in place of
+    the resource the URL names, which must not be cached as immutable.
+    """
+    stat_result = await anyio.to_thread.run_sync(os.stat, path)
+    response_headers = {**(headers or {}), "Accept-Ranges": "bytes"}
+    if is_immutable(path):
+        response_headers["ETag"] = f'"{os.path.basename(path)}"'
+    if fallback:
+        response_headers["Cache-Control"] = f"public, max-age={IMAGE_FALLBACK_MAX_AGE}"
+    elif is_immutable(path):
+        response_headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response_headers["Cache-Control"] = f"public, max-age={IMAGE_CACHE_MAX_AGE}"
+
+    response = ImageFileResponse(path, stat_result, headers=response_headers, media_type=media_type)
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if (_etag_matches(etag, if_none_match) if if_none_match is not None
+            else _not_modified_since(last_modified, request.headers.get("if-modified-since"))):
+        _not_modified.inc()
+        kept = ("etag", "last-modified", "cache-control", "vary")
+        return Response(status_code=304, headers={k: v for k, v in response.headers.items() if k in kept})
+
+    range_header = request.headers.get("range")
+    if range_header is None:
+        return response
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() not in (etag, last_modified):
+        return response  # the client's copy is stale: send the whole file
+    try:
+        byte_range = _parse_range(range_header, stat_result.st_size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{stat_result.st_size}"})
+    if byte_range is None:
+        return response
+    _partial.inc()
+    return ImageFileResponse(path, stat_result, byte_range, headers=response_headers, media_type=media_type)
@@ -0,0 +1,134 @@
+import math
+import os
+
+from sqlalchemy import and_, or_
+
+import models
+
+# Geo search over Property.latitude/longitude.
+#
+# Each property with coordinates also stores its geohash, a string whose
+# prefixes name ever smaller grid cells, in a plain B-tree index. A bounding box
+# is answered by covering it with a handful of cells of one prefix length,
+# turning each cell into a range scan on that index, and checking the exact
+# bounds on the rows found. This works the same on PostgreSQL and SQLite.
+# Radius queries search the circle's bounding box and then compare an
+# equirectangular distance, which needs only arithmetic in SQL and is accurate
+# to well under 1% at the distances a map search uses (radius searches do not
+# wrap around the antimeridian).
+
+GEOHASH_PRECISION = 9  # cells of about 5 x 5 m
+MAX_COVER_CELLS = int(os.getenv("GEO_MAX_COVER_CELLS", "32"))
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_or_none(latitude: float | None, longitude: float | None) -> str | None:
+    if latitude is None or longitude is None:
+        return None
+    return encode_geohash(latitude, longitude)
+
+
+def _cell_size(precision: int) -> tuple[float, float]:
+    """(height, width) in degrees of a geohash cell."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def _cells(south: float, west: float, north: float, east: float, precision: int) -> list[str]:
+    height, width = _cell_size(precision)
+    rows = range(math.floor((south + 90) / height), math.floor((min(north, 89.999999) + 90) / height) + 1)
+    columns = range(math.floor((west + 180) / width), math.floor((min(east, 179.999999) + 180) / width) + 1)
+    return [encode_geohash(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+            for row in rows for column in columns]
+
+
+def cover(south: float, west: float, north: float, east: float) -> list[str]:
+    """Smallest set (at most MAX_COVER_CELLS) of equal-length geohash prefixes covering the box."""
+    best = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = _cell_size(precision)
+        if ((north - south) / height + 2) * ((east - west) / width + 2) > MAX_COVER_CELLS:
+            break
+        cells = _cells(south, west, north, east, precision)
+        if len(cells) > MAX_COVER_CELLS:
+            break
+        best = cells
+    return best
+
+
+def parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    """Parse "west,south,east,north" (GeoJSON order) into (south, west, north, east)."""
+    west, south, east, north = (float(part) for part in bbox.split(","))
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox must be west,south,east,north in degrees")
+    return south, west, north, east
+
+
+def bbox_filter(south: float, west: float, north: float, east: float):
+    if west > east:  # crosses the antimeridian
+        return or_(bbox_filter(south, west, north, 180.0), bbox_filter(south, -180.0, north, east))
+    geohash = models.Property.geohash
+    cells = cover(south, west, north, east)
+    return and_(
+        # "{" sorts after every geohash character, so [cell, cell + "{") is the prefix range
+        or_(*(and_(geohash >= cell, geohash < cell + "{") for cell in cells)) if cells != [""] else True,
+        models.Property.latitude.between(south, north),
+        models.Property.longitude.between(west, east),
+    )
+
+
+def _longitude_scale(latitude: float) -> float:
+    return max(math.cos(math.radians(latitude)), 1e-6)
+
+
+def squared_distance(latitude: float, longitude: float):
+    """SQL expression: equirectangular squared distance in km² from the point."""
+    scale = _longitude_scale(latitude)
+    dy = (models.Property.latitude - latitude) * KM_PER_DEGREE
+    dx = (models.Property.longitude - longitude) * (KM_PER_DEGREE * scale)
+    return dy * dy + dx * dx
+
+
+def radius_filter(latitude: float, longitude: float, radius_km: float):
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = min(180.0, radius_km / (KM_PER_DEGREE * _longitude_scale(latitude)))
+    south, north = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    west, east = longitude - dlon, longitude + dlon
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west = west + 360 if west < -180 else west
+        east = east - 360 if east > 180 else east
+    return and_(bbox_filter(south, west, north, east),
+                squared_distance(latitude, longitude) <= radius_km * radius_km)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
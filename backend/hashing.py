@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+import metrics
+
+# Passwords are hashed using bcrypt. A bcrypt round costs ~250 ms of CPU, so
+# hashing and verification run in a bounded worker pool instead of on the
+# event loop, and requests beyond the queue limit are rejected with 429.
+#
+# PASSWORD_HASH_EXECUTOR   "thread" (default; bcrypt releases the GIL) or "process"
+# PASSWORD_HASH_WORKERS    pool size (default: number of CPUs)
+# PASSWORD_HASH_MAX_PENDING  hashes queued or running before new ones get 429 (default 64)
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# Module-level so they can be pickled for a process pool
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, executor: str = "thread", workers: int = 2, max_pending: int = 64):
+        if executor not in ("thread", "process"):
+            raise ValueError("PASSWORD_HASH_EXECUTOR must be 'thread' or 'process'.")
+        self.executor_kind = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Executor | None = None
+
+        self.latency = metrics.histogram("password_hash_seconds", "Time to hash or verify a password, including queueing")
+        self.rejected = metrics.counter("password_hash_rejected_total", "Hash requests rejected with 429 because the queue was full")
+        metrics.gauge("password_hash_pending", "Hash requests queued or running", lambda: self.pending)
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        # Only touched from the event loop thread, so the counter needs no lock
+        if self.pending >= self.max_pending:
+            self.rejected.inc()
+            raise HTTPException(status_code=429, detail="Too many concurrent authentication requests",
+                                headers={"Retry-After": "1"})
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.latency.observe(time.perf_counter() - start)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher = PasswordHasher(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
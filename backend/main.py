@@ -1,29 +1,56 @@
+import asyncio
+import contextlib
 import os
-import base64
+import json
 import shutil
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Request
+import time
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Request, Response
 from fastapi import Body
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
-from passlib.context import CryptContext
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Annotated, List
-from fastapi.staticfiles import StaticFiles
-import crud
-import models
+from fastapi import BackgroundTasks
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+import crud_async
+import bulk_import
+import derivatives
+import events
+import export
+import file_responses
+import hashing
+from cache import response_cache, user_cache
+import metrics
+import recommendations
 import schemas
+import scheduling
+import storage
 from models import VisitRequest
-from database import engine, SessionLocal
+from database import session_scope
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background jobs run while the app does; the worker pools, created on first
+    # use, are shut down with it
+    recommendations.start()
+    try:
+        yield
+    finally:
+        recommendations.stop()
+        hashing.hasher.shutdown()
+        derivatives.shutdown()
 
-# Initializing FastAPI application
-app = FastAPI()
 
-app.mount("/images", StaticFiles(directory="images"), name="images")
+# Initializing FastAPI application
+app = FastAPI(lifespan=lifespan)
 
 # Create a directory to store uploaded images if it doesn't exist
-os.makedirs("images", exist_ok=True)
+os.makedirs(storage.IMAGES_DIR, exist_ok=True)
 
 # OAuth2 setup for security, handles token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -40,22 +67,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "x-new-access-token"],
 )
 
-# Creating the database tables
-models.Base.metadata.create_all(bind=engine)
+# The database schema is managed by Alembic migrations (backend/migrations).
+# Run `alembic upgrade head` from the backend directory before starting the app.
 
 
 # Dependency for database session
-def get_db():
-    db = SessionLocal()
-    try:
+# Yields an AsyncSession when DATABASE_ASYNC is enabled, a Session otherwise;
+# handlers go through crud_async, which accepts either.
+async def get_db():
+    async with session_scope() as db:
         yield db
-    finally:
-        db.close()
-
-# Passwords are hashed using bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # ALGORITHM HS256 refers to HMAC using SHA-256, a secure algorithm for signing and verifying JWT tokens.
 # SECRET_KEY is used as the key for encoding and decoding JWT tokens.
@@ -64,6 +88,11 @@ SECRET_KEY = os.environ.get("SECRET_KEY")
 ALGORITHM = os.environ.get("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_MINUTES = 10
+TOKEN_REFRESH_WINDOW_MINUTES = float(os.environ.get("TOKEN_REFRESH_WINDOW_MINUTES", "5"))
+# Tokens carry the user's id, role and name alongside `sub`. With TRUST_TOKEN_CLAIMS
+# enabled these claims are used as-is, skipping the user lookup entirely; role
+# changes then take effect only when the user's token is next issued.
+TRUST_TOKEN_CLAIMS = os.environ.get("TRUST_TOKEN_CLAIMS", "0").lower() in ("1", "true", "yes")
 
 # Dependency annotation for database session
 db_dependency = Annotated[Session, Depends(get_db)]
@@ -72,16 +101,17 @@ db_dependency = Annotated[Session, Depends(get_db)]
 # User Registration Endpoint
 @app.post("/register", response_model=schemas.User)
 async def register_user(user: schemas.UserCreate, db: db_dependency):
-    db_user = crud.get_user(db=db, username=user.username)  # check if the user already exists in the database
+    db_user = await crud_async.get_user(db=db, username=user.username)  # check if the user already exists in the database
     if db_user:
         raise HTTPException(status_code=400, detail="User already exists")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await hashing.hasher.hash(user.password)
+    return await crud_async.create_user(db=db, user=user, hashed_password=hashed_password)
 
 
 #  checks if the user exists in the database and verifies the password
-def authenticate_user(username: str, password: str, db: db_dependency):
-    user = crud.get_user(db=db, username=username)
-    if not user or not pwd_context.verify(password, user.hashed_password):
+async def authenticate_user(username: str, password: str, db: db_dependency):
+    user = await crud_async.get_user(db=db, username=username)
+    if not user or not await hashing.hasher.verify(password, user.hashed_password):
         return False
     return user
 
@@ -100,47 +130,58 @@ def create_refresh_token(data: dict, expires_delta: timedelta | None = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+# Sliding refresh: a new access token is sent in `x-new-access-token` only when the
+# presented one is within TOKEN_REFRESH_WINDOW_MINUTES of expiring. The decoded
+# claims are kept on request.state so verify_token doesn't decode the token again.
 @app.middleware("http")
 async def refresh_access_on_activity(request: Request, call_next):
     token = request.headers.get("Authorization")
     if token:
-        token = token.split(" ")[1]  # remove 'Bearer' prefix
+        token = token.partition(" ")[2]  # remove 'Bearer' prefix
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username = payload.get("sub")
-            if username:
-                request.state.user = username
-                new_access_token = create_access_token(
-                    data={"sub": username},
+        except JWTError:
+            payload = None
+        if payload and payload.get("sub"):
+            request.state.user = payload["sub"]
+            request.state.token = token
+            request.state.token_claims = payload
+            response = await call_next(request)
+            # A token without `exp` never expires, so there is nothing to refresh
+            expires_at = payload.get("exp")
+            remaining = None if expires_at is None else expires_at - datetime.now(timezone.utc).timestamp()
+            if remaining is not None and remaining < TOKEN_REFRESH_WINDOW_MINUTES * 60:
+                claims = {key: value for key, value in payload.items() if key != "exp"}
+                response.headers["x-new-access-token"] = create_access_token(
+                    data=claims,
                     expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
                 )
-                response = await call_next(request)
-                response.headers["x-new-access-token"] = new_access_token
-                return response
-        except JWTError:
-            pass
+            return response
 
     return await call_next(request)
 
 
-
 # Login Endpoint
 @app.post("/token")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"}
         )
-    access_token = create_access_token(data={"sub": user.username},
+    claims = {"sub": user.username, "uid": user.id, "role": user.role, "name": user.name, "surname": user.surname}
+    access_token = create_access_token(data=claims,
                                        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    refresh_token = create_refresh_token(data={"sub": user.username})
+    refresh_token = create_refresh_token(data=claims)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 # Token Verification
-def verify_token(token: str = Depends(oauth2_scheme)):
+# Reuses the claims decoded by the refresh middleware when `request` carries the same token.
+def verify_token(token: str = Depends(oauth2_scheme), request: Request | None = None):
+    if request is not None and getattr(request.state, "token", None) == token:
+        return request.state.token_claims
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -151,12 +192,40 @@ def verify_token(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=403, detail="Token is invalid")
 
 
+# Look up a user by username through the in-process user cache
+async def load_user(db: Session, username: str) -> schemas.User | None:
+    user = user_cache.get(username)
+    if user is None:
+        db_user = await crud_async.get_user(db=db, username=username)
+        if db_user is None:
+            return None
+        user = schemas.User.model_validate(db_user)
+        user_cache.set(username, user)
+    return user
+
+
+# Authenticated user for the bearer token, or None if the user no longer exists
+async def get_current_user(request: Request, db: db_dependency,
+                           token: str = Depends(oauth2_scheme)) -> schemas.User | None:
+    payload = verify_token(token, request)
+    if TRUST_TOKEN_CLAIMS:
+        try:
+            return schemas.User(id=payload["uid"], username=payload["sub"], role=payload["role"],
+                                name=payload["name"], surname=payload["surname"])
+        except (KeyError, ValueError):
+            pass  # token issued before claims were added
+    return await load_user(db, payload.get("sub"))
+
+
+CurrentUser = Annotated[schemas.User | None, Depends(get_current_user)]
+
+
 # User Token Verification Endpoint
 @app.get("/verify-token/{token}")
 async def verify_user_token(token: str, db: Session = Depends(get_db)):
     payload = verify_token(token=token)
     username = payload.get("sub")
-    user = crud.get_user(db, username=username)
+    user = await load_user(db, username)
 
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -171,19 +240,25 @@ async def verify_user_token(token: str, db: Session = Depends(get_db)):
         "access_token": token
     }
 
+# Per-worker runtime metrics (password hashing, caches, connection pool)
+@app.get("/metrics")
+async def read_metrics():
+    return metrics.snapshot()
+
+
 # --- User Endpoints ---
 
 # Read a user info anyone
 @app.get("/users/{username}", response_model=schemas.User)
 async def read_user(username: str, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db=db, username=username)
+    db_user = await crud_async.get_user(db=db, username=username)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 @app.get("/users/id/{user_id}", response_model=schemas.User)
 async def read_user_by_id(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_id(db=db, user_id=user_id)  # Add a function to get user by ID
+    db_user = await crud_async.get_user_by_id(db=db, user_id=user_id)  # Add a function to get user by ID
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -191,7 +266,8 @@ async def read_user_by_id(user_id: int, db: Session = Depends(get_db)):
 # Update a user
 @app.put("/users/{user_id}", response_model=schemas.User)
 async def update_existing_user(user_id: int, user: schemas.UserCreate, db: db_dependency):
-    db_user = crud.update_user(db, user_id, user)
+    hashed_password = await hashing.hasher.hash(user.password)
+    db_user = await crud_async.update_user(db, user_id, user, hashed_password)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -200,7 +276,7 @@ async def update_existing_user(user_id: int, user: schemas.UserCreate, db: db_de
 # Delete a user
 @app.delete("/users/{user_id}", response_model=dict)
 async def delete_user(user_id: int, db: db_dependency):
-    result = crud.delete_user(db, user_id)
+    result = await crud_async.delete_user(db, user_id)
     if not result:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted successfully"}
@@ -209,28 +285,39 @@ async def delete_user(user_id: int, db: db_dependency):
 # List all users
 @app.get("/users", response_model=List[schemas.User])
 async def list_users(db: db_dependency):
-    users = crud.get_users(db=db)
+    users = await crud_async.get_users(db=db)
     return users
 
 
 # Read own user info
 @app.get("/user/myinfo", response_model=schemas.User)
-async def get_user_info(
-        db: Session = Depends(get_db),
-        token: str = Depends(oauth2_scheme)
-):
-    # Verify the token to extract user information
-    payload = verify_token(token)
-    username = payload.get("sub")  # Extract the username or user ID from the token
-
-    # Fetch user information based on the username
-    user = crud.get_user(db=db, username=username)
+async def get_user_info(user: CurrentUser):
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
     return user
 
 
+# --- Response caching for public read endpoints ---
+
+# Serve an anonymous GET endpoint through the response cache. `build` returns the
+# response content (already validated against the response schema) and extra
+# headers; the JSON body is cached and revalidated by clients with ETag/If-None-Match.
+async def cached_response(request: Request, build) -> Response:
+    key = await response_cache.key(request.url.path, request.query_params.multi_items())
+    entry = await response_cache.get(key)
+    if entry is None:
+        content, headers = await build()
+        body = json.dumps(jsonable_encoder(content), separators=(",", ":")).encode()
+        entry = await response_cache.set(key, body, headers)
+
+    headers = {**entry["headers"], "ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if entry["etag"] in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")) or if_none_match == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(entry["body"], media_type="application/json", headers=headers)
+
+
 # --- Property Endpoints ---
 
 # Create a property (for agents)
@@ -239,48 +326,125 @@ async def create_property(
     user_id: int,
     property: schemas.PropertyCreate,
     db: db_dependency,
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser
 ):
-    # Decode token and get user data
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Ensure the user exists, is an agent, and matches the user_id in the path
     if db_user is None or db_user.role != "agent" or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized or incorrect user ID")
 
     # Create the property with the agent's ID
-    return crud.create_property(db=db, property=property, agent_id=db_user.id)
+    return await crud_async.create_property(db=db, property=property, agent_id=db_user.id)
+
+
+# Bulk import properties (for agents). The body is streamed as NDJSON (one
+# PropertyCreate object per line) or CSV (Content-Type: text/csv, header row of
+# PropertyCreate fields). Valid rows are inserted in chunks of `chunk_size`;
+# invalid rows are skipped and reported by line number.
+@app.post("/users/{user_id}/properties/import", response_model=schemas.PropertyImportResult)
+async def import_properties(
+    user_id: int,
+    request: Request,
+    db: db_dependency,
+    db_user: CurrentUser,
+    chunk_size: int = bulk_import.IMPORT_CHUNK_SIZE
+):
+    if db_user is None or db_user.role != "agent" or db_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Unauthorized or incorrect user ID")
+    chunk_size = max(1, min(chunk_size, bulk_import.MAX_IMPORT_CHUNK_SIZE))
+
+    if bulk_import.detect_format(request.headers.get("content-type")) == "csv":
+        records = bulk_import.iter_csv(request.stream())
+    else:
+        records = bulk_import.iter_ndjson(request.stream())
+
+    imported, failed, errors = 0, 0, []
+    chunk, chunk_lines = [], []
+
+    def fail(line, messages):
+        nonlocal failed
+        failed += 1
+        if len(errors) < bulk_import.MAX_REPORTED_ERRORS:
+            errors.append(schemas.PropertyImportError(line=line, errors=messages))
+
+    async def flush():
+        nonlocal imported
+        try:
+            imported += await crud_async.bulk_create_properties(db=db, properties=chunk, agent_id=db_user.id)
+        except SQLAlchemyError as exc:
+            for line in chunk_lines:
+                fail(line, [f"database error: {exc.__class__.__name__}"])
+        chunk.clear()
+        chunk_lines.clear()
+
+    async for line, record, error in records:
+        if error is not None:
+            fail(line, [error])
+            continue
+        property, messages = bulk_import.validate(record)
+        if property is None:
+            fail(line, messages)
+            continue
+        chunk.append(property)
+        chunk_lines.append(line)
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+
+    return schemas.PropertyImportResult(imported=imported, failed=failed, errors=errors)
 
 
 # Read a single property by ID
 @app.get("/property/{property_id}", response_model=schemas.Property)
-async def read_property(property_id: int, db: db_dependency):
-    db_property = crud.get_property(db=db, property_id=property_id)
-    if db_property is None:
-        raise HTTPException(status_code=404, detail="Property not found")
-    return db_property
+async def read_property(property_id: int, request: Request, db: db_dependency):
+    async def build():
+        db_property = await crud_async.get_property(db=db, property_id=property_id)
+        if db_property is None:
+            raise HTTPException(status_code=404, detail="Property not found")
+        return schemas.Property.model_validate(db_property), {}
+
+    return await cached_response(request, build)
+
+
+# "Users who favorited this also liked": listings favorited by the same users,
+# precomputed by recommendations.py (empty until the next rebuild)
+@app.get("/property/{property_id}/similar", response_model=List[schemas.Property])
+async def read_similar_properties(property_id: int, request: Request, db: db_dependency, limit: int = 10):
+    async def build():
+        properties = await crud_async.get_similar_properties(db, property_id, limit=limit)
+        if properties is None:
+            raise HTTPException(status_code=404, detail="Property not found")
+        return [schemas.Property.model_validate(p) for p in properties], {}
+
+    return await cached_response(request, build)
 
 
 # Get all properties
+# Pages are fetched with keyset pagination: pass the X-Next-Cursor header of the
+# previous response as `cursor` to get the next page (no header on the last page).
 @app.get("/properties", response_model=List[schemas.Property])
-async def list_properties(skip: int = 0, limit: int = 10, db: db_dependency = Annotated[Session, Depends(get_db)]):
-    return crud.get_all_properties(db=db, skip=skip, limit=limit)
+async def list_properties(
+        request: Request,
+        sort: str = "newest",
+        cursor: str | None = None,
+        limit: int = 10,
+        db: db_dependency = Annotated[Session, Depends(get_db)]
+):
+    async def build():
+        properties, next_cursor = await crud_async.get_all_properties(db=db, sort=sort, cursor=cursor, limit=limit)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        return [schemas.Property.model_validate(p) for p in properties], headers
+
+    return await cached_response(request, build)
 
 
 # Get all properties (for single user(agent))
 @app.get("/users/{user_id}/myproperties", response_model=List[schemas.Property])
 async def list_user_properties(
     user_id: int,  # user_id parameter from the URL (if you still want to keep this for some reason)
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    user: CurrentUser,
+    db: Session = Depends(get_db)
 ):
-    # Verify the token to extract user information
-    payload = verify_token(token)
-    username = payload.get("sub")  # Extract the username from the token
-
-    # Fetch the user based on the username
-    user = crud.get_user(db, username=username)  # Fetch user by username
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -289,7 +453,7 @@ async def list_user_properties(
         raise HTTPException(status_code=403, detail="User ID in the URL does not match the authenticated user")
 
     # Fetch properties for the authenticated user
-    properties = crud.get_properties_by_user(db=db, username=username)  # Use username to fetch properties
+    properties = await crud_async.get_properties_by_agent(db=db, agent_id=user.id)
     return properties
 
 
@@ -297,17 +461,13 @@ async def list_user_properties(
 # Update a property (only for agents who own the property)
 @app.put("/users/{user_id}/property/{property_id}", response_model=schemas.Property)
 async def update_property(user_id: int, property_id: int, property: schemas.PropertyCreate, db: db_dependency,
-                          token: str = Depends(oauth2_scheme)):
-    # Verify token and get user info
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
+                          db_user: CurrentUser):
     # Verify user authorization
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to update this property")
 
     # Check if the property exists
-    db_property = crud.get_property(db=db, property_id=property_id)
+    db_property = await crud_async.get_property(db=db, property_id=property_id)
     if db_property is None:
         raise HTTPException(status_code=404, detail="Property not found")
 
@@ -316,25 +476,21 @@ async def update_property(user_id: int, property_id: int, property: schemas.Prop
         raise HTTPException(status_code=403, detail="Not authorized to update this property")
 
     # Update the property
-    return crud.update_property(db=db, property_id=property_id, property_update=property)
+    return await crud_async.update_property(db=db, property_id=property_id, property_update=property)
 
 @app.delete("/users/{user_id}/property/{property_id}", response_model=dict)
 async def delete_property(
     user_id: int,
     property_id: int,
     db: db_dependency,
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser
 ):
-    # Decode the token to get user information
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Ensure the authenticated user matches the user_id in the path
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
 
     # Retrieve the property to check ownership
-    db_property = crud.get_property(db=db, property_id=property_id)
+    db_property = await crud_async.get_property(db=db, property_id=property_id)
     if db_property is None:
         raise HTTPException(status_code=404, detail="Property not found")
 
@@ -343,85 +499,209 @@ async def delete_property(
         raise HTTPException(status_code=403, detail="Not authorized to delete this property")
 
     # Delete the property
-    crud.delete_property(db=db, property_id=property_id)
+    await crud_async.delete_property(db=db, property_id=property_id)
     return {"message": "Property deleted successfully"}
 
 #all the search parameters are defined as optional parameters (| None = None)
 #If a user includes a parameter in the request URL , that parameter’s value is passed into the function.
 #If a user leaves a parameter out, it defaults to None, meaning that the function will know it wasn’t provided and should ignore it.
+# `q` runs a full-text search over title, description and location; results are
+# ordered by relevance and carry `rank` and a highlighted `headline`.
 @app.get("/properties/search",
-         response_model=List[schemas.Property])
+         response_model=List[schemas.PropertySearchHit])
 async def search_properties(
+        request: Request,
         location: str | None = None,
         min_price: float | None = None,
         max_price: float | None = None,
         property_type: str | None = None,
         bedrooms: int | None = None,
         bathrooms: int | None = None,
+        status: str | None = None,
+        q: str | None = None,
+        sort: str | None = None,
+        cursor: str | None = None,
+        limit: int = 50,
+        lat: float | None = None,
+        lng: float | None = None,
+        radius_km: float | None = None,
+        bbox: str | None = None,
         db: Session = Depends(get_db)
 ):
-    return crud.search_properties(
-        db=db,
+    async def build():
+        properties, next_cursor = await crud_async.search_properties(
+            db=db,
+            location=location,
+            min_price=min_price,
+            max_price=max_price,
+            property_type=property_type,
+            bedrooms=bedrooms,
+            bathrooms=bathrooms,
+            status=status,
+            q=q,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+            lat=lat,
+            lng=lng,
+            radius_km=radius_km,
+            bbox=bbox
+        )
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        return [schemas.PropertySearchHit.model_validate(p) for p in properties], headers
+
+    return await cached_response(request, build)
+
+
+# Counts per property type, status, bedroom count and price band for the same
+# filters as /properties/search, for showing next to the results.
+@app.get("/properties/search/facets", response_model=schemas.PropertyFacets)
+async def search_facets(
+        request: Request,
+        location: str | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        property_type: str | None = None,
+        bedrooms: int | None = None,
+        bathrooms: int | None = None,
+        status: str | None = None,
+        q: str | None = None,
+        lat: float | None = None,
+        lng: float | None = None,
+        radius_km: float | None = None,
+        bbox: str | None = None,
+        db: Session = Depends(get_db)
+):
+    async def build():
+        facets = await crud_async.search_facets(
+            db=db,
+            location=location,
+            min_price=min_price,
+            max_price=max_price,
+            property_type=property_type,
+            bedrooms=bedrooms,
+            bathrooms=bathrooms,
+            status=status,
+            q=q,
+            lat=lat,
+            lng=lng,
+            radius_km=radius_km,
+            bbox=bbox
+        )
+        return schemas.PropertyFacets(**facets), {}
+
+    return await cached_response(request, build)
+
+
+# Export every listing matching the search filters as NDJSON (default) or CSV,
+# streamed row by row; see export.py.
+@app.get("/properties/export")
+async def export_properties(
+        format: str = "ndjson",
+        location: str | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        property_type: str | None = None,
+        bedrooms: int | None = None,
+        bathrooms: int | None = None,
+        status: str | None = None,
+        q: str | None = None,
+        lat: float | None = None,
+        lng: float | None = None,
+        radius_km: float | None = None,
+        bbox: str | None = None
+):
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format '{format}'")
+    rows = export.iter_export(
+        format,
         location=location,
         min_price=min_price,
         max_price=max_price,
         property_type=property_type,
         bedrooms=bedrooms,
-        bathrooms=bathrooms
+        bathrooms=bathrooms,
+        status=status,
+        q=q,
+        lat=lat,
+        lng=lng,
+        radius_km=radius_km,
+        bbox=bbox
     )
+    headers = {"Content-Disposition": f'attachment; filename="properties.{format}"'}
+    return StreamingResponse(rows, media_type=export.MEDIA_TYPES[format], headers=headers)
 
 # --- Image Endpoints ---
 
+# Serve an uploaded image. With `w` (target width in pixels) and/or `format`, the
+# closest generated variant is served instead, in the best format the client's
+# Accept header allows (AVIF, then WebP, then JPEG); the original is the fallback.
+# Supports conditional and Range requests, see file_responses.py.
+@app.api_route("/images/{filename:path}", methods=["GET", "HEAD"])
+async def serve_image(filename: str, request: Request, w: int | None = None, format: str | None = None):
+    images_root = os.path.realpath(storage.IMAGES_DIR)
+    path = os.path.realpath(os.path.join(images_root, filename))
+    if not path.startswith(images_root + os.sep) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    # Anything but the preferred variant (or the original when none was asked for)
+    # is a stand-in until the variants are rendered, so it is not cached as immutable
+    variant_path, preferred = derivatives.negotiate(os.path.basename(path), w, request.headers.get("accept", ""),
+                                                    format)
+    if variant_path is not None:
+        media_type = derivatives.MIME_TYPES[variant_path.rsplit(".", 1)[-1]]
+        return await file_responses.file_response(request, variant_path, media_type, headers={"Vary": "Accept"},
+                                                  fallback=not preferred)
+    return await file_responses.file_response(request, path, headers={"Vary": "Accept"}, fallback=not preferred)
+
+
 # Upload an image for a property (only for agents who own the property)
 @app.post("/users/{user_id}/property/{property_id}/image", response_model=schemas.Image)
 async def upload_image(
     user_id: int,
     property_id: int,
+    db_user: CurrentUser,
+    background_tasks: BackgroundTasks,
     image_file: UploadFile = File(None),  # Allow file or base64
     image_data: str = Form(None),         # Allow base64 data as an alternative
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Ensure authenticated user matches user_id
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to upload images for this user")
 
     # Verify that property exists and user is authorized
-    db_property = crud.get_property(db=db, property_id=property_id)
+    db_property = await crud_async.get_property(db=db, property_id=property_id)
     if db_property is None or db_property.agent_id != db_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to upload images for this property")
 
-    # Determine if image data is uploaded as a file or base64 string
+    # Determine if image data is uploaded as a file or base64 string.
+    # Either way the bytes are streamed to disk in chunks (see storage.py).
     if image_file:
-        # Handle file upload
-        file_extension = image_file.filename.split(".")[-1]
-        new_filename = f"{property_id}_{datetime.now().timestamp()}.{file_extension}"
-        image_path = os.path.join("images", new_filename)
-        with open(image_path, "wb") as file_io:
-            content = await image_file.read()
-            file_io.write(content)
+        file_extension = storage.file_extension(image_file.filename)
+        chunks = storage.iter_upload_file(image_file)
     elif image_data:
-        # Decode base64 and save
         file_extension = "png"  # Adjust extension as needed
-        new_filename = f"{property_id}_{datetime.now().timestamp()}.{file_extension}"
-        image_path = os.path.join("images", new_filename)
-        with open(image_path, "wb") as file_io:
-            image_bytes = base64.b64decode(image_data.split(",")[1])  # Ignore base64 header
-            file_io.write(image_bytes)
+        chunks = storage.iter_base64(image_data)
     else:
         raise HTTPException(status_code=400, detail="No image data provided")
 
+    # Files are named by content hash, so re-uploading the same photo reuses the stored file
+    stored = await storage.save_stream(chunks, file_extension)
+
     # Record the image in the database
-    image_data = schemas.ImageCreate(filename=new_filename, url=image_path)
-    return crud.create_image(db=db, image=image_data, property_id=property_id)
+    image_data = schemas.ImageCreate(filename=os.path.basename(stored.path), url=stored.path)
+    db_image = await crud_async.create_image(db=db, image=image_data, property_id=property_id,
+                                             content_hash=stored.content_hash, size_bytes=stored.size_bytes)
+
+    # Resized/modern-format variants are rendered after the response is sent
+    background_tasks.add_task(derivatives.create_variants, db_image.id, stored.path)
+    return db_image
 
 
 @app.get("/property/{property_id}/image/{image_id}", response_model=schemas.Image)
 async def read_image(property_id: int, image_id: int, db: db_dependency):
-    db_image = crud.get_image(db=db, property_id=property_id, image_id=image_id)
+    db_image = await crud_async.get_image(db=db, property_id=property_id, image_id=image_id)
     if db_image is None:
         raise HTTPException(status_code=404, detail="Image not found or does not belong to this property")
     return db_image  # Includes property_id in the response due to the Pydantic schema
@@ -429,64 +709,61 @@ async def read_image(property_id: int, image_id: int, db: db_dependency):
 
 # Get all images for a property
 @app.get("/property/{property_id}/images", response_model=List[schemas.Image])
-async def list_images_for_property(property_id: int, db: db_dependency):
-    db_property = crud.get_property(db=db, property_id=property_id)
-    if db_property is None:
-        raise HTTPException(status_code=404, detail="Property not found")
+async def list_images_for_property(property_id: int, request: Request, db: db_dependency):
+    async def build():
+        db_property = await crud_async.get_property(db=db, property_id=property_id)
+        if db_property is None:
+            raise HTTPException(status_code=404, detail="Property not found")
 
-    images = crud.get_images_by_property(db=db, property_id=property_id)
+        images = [schemas.Image.model_validate(image) for image in db_property.images]
 
-    # Map the images to their accessible URLs
-    for image in images:
-        image.url = f"/images/{os.path.basename(image.url)}"  # Adjust the URL if necessary
+        # Map the images to their accessible URLs
+        for image in images:
+            image.url = storage.public_url(image.url)
 
-    return images
+        return images, {}
+
+    return await cached_response(request, build)
 
 
 # Delete an image by ID (only for agents who own the property)
 @app.delete("/users/{user_id}/property/{property_id}/image/{image_id}", response_model=dict)
-async def delete_image(user_id: int, property_id: int, image_id: int, db: db_dependency, token: str = Depends(oauth2_scheme)):
-    # Verify token and retrieve user information
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
+async def delete_image(user_id: int, property_id: int, image_id: int, db: db_dependency, db_user: CurrentUser):
     # Check if the user is authorized
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this image")
 
     # Retrieve the image by both image_id and property_id
-    db_image = crud.get_image(db=db, property_id=property_id, image_id=image_id)
+    db_image = await crud_async.get_image(db=db, property_id=property_id, image_id=image_id)
     if db_image is None:
         raise HTTPException(status_code=404, detail="Image not found or does not belong to the specified property")
 
     # Retrieve the property associated with this image
-    db_property = crud.get_property(db=db, property_id=property_id)
+    db_property = await crud_async.get_property(db=db, property_id=property_id)
     if db_property is None or db_property.agent_id != db_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this image")
 
     # Perform the delete operation
-    crud.delete_image(db=db, image_id=image_id)
+    await crud_async.delete_image(db=db, image_id=image_id)
     return {"message": "Image deleted successfully"}
 
 # --- Favorite Endpoints ---
 
+MAX_FAVORITES_BATCH = 500  # property ids per batch or lookup request
+
 @app.post("/users/{user_id}/property/{property_id}/favorites", response_model=schemas.Favorite)
 async def add_favorite(
     user_id: int,
     property_id: int,
-    db: db_dependency = Annotated[Session, Depends(get_db)],
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
 ):
-    # Verify token and get user information
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Ensure the user ID from token matches the user_id in the path
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
 
     # Add the property to favorites
-    return crud.add_favorite(db, user_id, property_id)
+    return await crud_async.add_favorite(db, user_id, property_id)
 
 
 # Remove a favorite property
@@ -494,38 +771,132 @@ async def add_favorite(
 async def remove_favorite(
     user_id: int,
     property_id: int,
-    db: db_dependency = Annotated[Session, Depends(get_db)],
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
 ):
-    # Verify token and get user information
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Ensure the user ID from token matches the user_id in the path
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
 
     # Remove the property from favorites
-    crud.remove_favorite(db, user_id, property_id)
+    await crud_async.remove_favorite(db, user_id, property_id)
     return {"message": "Favorite removed successfully"}
 
+
+# Add, remove and check many favorites in one request
+@app.post("/users/{user_id}/favorites/batch", response_model=schemas.FavoritesBatchResult)
+async def update_favorites(
+    user_id: int,
+    batch: schemas.FavoritesBatch,
+    db_user: CurrentUser,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
+):
+    if db_user is None or db_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
+    if len(batch.add) + len(batch.remove) + len(batch.check) > MAX_FAVORITES_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FAVORITES_BATCH} property ids per batch")
+    if set(batch.add) & set(batch.remove):
+        raise HTTPException(status_code=400, detail="A property cannot be both added and removed")
+
+    return await crud_async.update_favorites(db, user_id, add=batch.add, remove=batch.remove, check=batch.check)
+
+
+# Favorited state of a page of listings (`ids` is comma-separated), e.g. for the grid view
+@app.get("/users/{user_id}/favorites/lookup", response_model=schemas.FavoritesLookup)
+async def lookup_favorites(
+    user_id: int,
+    ids: str,
+    db_user: CurrentUser,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
+):
+    if db_user is None or db_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
+    try:
+        property_ids = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of property ids")
+    if len(property_ids) > MAX_FAVORITES_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FAVORITES_BATCH} property ids per lookup")
+
+    favorited = await crud_async.favorited_property_ids(db, user_id, property_ids) if property_ids else set()
+    return schemas.FavoritesLookup(ids=property_ids,
+                                   bitmap="".join("1" if pid in favorited else "0" for pid in property_ids))
+
 # Get all favorite properties for a user
 @app.get("/users/{user_id}/favorites", response_model=List[schemas.Property])
 async def get_favorites(
     user_id: int,
-    db: db_dependency = Annotated[Session, Depends(get_db)],
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
 ):
-    # Verify token and get user information
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Ensure the user ID from token matches the user_id in the path
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
 
     # Retrieve all favorite properties for the user
-    return crud.get_favorites(db, user_id)
+    return await crud_async.get_favorites(db, user_id)
+
+
+# --- Saved Search Endpoints ---
+
+# Save search criteria; listings created or updated afterwards that match them
+# appear in the user's matches feed
+@app.post("/users/{user_id}/saved-searches", response_model=schemas.SavedSearch)
+async def create_saved_search(
+    user_id: int,
+    saved_search: schemas.SavedSearchCreate,
+    db_user: CurrentUser,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
+):
+    if db_user is None or db_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
+    return await crud_async.create_saved_search(db, user_id, saved_search)
+
+
+@app.get("/users/{user_id}/saved-searches", response_model=List[schemas.SavedSearch])
+async def list_saved_searches(
+    user_id: int,
+    db_user: CurrentUser,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
+):
+    if db_user is None or db_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
+    return await crud_async.get_saved_searches(db, user_id)
+
+
+@app.delete("/users/{user_id}/saved-searches/{saved_search_id}")
+async def delete_saved_search(
+    user_id: int,
+    saved_search_id: int,
+    db_user: CurrentUser,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
+):
+    if db_user is None or db_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
+    if not await crud_async.delete_saved_search(db, user_id, saved_search_id):
+        raise HTTPException(status_code=404, detail="Saved search not found")
+    return {"message": "Saved search deleted successfully"}
+
+
+# New matches for the user's saved searches (or one of them), newest first.
+# Pass the X-Next-Cursor header of the previous response as `cursor` for the next page.
+@app.get("/users/{user_id}/saved-search-matches", response_model=List[schemas.SavedSearchMatch])
+async def list_saved_search_matches(
+    user_id: int,
+    response: Response,
+    db_user: CurrentUser,
+    saved_search_id: int | None = None,
+    cursor: str | None = None,
+    limit: int = 20,
+    db: db_dependency = Annotated[Session, Depends(get_db)]
+):
+    if db_user is None or db_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Unauthorized: Incorrect user ID")
+    matches, next_cursor = await crud_async.get_saved_search_matches(
+        db, user_id, saved_search_id=saved_search_id, cursor=cursor, limit=limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return matches
 
 
 # Endpoint to request a visit for a property
@@ -533,16 +904,37 @@ async def get_favorites(
 async def create_visit_request(
     property_id: int,
     visit_request: schemas.VisitRequestCreate,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser,
+    db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     if db_user is None:
         raise HTTPException(status_code=403, detail="Unauthorized: User not found")
 
-    return crud.create_visit_request(db=db, visit_request=visit_request, user_id=db_user.id)
+    return await crud_async.create_visit_request(db=db, visit_request=visit_request, user_id=db_user.id)
+
+
+# Free visit slots for the next `days` days of several properties at once
+# (`ids` is comma-separated). Slots overlapping an accepted visit of the
+# property's agent are left out.
+@app.get("/properties/availability", response_model=List[schemas.PropertyAvailability])
+async def get_properties_availability(
+    ids: str,
+    days: int = 14,
+    db: Session = Depends(get_db)
+):
+    try:
+        property_ids = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of property ids")
+    if len(property_ids) > scheduling.MAX_AVAILABILITY_PROPERTIES:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {scheduling.MAX_AVAILABILITY_PROPERTIES} property ids per request")
+    if not 1 <= days <= scheduling.MAX_AVAILABILITY_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {scheduling.MAX_AVAILABILITY_DAYS}")
+
+    availability = await crud_async.property_availability(db, property_ids, days) if property_ids else {}
+    return [schemas.PropertyAvailability(property_id=property_id, slots=slots)
+            for property_id, slots in availability.items()]
 
 
 # Endpoint for an agent to list visit requests for their properties
@@ -550,24 +942,20 @@ async def create_visit_request(
 async def list_visit_requests(
     user_id: int,
     property_id: int,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser,
+    db: Session = Depends(get_db)
 ):
-    # Verify and decode the token to get the user payload
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Check if the user is valid and authorized to access this endpoint
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized: Invalid user or access forbidden")
 
     # Fetch the property and confirm the agent is indeed the owner
-    db_property = crud.get_property(db, property_id=property_id)
+    db_property = await crud_async.get_property(db, property_id=property_id)
     if not db_property or db_property.agent_id != db_user.id:
         raise HTTPException(status_code=403, detail="Unauthorized: Property access forbidden")
 
     # Fetch and return all visit requests for this property
-    return crud.get_visit_requests_for_property(db=db, property_id=property_id)
+    return await crud_async.get_visit_requests_for_property(db=db, property_id=property_id)
 
 
 # CRUD function to retrieve visit requests for a specific property
@@ -579,56 +967,115 @@ def get_visit_requests_for_property(db: Session, property_id: int):
 @app.get("/users/{user_id}/visit-requests", response_model=List[schemas.VisitRequestResponse])
 async def list_user_visit_requests(
     user_id: int,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser,
+    db: Session = Depends(get_db)
 ):
-    # Verify the token and fetch user info
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Check if the authenticated user matches the user_id in the URL
     if db_user is None or db_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
     # Fetch the user's visit requests (across all properties)
-    return crud.get_visit_requests_for_user(db=db, user_id=user_id)
+    return await crud_async.get_visit_requests_for_user(db=db, user_id=user_id)
 
+# Pages are newest first; pass the X-Next-Cursor header of the previous response
+# as `cursor` to get the next page (no header on the last page).
 @app.get("/users/{user_id}/agent-visit-requests", response_model=List[schemas.VisitRequestResponse])
 async def list_agent_visit_requests(
     user_id: int,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    response: Response,
+    db_user: CurrentUser,
+    status: schemas.VisitRequestStatus | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+    db: Session = Depends(get_db)
 ):
-    # Verify the user token
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
     # Check if the authenticated user matches the user_id and has an agent role
     if db_user is None or db_user.id != user_id or db_user.role != "agent":
         raise HTTPException(status_code=403, detail="Unauthorized")
 
-    # Fetch all visit requests for properties owned by the agent
-    visit_requests = crud.get_visit_requests_for_agent(db=db, agent_id=user_id)
+    # Fetch one page of visit requests for properties owned by the agent
+    visit_requests, next_cursor = await crud_async.get_visit_requests_for_agent(
+        db=db,
+        agent_id=user_id,
+        status=status,
+        created_after=created_after,
+        created_before=created_before,
+        cursor=cursor,
+        limit=limit
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return visit_requests
 
 
+# Number of visit requests per status, for the agent's inbox tabs
+@app.get("/users/{user_id}/agent-visit-requests/counts", response_model=schemas.VisitRequestCounts)
+async def count_agent_visit_requests(
+    user_id: int,
+    db_user: CurrentUser,
+    db: Session = Depends(get_db)
+):
+    if db_user is None or db_user.id != user_id or db_user.role != "agent":
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return await crud_async.count_visit_requests_for_agent(db=db, agent_id=user_id)
+
+
+# Server-sent event stream of the agent's visit requests, replacing polling of
+# the inbox: a `visit_request.created` or `visit_request.updated` event carries
+# the request as returned by the inbox, `resync` means events were missed and
+# the inbox should be refetched. Browsers' EventSource cannot send headers, so
+# the token may be passed as `access_token` instead. The stream ends when the
+# token expires; reconnect with a fresh one.
+@app.get("/users/{user_id}/agent-visit-requests/events")
+async def stream_agent_visit_requests(
+    user_id: int,
+    request: Request,
+    access_token: str | None = None
+):
+    token = access_token or request.headers.get("Authorization", "").partition(" ")[2]
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    # Short-lived session: the stream itself must not hold a connection
+    async with session_scope() as db:
+        db_user = await get_current_user(request, db, token)
+    if db_user is None or db_user.id != user_id or db_user.role != "agent":
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    # A token without `exp` never expires; such a stream still ends after the access token lifetime
+    expires_at = verify_token(token, request).get("exp") or time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    subscription = events.broker.subscribe(f"agent:{user_id}")
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while (remaining := expires_at - time.time()) > 0:
+                try:
+                    yield await asyncio.wait_for(subscription.get(), min(events.EVENTS_KEEPALIVE_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 # Endpoint for an agent to update the status of a visit request
 @app.put("/visit-request/{request_id}/status", response_model=schemas.VisitRequestResponse)
 async def update_visit_request_status(
     request_id: int,
     status: schemas.VisitRequestStatus,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    db_user: CurrentUser,
+    db: Session = Depends(get_db)
 ):
-    payload = verify_token(token)
-    db_user = crud.get_user(db=db, username=payload.get("sub"))
-
-    db_request = db.query(models.VisitRequest).filter(models.VisitRequest.id == request_id).first()
+    db_request = await crud_async.get_visit_request(db, request_id=request_id)
     if not db_request:
         raise HTTPException(status_code=404, detail="Visit request not found")
 
-    db_property = crud.get_property(db, property_id=db_request.property_id)
+    db_property = await crud_async.get_property(db, property_id=db_request.property_id)
     if db_user is None or (db_user.role != "admin" and db_property.agent_id != db_user.id):
         raise HTTPException(status_code=403, detail="Unauthorized")
 
-    return crud.update_visit_request_status(db, request_id, status)
+    return await crud_async.update_visit_request_status(db, request_id, status)
@@ -0,0 +1,69 @@
+"""
+Maintenance tasks, run from the backend directory:
+
+    python maintenance.py gc-images [--grace-seconds N]
+    python maintenance.py reconcile-counters
+    python maintenance.py rebuild-recommendations [--full]
+"""
+import argparse
+import sys
+
+import crud
+import recommendations
+import storage
+from database import SessionLocal
+
+
+def gc_images(args):
+    db = SessionLocal()
+    try:
+        removed = storage.collect_garbage(db, grace_seconds=args.grace_seconds)
+    finally:
+        db.close()
+    print(f"Removed {removed} unreferenced image file(s)")
+
+
+def reconcile_counters(args):
+    db = SessionLocal()
+    try:
+        corrected = crud.reconcile_property_counters(db)
+    finally:
+        db.close()
+    print(f"Corrected counters on {corrected} propert{'y' if corrected == 1 else 'ies'}")
+
+
+def rebuild_recommendations(args):
+    db = SessionLocal()
+    try:
+        rebuilt = recommendations.rebuild(db, full=args.full)
+    finally:
+        db.close()
+    if rebuilt is None:
+        sys.exit("Another process is rebuilding recommendations; try again later")
+    print(f"Recomputed similar listings for {rebuilt} propert{'y' if rebuilt == 1 else 'ies'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend maintenance tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gc = commands.add_parser("gc-images", help="Delete stored image files no image references any more")
+    gc.add_argument("--grace-seconds", type=int, default=storage.IMAGE_GC_GRACE_SECONDS,
+                    help="Only delete files unreferenced for at least this long")
+    gc.set_defaults(handler=gc_images)
+
+    reconcile = commands.add_parser("reconcile-counters",
+                                    help="Recompute property favorite and pending visit counters")
+    reconcile.set_defaults(handler=reconcile_counters)
+
+    rebuild = commands.add_parser("rebuild-recommendations",
+                                  help="Recompute similar listings for properties whose favorites changed")
+    rebuild.add_argument("--full", action="store_true", help="Recompute every property instead")
+    rebuild.set_defaults(handler=rebuild_recommendations)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
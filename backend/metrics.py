@@ -0,0 +1,92 @@
+import bisect
+import threading
+
+# Minimal in-process metrics registry, served as JSON by GET /metrics.
+# Values are per worker process.
+
+_registry = {}
+_lock = threading.Lock()
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self, description: str):
+        self.description = description
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """Reports the current value of a callable when read."""
+
+    def __init__(self, description: str, read):
+        self.description = description
+        self._read = read
+
+    def snapshot(self):
+        return self._read()
+
+
+class Histogram:
+    def __init__(self, description: str, buckets=DEFAULT_BUCKETS):
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                buckets[f"le_{bound}"] = cumulative
+            buckets["le_inf"] = self.count
+            return {
+                "count": self.count,
+                "sum": round(self.sum, 6),
+                "avg": round(self.sum / self.count, 6) if self.count else 0.0,
+                "max": round(self.max, 6),
+                "buckets": buckets,
+            }
+
+
+def _register(name: str, metric):
+    with _lock:
+        return _registry.setdefault(name, metric)
+
+
+def counter(name: str, description: str) -> Counter:
+    return _register(name, Counter(description))
+
+
+def gauge(name: str, description: str, read) -> Gauge:
+    return _register(name, Gauge(description, read))
+
+
+def histogram(name: str, description: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(name, Histogram(description, buckets))
+
+
+def snapshot() -> dict:
+    with _lock:
+        metrics = dict(_registry)
+    return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
@@ -0,0 +1,96 @@
+"""initial schema
+
+Matches the tables previously created by Base.metadata.create_all() at
+startup. Databases created that way can be adopted with `alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String()),
+        sa.Column("hashed_password", sa.String()),
+        sa.Column("name", sa.String()),
+        sa.Column("surname", sa.String()),
+        sa.Column("role", sa.String()),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    op.create_table(
+        "properties",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String()),
+        sa.Column("description", sa.String()),
+        sa.Column("price", sa.Float()),
+        sa.Column("location", sa.String()),
+        sa.Column("property_type", sa.Enum("house", "apartment", name="propertytype")),
+        sa.Column("bedrooms", sa.Integer()),
+        sa.Column("bathrooms", sa.Integer()),
+        sa.Column("size", sa.Float()),
+        sa.Column("status", sa.Enum("available", "sold", name="listingstatus")),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("agent_id", sa.Integer(), sa.ForeignKey("users.id")),
+    )
+    op.create_index("ix_properties_id", "properties", ["id"])
+    op.create_index("ix_properties_title", "properties", ["title"])
+    op.create_index("ix_properties_property_type", "properties", ["property_type"])
+
+    op.create_table(
+        "images",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("url", sa.String()),
+        sa.Column("upload_date", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("property_id", sa.Integer(), sa.ForeignKey("properties.id")),
+    )
+    op.create_index("ix_images_id", "images", ["id"])
+
+    op.create_table(
+        "favorites",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("property_id", sa.Integer(), sa.ForeignKey("properties.id")),
+        sa.UniqueConstraint("user_id", "property_id", name="unique_favorite"),
+    )
+    op.create_index("ix_favorites_user_id", "favorites", ["user_id"])
+    op.create_index("ix_favorites_property_id", "favorites", ["property_id"])
+
+    op.create_table(
+        "visit_requests",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("property_id", sa.Integer(), sa.ForeignKey("properties.id"), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("message", sa.Text(), nullable=True),
+        sa.Column("visit_date", sa.DateTime(), nullable=False),
+        sa.Column("visit_time", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("status", sa.Enum("pending", "accepted", "declined", name="visitrequeststatus")),
+    )
+    op.create_index("ix_visit_requests_id", "visit_requests", ["id"])
+
+
+def downgrade():
+    op.drop_table("visit_requests")
+    op.drop_table("favorites")
+    op.drop_table("images")
+    op.drop_table("properties")
+    op.drop_table("users")
+    sa.Enum(name="visitrequeststatus").drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name="listingstatus").drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name="propertytype").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,49 @@
+"""property search indexes
+
+Composite B-tree indexes for the equality/range filters and keyset sort
+orders used by crud.search_properties and crud.paginate_properties, plus
+pg_trgm GIN indexes so `ILIKE '%x%'` on location and title can use an index
+on PostgreSQL. Other databases get plain B-tree indexes for those columns.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    is_postgres = op.get_bind().dialect.name == "postgresql"
+
+    # SQLite stored the old server default as 'YYYY-MM-DD HH:MM:SS', while keyset
+    # cursors bind 'YYYY-MM-DD HH:MM:SS.ffffff' and the two compare as text
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("UPDATE properties SET created_at = created_at || '.000000' WHERE length(created_at) = 19")
+
+    op.create_index("ix_properties_type_status_price_bedrooms", "properties",
+                    ["property_type", "status", "price", "bedrooms"])
+    op.create_index("ix_properties_price_id", "properties", ["price", "id"])
+    op.create_index("ix_properties_created_at_id", "properties", ["created_at", "id"])
+
+    if is_postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index("ix_properties_location_trgm", "properties", ["location"],
+                    postgresql_using="gin", postgresql_ops={"location": "gin_trgm_ops"})
+    op.create_index("ix_properties_title_trgm", "properties", ["title"],
+                    postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"})
+
+
+def downgrade():
+    op.drop_index("ix_properties_title_trgm", table_name="properties")
+    op.drop_index("ix_properties_location_trgm", table_name="properties")
+    op.drop_index("ix_properties_created_at_id", table_name="properties")
+    op.drop_index("ix_properties_price_id", table_name="properties")
+    op.drop_index("ix_properties_type_status_price_bedrooms", table_name="properties")
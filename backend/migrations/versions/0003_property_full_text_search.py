@@ -0,0 +1,53 @@
+"""property full-text search
+
+Adds Property.search_vector (tsvector on PostgreSQL) with a GIN index and
+backfills it for existing rows. See search.py.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("properties", sa.Column("search_vector", sa.Text().with_variant(TSVECTOR(), "postgresql"),
+                                          nullable=True))
+    op.create_index("ix_properties_search_vector", "properties", ["search_vector"], postgresql_using="gin")
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "UPDATE properties SET search_vector = "
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(location, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+        )
+    else:
+        # Same normalization as search.search_vector() for non-PostgreSQL databases
+        import search
+
+        connection = op.get_bind()
+        properties = sa.table("properties", sa.column("id"), sa.column("title"), sa.column("description"),
+                              sa.column("location"), sa.column("search_vector"))
+        rows = connection.execute(sa.select(properties.c.id, properties.c.title, properties.c.location,
+                                            properties.c.description)).all()
+        for row in rows:
+            document = " ".join(search.tokenize(row.title) + search.tokenize(row.location)
+                                + search.tokenize(row.description))
+            connection.execute(properties.update().where(properties.c.id == row.id)
+                               .values(search_vector=document))
+
+
+def downgrade():
+    op.drop_index("ix_properties_search_vector", table_name="properties")
+    op.drop_column("properties", "search_vector")
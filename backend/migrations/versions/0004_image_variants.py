@@ -0,0 +1,37 @@
+"""image variants
+
+Resized and re-encoded copies of uploaded images, see derivatives.py.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "image_variants",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("image_id", sa.Integer(), sa.ForeignKey("images.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("width", sa.Integer(), nullable=False),
+        sa.Column("format", sa.String(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("size_bytes", sa.Integer()),
+        sa.UniqueConstraint("image_id", "width", "format", name="unique_image_variant"),
+    )
+    op.create_index("ix_image_variants_id", "image_variants", ["id"])
+    op.create_index("ix_image_variants_image_id", "image_variants", ["image_id"])
+
+
+def downgrade():
+    op.drop_table("image_variants")
@@ -0,0 +1,46 @@
+"""content-addressed image blobs
+
+Stored image files keyed by SHA-256 with a reference count, see storage.py.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "image_blobs",
+        sa.Column("content_hash", sa.String(64), primary_key=True),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("size_bytes", sa.Integer()),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index(
+        "ix_image_blobs_unreferenced", "image_blobs", ["updated_at"],
+        postgresql_where=sa.text("ref_count <= 0"),
+    )
+    with op.batch_alter_table("images") as batch_op:
+        batch_op.add_column(sa.Column("content_hash", sa.String(64), nullable=True))
+        batch_op.create_foreign_key("fk_images_content_hash", "image_blobs", ["content_hash"], ["content_hash"])
+        batch_op.create_index("ix_images_content_hash", ["content_hash"])
+
+
+def downgrade():
+    with op.batch_alter_table("images") as batch_op:
+        batch_op.drop_index("ix_images_content_hash")
+        batch_op.drop_constraint("fk_images_content_hash", type_="foreignkey")
+        batch_op.drop_column("content_hash")
+    op.drop_table("image_blobs")
@@ -0,0 +1,34 @@
+"""property coordinates
+
+Latitude/longitude and an indexed geohash for geo search, see geo.py.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("properties", sa.Column("latitude", sa.Float(), nullable=True))
+    op.add_column("properties", sa.Column("longitude", sa.Float(), nullable=True))
+    op.add_column("properties", sa.Column("geohash", sa.String(12).with_variant(sa.String(12, collation="C"),
+                                                                                "postgresql"), nullable=True))
+    op.create_index("ix_properties_geohash", "properties", ["geohash"])
+
+
+def downgrade():
+    op.drop_index("ix_properties_geohash", table_name="properties")
+    with op.batch_alter_table("properties") as batch_op:
+        batch_op.drop_column("geohash")
+        batch_op.drop_column("longitude")
+        batch_op.drop_column("latitude")
@@ -0,0 +1,38 @@
+"""property counters
+
+Denormalized favorites and pending visit request counts per property.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("properties", sa.Column("favorites_count", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("properties", sa.Column("pending_visits_count", sa.Integer(), nullable=False,
+                                          server_default="0"))
+    op.execute(
+        "UPDATE properties SET "
+        "favorites_count = (SELECT count(*) FROM favorites WHERE favorites.property_id = properties.id), "
+        "pending_visits_count = (SELECT count(*) FROM visit_requests "
+        "WHERE visit_requests.property_id = properties.id AND visit_requests.status = 'pending')"
+    )
+    op.create_index("ix_properties_favorites_count_id", "properties", ["favorites_count", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_properties_favorites_count_id", table_name="properties")
+    with op.batch_alter_table("properties") as batch_op:
+        batch_op.drop_column("pending_visits_count")
+        batch_op.drop_column("favorites_count")
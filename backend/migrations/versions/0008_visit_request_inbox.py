@@ -0,0 +1,46 @@
+"""visit request inbox
+
+Copies the property's agent onto visit requests and adds the indexes behind
+the paginated agent inbox, plus an index on properties.agent_id.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("visit_requests") as batch_op:
+        batch_op.add_column(sa.Column("agent_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key("fk_visit_requests_agent_id", "users", ["agent_id"], ["id"])
+    op.execute(
+        "UPDATE visit_requests SET agent_id = "
+        "(SELECT properties.agent_id FROM properties WHERE properties.id = visit_requests.property_id)"
+    )
+    op.create_index("ix_visit_requests_agent_status_created", "visit_requests",
+                    ["agent_id", "status", "created_at", "id"])
+    op.create_index("ix_visit_requests_agent_created", "visit_requests", ["agent_id", "created_at", "id"])
+    op.create_index("ix_visit_requests_property_created", "visit_requests", ["property_id", "created_at"])
+    op.create_index("ix_visit_requests_user_created", "visit_requests", ["user_id", "created_at"])
+    op.create_index("ix_properties_agent_id", "properties", ["agent_id"])
+
+
+def downgrade():
+    op.drop_index("ix_properties_agent_id", table_name="properties")
+    op.drop_index("ix_visit_requests_user_created", table_name="visit_requests")
+    op.drop_index("ix_visit_requests_property_created", table_name="visit_requests")
+    op.drop_index("ix_visit_requests_agent_created", table_name="visit_requests")
+    op.drop_index("ix_visit_requests_agent_status_created", table_name="visit_requests")
+    with op.batch_alter_table("visit_requests") as batch_op:
+        batch_op.drop_constraint("fk_visit_requests_agent_id", type_="foreignkey")
+        batch_op.drop_column("agent_id")
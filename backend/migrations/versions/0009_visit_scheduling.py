@@ -0,0 +1,27 @@
+"""visit scheduling
+
+Adds the index behind visit conflict checks and availability: accepted visits
+by agent and start time.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_visit_requests_agent_status_visit_time", "visit_requests",
+                    ["agent_id", "status", "visit_time"])
+
+
+def downgrade():
+    op.drop_index("ix_visit_requests_agent_status_visit_time", table_name="visit_requests")
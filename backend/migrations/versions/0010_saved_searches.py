@@ -0,0 +1,55 @@
+"""saved searches
+
+Saved search criteria per user and the listings that matched them.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "saved_searches",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("location", sa.String(), nullable=True),
+        sa.Column("min_price", sa.Float(), nullable=True),
+        sa.Column("max_price", sa.Float(), nullable=True),
+        sa.Column("property_type", sa.String(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("bedrooms", sa.Integer(), nullable=True),
+        sa.Column("bathrooms", sa.Integer(), nullable=True),
+        sa.Column("match_type", sa.String(), nullable=False),
+    )
+    op.create_index("ix_saved_searches_user_id", "saved_searches", ["user_id"])
+    op.create_index("ix_saved_searches_match", "saved_searches", ["match_type", "max_price"])
+    op.create_table(
+        "saved_search_matches",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("saved_search_id", sa.Integer(), sa.ForeignKey("saved_searches.id", ondelete="CASCADE"),
+                  nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("property_id", sa.Integer(), sa.ForeignKey("properties.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("saved_search_id", "property_id", name="unique_saved_search_match"),
+    )
+    op.create_index("ix_saved_search_matches_property_id", "saved_search_matches", ["property_id"])
+    op.create_index("ix_saved_search_matches_user_created", "saved_search_matches", ["user_id", "created_at", "id"])
+
+
+def downgrade():
+    op.drop_table("saved_search_matches")
+    op.drop_table("saved_searches")
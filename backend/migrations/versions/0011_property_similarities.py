@@ -0,0 +1,49 @@
+"""property similarities
+
+Top-K similar listings per property computed from favorites, and the queue of
+listings to recompute.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "property_similarities",
+        sa.Column("property_id", sa.Integer(), sa.ForeignKey("properties.id", ondelete="CASCADE"),
+                  primary_key=True),
+        sa.Column("similar_property_id", sa.Integer(), sa.ForeignKey("properties.id", ondelete="CASCADE"),
+                  primary_key=True),
+        sa.Column("score", sa.Float(), nullable=False),
+    )
+    op.create_index("ix_property_similarities_similar_property_id", "property_similarities",
+                    ["similar_property_id"])
+    op.create_index("ix_property_similarities_property_score", "property_similarities", ["property_id", "score"])
+    op.create_table(
+        "property_similarity_queue",
+        sa.Column("property_id", sa.Integer(), sa.ForeignKey("properties.id", ondelete="CASCADE"),
+                  primary_key=True, autoincrement=False),
+        sa.Column("queued_at", sa.DateTime(), nullable=False),
+    )
+    # Compute everything already favorited on the next rebuild
+    op.execute(
+        "INSERT INTO property_similarity_queue (property_id, queued_at) "
+        "SELECT DISTINCT property_id, '1970-01-01 00:00:00' FROM favorites WHERE property_id IS NOT NULL"
+    )
+
+
+def downgrade():
+    op.drop_table("property_similarity_queue")
+    op.drop_table("property_similarities")
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, UniqueConstraint, Text
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, UniqueConstraint, Text, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -35,7 +36,8 @@ class User(Base):
     # Relationship with favorite properties (one-to-many)
     favorites = relationship("Favorite", back_populates="user", cascade="all, delete-orphan")
 
-    visit_requests = relationship("VisitRequest", back_populates="user", cascade="all, delete-orphan")
+    visit_requests = relationship("VisitRequest", back_populates="user", cascade="all, delete-orphan",
+                                  foreign_keys="VisitRequest.user_id")
 
 # Property model
 class Property(Base):
@@ -51,9 +53,26 @@ class Property(Base):
     bathrooms = Column(Integer)
     size = Column(Float)
     status = Column(Enum(ListingStatus), default=ListingStatus.available)  # Use Python Enum
-    created_at = Column(DateTime, server_default=func.now())
+    # Set in Python so every row, on SQLite too, is stored in the format keyset
+    # cursors bind (crud.paginate_properties); the server default covers raw SQL inserts
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+
+    # Coordinates and their geohash, indexed for radius/bounding-box search (see geo.py).
+    # The geohash uses byte-order collation on PostgreSQL so prefix ranges follow the index.
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12).with_variant(String(12, collation="C"), "postgresql"), nullable=True, index=True)
+
+    # Denormalized counters maintained by crud alongside favorites and visit
+    # requests; maintenance.py reconcile-counters recomputes them
+    favorites_count = Column(Integer, nullable=False, default=0, server_default="0")
+    pending_visits_count = Column(Integer, nullable=False, default=0, server_default="0")
 
-    agent_id = Column(Integer, ForeignKey("users.id"))
+    # Full-text document over title, location and description, written by crud (see search.py).
+    # tsvector on PostgreSQL, normalized token string elsewhere.
+    search_vector = Column(Text().with_variant(TSVECTOR(), "postgresql"), nullable=True)
+
+    agent_id = Column(Integer, ForeignKey("users.id"), index=True)
     agent = relationship("User", back_populates="properties")
 
     # Relationship with images (one-to-many)
@@ -64,6 +83,20 @@ class Property(Base):
 
     visit_requests = relationship("VisitRequest", back_populates="property", cascade="all, delete-orphan")
 
+    # Indexes backing /properties/search and keyset pagination (see migrations/versions/0002)
+    __table_args__ = (
+        Index("ix_properties_type_status_price_bedrooms", "property_type", "status", "price", "bedrooms"),
+        Index("ix_properties_price_id", "price", "id"),
+        Index("ix_properties_created_at_id", "created_at", "id"),
+        Index("ix_properties_favorites_count_id", "favorites_count", "id"),
+        # Trigram GIN indexes serve ILIKE '%x%' on PostgreSQL (requires pg_trgm)
+        Index("ix_properties_location_trgm", "location",
+              postgresql_using="gin", postgresql_ops={"location": "gin_trgm_ops"}),
+        Index("ix_properties_title_trgm", "title",
+              postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+        Index("ix_properties_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
 # Image model
 class Image(Base):
     __tablename__ = "images"
@@ -72,12 +105,48 @@ class Image(Base):
     url = Column(String)
     upload_date = Column(DateTime, server_default=func.now())
 
+    # SHA-256 of the stored file, see storage.py (NULL for legacy uploads)
+    content_hash = Column(String(64), ForeignKey("image_blobs.content_hash", name="fk_images_content_hash"), index=True)
+
     # Foreign key to associate with property
     property_id = Column(Integer, ForeignKey("properties.id"))
 
     # Relationship with the property (many-to-one)
     property = relationship("Property", back_populates="images")
 
+    # Resized/re-encoded copies (one-to-many), see derivatives.py
+    variants = relationship("ImageVariant", back_populates="image", cascade="all, delete-orphan")
+
+
+# Stored image file, shared by every image with the same content
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+
+    content_hash = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)
+    size_bytes = Column(Integer)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index('ix_image_blobs_unreferenced', 'updated_at', postgresql_where=ref_count <= 0),)
+
+
+# Image variant model (a resized copy of an image in one format)
+class ImageVariant(Base):
+    __tablename__ = "image_variants"
+
+    id = Column(Integer, primary_key=True, index=True)
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), nullable=False, index=True)
+    width = Column(Integer, nullable=False)
+    format = Column(String, nullable=False)  # file extension: 'avif', 'webp', 'jpg'
+    url = Column(String, nullable=False)
+    size_bytes = Column(Integer)
+
+    __table_args__ = (UniqueConstraint('image_id', 'width', 'format', name='unique_image_variant'),)
+
+    image = relationship("Image", back_populates="variants")
+
 
 # Favorite model
 class Favorite(Base):
@@ -113,6 +182,84 @@ class VisitRequest(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     status = Column(Enum(VisitRequestStatus), default=VisitRequestStatus.pending)  # New status field
 
+    # Owner of the property, copied at creation so the agent inbox is served by one index
+    agent_id = Column(Integer, ForeignKey("users.id", name="fk_visit_requests_agent_id"), nullable=True)
+
     # Relationships
     property = relationship("Property", back_populates="visit_requests")
-    user = relationship("User", back_populates="visit_requests")
\ No newline at end of file
+    user = relationship("User", back_populates="visit_requests", foreign_keys=[user_id])
+
+    # Agent inbox (newest first, optionally by status) and per-status counts,
+    # scheduling conflicts and availability (accepted visits by time), the
+    # property and user listings
+    __table_args__ = (
+        Index("ix_visit_requests_agent_status_created", "agent_id", "status", "created_at", "id"),
+        Index("ix_visit_requests_agent_created", "agent_id", "created_at", "id"),
+        Index("ix_visit_requests_agent_status_visit_time", "agent_id", "status", "visit_time"),
+        Index("ix_visit_requests_property_created", "property_id", "created_at"),
+        Index("ix_visit_requests_user_created", "user_id", "created_at"),
+    )
+
+
+# Search criteria a user wants to be told about new listings for (see crud.match_saved_searches)
+class SavedSearch(Base):
+    __tablename__ = "saved_searches"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    name = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Criteria as for /properties/search; NULL means "any"
+    location = Column(String, nullable=True)
+    min_price = Column(Float, nullable=True)
+    max_price = Column(Float, nullable=True)
+    property_type = Column(String, nullable=True)  # PropertyType name
+    status = Column(String, nullable=True)  # ListingStatus name
+    bedrooms = Column(Integer, nullable=True)
+    bathrooms = Column(Integer, nullable=True)
+
+    # property_type without NULLs ("*" for any type), so that with max_price the
+    # searches a listing can match are found by a range scan
+    match_type = Column(String, nullable=False)
+
+    __table_args__ = (Index("ix_saved_searches_match", "match_type", "max_price"),)
+
+
+# A listing that matched a saved search when it was created or updated (the user's feed)
+class SavedSearchMatch(Base):
+    __tablename__ = "saved_search_matches"
+
+    id = Column(Integer, primary_key=True)
+    saved_search_id = Column(Integer, ForeignKey("saved_searches.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    property_id = Column(Integer, ForeignKey("properties.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False)
+
+    property = relationship("Property")
+
+    __table_args__ = (
+        UniqueConstraint("saved_search_id", "property_id", name="unique_saved_search_match"),
+        Index("ix_saved_search_matches_user_created", "user_id", "created_at", "id"),
+    )
+
+
+# Precomputed "similar listings" from favorites: the top-K per property, see recommendations.py
+class PropertySimilarity(Base):
+    __tablename__ = "property_similarities"
+
+    property_id = Column(Integer, ForeignKey("properties.id", ondelete="CASCADE"), primary_key=True)
+    similar_property_id = Column(Integer, ForeignKey("properties.id", ondelete="CASCADE"), primary_key=True,
+                                 index=True)
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_property_similarities_property_score", "property_id", "score"),)
+
+
+# Listings whose favorites changed since their similarities were last computed
+class PropertySimilarityQueue(Base):
+    __tablename__ = "property_similarity_queue"
+
+    property_id = Column(Integer, ForeignKey("properties.id", ondelete="CASCADE"), primary_key=True,
+                         autoincrement=False)
+    queued_at = Column(DateTime, nullable=False)
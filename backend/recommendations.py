@@ -0,0 +1,203 @@
+import asyncio
+import itertools
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import models
+from database import SessionLocal
+
+# "Similar listings" from favorites (item-item collaborative filtering).
+#
+# Favorites form a sparse user x property matrix. Two listings are similar when
+# the same users favorite both; their score is the cosine similarity of their
+# columns, |fans(a) & fans(b)| / sqrt(|fans(a)| * |fans(b)|), computed for a
+# batch of listings at once as one sparse matrix product (SciPy). The best
+# RECOMMENDATIONS_TOP_K of each listing are stored in property_similarities,
+# so serving them is a single index range scan.
+#
+# Adding or removing a favorite queues the listing (crud.queue_similarity_rebuild).
+# rebuild() then recomputes only the rows that can have changed: the queued
+# listings, the listings sharing a fan with them and the listings that had them
+# among their top-K. It runs every RECOMMENDATIONS_REBUILD_SECONDS in each
+# worker (0 disables the loop) and from `python maintenance.py rebuild-recommendations`.
+# On PostgreSQL a session advisory lock lets one rebuild run at a time; the
+# others skip their turn, as concurrent ones would rewrite the same rows.
+# NumPy and SciPy are optional; without them no recommendations are built.
+
+RECOMMENDATIONS_TOP_K = int(os.getenv("RECOMMENDATIONS_TOP_K", "20"))
+RECOMMENDATIONS_REBUILD_SECONDS = float(os.getenv("RECOMMENDATIONS_REBUILD_SECONDS", "300"))
+REBUILD_BATCH_SIZE = 500
+REBUILD_LOCK_KEY = 7_465_301  # pg_try_advisory_lock key, unique to this job
+
+logger = logging.getLogger(__name__)
+
+_rebuild_task = None
+
+
+def _stale_listings(started: datetime):
+    queue = models.PropertySimilarityQueue
+    return select(queue.property_id).where(queue.queued_at <= started)
+
+
+def _affected_listings(db: Session, started: datetime) -> set[int]:
+    favorite, similarity = models.Favorite, models.PropertySimilarity
+    stale = _stale_listings(started)
+    fans = select(favorite.user_id).where(favorite.property_id.in_(stale))
+    affected = {pid for (pid,) in db.execute(stale)}
+    affected.update(pid for (pid,) in db.execute(
+        select(favorite.property_id).where(favorite.user_id.in_(fans)).distinct()))
+    affected.update(pid for (pid,) in db.execute(
+        select(similarity.property_id).where(similarity.similar_property_id.in_(stale)).distinct()))
+    return affected
+
+
+def _all_listings(db: Session) -> set[int]:
+    listings = {pid for (pid,) in db.execute(select(models.Favorite.property_id).distinct())}
+    listings.update(pid for (pid,) in db.execute(select(models.PropertySimilarity.property_id).distinct()))
+    listings.update(pid for (pid,) in db.execute(select(models.PropertySimilarityQueue.property_id)))
+    return listings
+
+
+class FavoritesMatrix:
+    """
+    Sparse user x listing matrix of favorites with each column scaled to unit
+    length, so that products of columns are cosine similarities.
+    """
+
+    def __init__(self, db: Session, property_ids: list[int] | None = None):
+        import numpy as np
+        from scipy import sparse
+
+        favorite = models.Favorite
+        pairs = select(favorite.user_id, favorite.property_id).where(favorite.property_id.isnot(None))
+        counts = select(favorite.property_id, func.count()).group_by(favorite.property_id)
+        if property_ids is not None:
+            # Every favorite of every user who favorited one of the listings:
+            # their complete columns, and the rows of their co-favorited listings
+            fans = select(favorite.user_id).where(favorite.property_id.in_(property_ids))
+            pairs = pairs.where(favorite.user_id.in_(fans))
+            # Column lengths count each listing's fans among all users, not just these
+            counts = counts.where(favorite.property_id.in_(
+                select(favorite.property_id).where(favorite.user_id.in_(fans))))
+        # Core rows straight into an array: no ORM row processing for what can be millions of pairs
+        connection = db.connection()
+        rows = np.fromiter(itertools.chain.from_iterable(connection.execute(pairs)), dtype=np.int64).reshape(-1, 2)
+        user_ids, user_codes = np.unique(rows[:, 0], return_inverse=True)
+        self.listing_ids, listing_codes = np.unique(rows[:, 1], return_inverse=True)
+
+        fan_counts = dict(connection.execute(counts).fetchall())
+        lengths = np.sqrt(np.array([fan_counts[pid] for pid in self.listing_ids.tolist()], dtype=np.float64))
+        self.matrix = sparse.csc_matrix((1 / lengths[listing_codes], (user_codes, listing_codes)),
+                                        shape=(len(user_ids), len(self.listing_ids)))
+
+    def top_similar(self, property_ids: list[int]) -> dict[int, list[tuple[int, float]]]:
+        """The RECOMMENDATIONS_TOP_K most similar listings of each property, best first."""
+        import numpy as np
+
+        known = sorted(set(property_ids) & set(self.listing_ids.tolist()))
+        if not known:
+            return {}
+        targets = np.searchsorted(self.listing_ids, known)
+        scores = (self.matrix[:, targets].T @ self.matrix).tocsr()
+
+        result = {}
+        for row, target in enumerate(targets):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            columns, values = scores.indices[start:end], scores.data[start:end]
+            keep = columns != target
+            columns, values = columns[keep], values[keep]
+            if len(values) > RECOMMENDATIONS_TOP_K:
+                best = np.argpartition(-values, RECOMMENDATIONS_TOP_K)[:RECOMMENDATIONS_TOP_K]
+                columns, values = columns[best], values[best]
+            order = np.lexsort((self.listing_ids[columns], -values))
+            result[int(self.listing_ids[target])] = list(zip(self.listing_ids[columns[order]].tolist(),
+                                                             values[order].tolist()))
+        return result
+
+
+def rebuild(db: Session, full: bool = False) -> int | None:
+    """
+    Recompute the similarity rows of queued listings and those affected by
+    them (every listing with full=True) and commit. Returns the number of
+    listings recomputed, or None when another process is already rebuilding.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return _rebuild(db, full)  # SQLite runs one writer at a time anyway
+    # The lock belongs to a connection of its own: the session's connection
+    # goes back to the pool at each batch commit
+    with db.get_bind().connect() as lock_connection:
+        if not lock_connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": REBUILD_LOCK_KEY}):
+            return None
+        try:
+            return _rebuild(db, full)
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": REBUILD_LOCK_KEY})
+
+
+def _rebuild(db: Session, full: bool) -> int:
+    started = datetime.utcnow()
+    affected = _all_listings(db) if full else _affected_listings(db, started)
+    listings = sorted(pid for pid in affected if pid is not None)
+    if not listings:
+        return 0
+    favorites = FavoritesMatrix(db, None if full else listings)
+
+    similarity, queue = models.PropertySimilarity, models.PropertySimilarityQueue
+    for offset in range(0, len(listings), REBUILD_BATCH_SIZE):
+        batch = listings[offset:offset + REBUILD_BATCH_SIZE]
+        similar = favorites.top_similar(batch)
+        db.execute(delete(similarity).where(similarity.property_id.in_(batch)))
+        rows = [{"property_id": property_id, "similar_property_id": similar_id, "score": score}
+                for property_id, ranked in similar.items() for similar_id, score in ranked]
+        if rows:
+            db.execute(insert(similarity.__table__), rows)
+        # Listings queued again while this ran stay queued
+        db.execute(delete(queue).where(queue.property_id.in_(batch), queue.queued_at <= started))
+        db.commit()
+
+    from cache import response_cache
+    response_cache.invalidate()
+    return len(listings)
+
+
+def _rebuild_pending() -> int | None:
+    db = SessionLocal()
+    try:
+        return rebuild(db)
+    finally:
+        db.close()
+
+
+async def _rebuild_loop():
+    while True:
+        await asyncio.sleep(RECOMMENDATIONS_REBUILD_SECONDS)
+        try:
+            rebuilt = await run_in_threadpool(_rebuild_pending)
+            if rebuilt:
+                logger.info("Rebuilt recommendations for %s listing(s)", rebuilt)
+        except Exception:
+            logger.exception("Could not rebuild recommendations")
+
+
+def start():
+    global _rebuild_task
+    try:
+        import numpy  # noqa: F401
+        import scipy  # noqa: F401
+    except ImportError:
+        logger.info("NumPy/SciPy are not installed; recommendations will not be built")
+        return
+    if RECOMMENDATIONS_REBUILD_SECONDS > 0 and _rebuild_task is None:
+        _rebuild_task = asyncio.get_running_loop().create_task(_rebuild_loop())
+
+
+def stop():
+    global _rebuild_task
+    if _rebuild_task is not None:
+        _rebuild_task.cancel()
+        _rebuild_task = None
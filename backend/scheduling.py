@@ -0,0 +1,76 @@
+import bisect
+import itertools
+import os
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# Visit scheduling.
+#
+# A visit starts at its visit_time and lasts VISIT_DURATION_MINUTES. An agent can
+# only be at one visit at a time, so accepted visits block the agent across all
+# of their listings: a visit request may not overlap an accepted visit, and a
+# request cannot be accepted while it overlaps another accepted one.
+#
+# Free slots start every VISIT_SLOT_MINUTES between VISIT_DAY_START and
+# VISIT_DAY_END, wall-clock time in VISIT_TIMEZONE; timestamps are stored as
+# naive UTC like every other column. Availability for many properties is
+# computed from one query for the accepted visits of all their agents in the
+# window (crud.property_availability), each agent's visits held in an
+# IntervalIndex that answers overlap checks by bisection.
+
+VISIT_DURATION_MINUTES = int(os.getenv("VISIT_DURATION_MINUTES", "30"))
+VISIT_SLOT_MINUTES = int(os.getenv("VISIT_SLOT_MINUTES", "30"))
+VISIT_DAY_START = time.fromisoformat(os.getenv("VISIT_DAY_START", "09:00"))
+VISIT_DAY_END = time.fromisoformat(os.getenv("VISIT_DAY_END", "18:00"))
+VISIT_TIMEZONE = ZoneInfo(os.getenv("VISIT_TIMEZONE", "UTC"))
+MAX_AVAILABILITY_DAYS = 31
+MAX_AVAILABILITY_PROPERTIES = 500
+
+VISIT_DURATION = timedelta(minutes=VISIT_DURATION_MINUTES)
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Timezone-aware datetimes are converted to UTC; naive ones are taken to be UTC already."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def visit_interval(visit_time: datetime) -> tuple[datetime, datetime]:
+    start = to_utc_naive(visit_time)
+    return start, start + VISIT_DURATION
+
+
+class IntervalIndex:
+    """Static set of half-open [start, end) intervals answering overlap queries in O(log n)."""
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _ in intervals]
+        # max_ends[i] is the latest end among the first i + 1 intervals
+        self.max_ends = list(itertools.accumulate((end for _, end in intervals), max))
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        count = bisect.bisect_left(self.starts, end)  # intervals starting before `end`
+        return count > 0 and self.max_ends[count - 1] > start
+
+
+def slots(days: int, now: datetime | None = None) -> list[tuple[datetime, datetime]]:
+    """Visit slots from now until the end of the `days`-th local day, in UTC."""
+    now = now or datetime.utcnow()
+    today = now.replace(tzinfo=timezone.utc).astimezone(VISIT_TIMEZONE).date()
+    step = timedelta(minutes=VISIT_SLOT_MINUTES)
+    result = []
+    for day in (today + timedelta(days=offset) for offset in range(days)):
+        local = datetime.combine(day, VISIT_DAY_START, tzinfo=VISIT_TIMEZONE)
+        close = datetime.combine(day, VISIT_DAY_END, tzinfo=VISIT_TIMEZONE)
+        while local + VISIT_DURATION <= close:
+            start = to_utc_naive(local)
+            if start >= now:
+                result.append((start, start + VISIT_DURATION))
+            local += step
+    return result
+
+
+def free_slots(candidates: list[tuple[datetime, datetime]], booked: IntervalIndex) -> list[datetime]:
+    return [start for start, end in candidates if not booked.overlaps(start, end)]
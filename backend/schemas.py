@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -50,6 +50,32 @@ class PropertyCreate(BaseModel):
     bedrooms: int
     bathrooms: int
     size: float
+    latitude: Optional[float] = None  # WGS84 degrees, used by geo search
+    longitude: Optional[float] = None
+
+    @validator('latitude')
+    def validate_latitude(cls, v):
+        if v is not None and not -90 <= v <= 90:
+            raise ValueError("Latitude must be between -90 and 90.")
+        return v
+
+    @validator('longitude')
+    def validate_longitude(cls, v):
+        if v is not None and not -180 <= v <= 180:
+            raise ValueError("Longitude must be between -180 and 180.")
+        return v
+
+
+# Bulk import result (POST /users/{user_id}/properties/import)
+class PropertyImportError(BaseModel):
+    line: int
+    errors: List[str]
+
+
+class PropertyImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[PropertyImportError]  # first PROPERTY_IMPORT_MAX_ERRORS failures
 
 
 # Property response model (used for reading property data, includes images and agent info)
@@ -65,24 +91,56 @@ class Property(BaseModel):
     size: float
     status: str
     created_at: datetime
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    favorites_count: int = 0
+    pending_visits_count: int = 0
     agent: User  # Related agent information
     images: List["Image"] = []  # List of related images
 
     class Config:
         from_attributes = True
 
+# Property search result (adds relevance and highlighted snippet when searching with `q`)
+class PropertySearchHit(Property):
+    rank: Optional[float] = None
+    headline: Optional[str] = None
+    distance_km: Optional[float] = None  # from (lat, lng) when searching by location
+
+
+# Counts per facet value for the properties matching a search (GET /properties/search/facets)
+class PropertyFacets(BaseModel):
+    total: int
+    property_type: Dict[str, int]
+    status: Dict[str, int]
+    bedrooms: Dict[str, int]
+    price: Dict[str, int]
+
+
 # Image creation model (used for uploading an image)
 class ImageCreate(BaseModel):
     filename: str  # Original filename
     url: str
 
 
+# Image variant response model (a resized copy, usable in srcset)
+class ImageVariant(BaseModel):
+    width: int
+    format: str
+    url: str
+    size_bytes: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
 # Image response model (used for reading image data)
 class Image(BaseModel):
     id: int
     url: str
     upload_date: datetime
     property_id: int
+    variants: List[ImageVariant] = []
 
 
     class Config:
@@ -90,6 +148,7 @@ class Image(BaseModel):
 
 # To avoid circular imports, declare Property's images field after Image schema
 Property.update_forward_refs()
+PropertySearchHit.update_forward_refs()
 
 class Favorite(BaseModel):
     id: int  # Unique identifier for the favorite entry
@@ -100,6 +159,55 @@ class Favorite(BaseModel):
         orm_mode = True
 
 
+# Batch favorites (POST /users/{user_id}/favorites/batch)
+class FavoritesBatch(BaseModel):
+    add: List[int] = []
+    remove: List[int] = []
+    check: List[int] = []  # property ids to report the favorited state of
+
+
+class FavoritesBatchResult(BaseModel):
+    added: List[int]  # ids that were not favorited before
+    removed: List[int]  # ids that were favorited before
+    favorited: List[int]  # ids from `check` that are favorited after the batch
+
+
+# Favorited state of a page of listings: bitmap[i] is "1" if ids[i] is favorited
+class FavoritesLookup(BaseModel):
+    ids: List[int]
+    bitmap: str
+
+
+# Criteria of a saved search; omitted fields match any listing
+class SavedSearchCreate(BaseModel):
+    name: str | None = None
+    location: str | None = None
+    min_price: float | None = None
+    max_price: float | None = None
+    property_type: str | None = None
+    status: str | None = None
+    bedrooms: int | None = None
+    bathrooms: int | None = None
+
+
+class SavedSearch(SavedSearchCreate):
+    id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# A listing that matched one of the user's saved searches
+class SavedSearchMatch(BaseModel):
+    id: int
+    saved_search_id: int
+    created_at: datetime
+    property: Property
+
+    class Config:
+        from_attributes = True
+
 
 class VisitRequestStatus(str, Enum):
     pending = "pending"
@@ -126,4 +234,18 @@ class VisitRequestResponse(VisitRequestBase):
     user_id: int  
 
     class Config:
-        orm_mode = True  # Allows conversion from SQLAlchemy models to Pydantic models
\ No newline at end of file
+        orm_mode = True  # Allows conversion from SQLAlchemy models to Pydantic models
+
+
+# Free visit slots (start times, UTC) of a property (GET /properties/availability)
+class PropertyAvailability(BaseModel):
+    property_id: int
+    slots: List[datetime]
+
+
+# Visit requests per status in an agent's inbox
+class VisitRequestCounts(BaseModel):
+    pending: int
+    accepted: int
+    declined: int
+    total: int
\ No newline at end of file
@@ -0,0 +1,200 @@
+import html
+import math
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import func, literal
+from sqlalchemy.orm import Session
+
+import models
+
+# Full-text search over property title, description and location.
+#
+# On PostgreSQL, Property.search_vector is a tsvector (GIN-indexed) written by
+# crud.create_property/update_property, and queries use websearch_to_tsquery,
+# ts_rank_cd and ts_headline. Other databases (SQLite in development) store the
+# normalized token string in the same column and are served by an in-process
+# inverted index built from it.
+
+SEARCH_CONFIG = "english"
+
+# ts_headline returns the document unescaped, so it marks matches with these
+# and they become <b></b> only after escaping (see escape_headline)
+HEADLINE_START = "\x02"
+HEADLINE_STOP = "\x03"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def tokenize(text: str | None) -> list[str]:
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def search_vector(db: Session, title: str | None, description: str | None, location: str | None):
+    """
+    Value to store in Property.search_vector for the given fields.
+    Title matches rank above location matches, which rank above description matches.
+    """
+    if is_postgres(db):
+        def weighted(text, weight):
+            return func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(text, "")), weight)
+        return weighted(title, "A").op("||")(weighted(location, "B")).op("||")(weighted(description, "C"))
+    return " ".join(tokenize(title) + tokenize(location) + tokenize(description))
+
+
+def ts_query(q: str):
+    return func.websearch_to_tsquery(SEARCH_CONFIG, q)
+
+
+def ts_rank(q: str):
+    return func.ts_rank_cd(models.Property.search_vector, ts_query(q))
+
+
+def ts_match(q: str):
+    return models.Property.search_vector.op("@@")(ts_query(q))
+
+
+def ts_headlines(db: Session, q: str, property_ids: list[int]) -> dict[int, str]:
+    # ts_headline re-parses the document, so only run it for the rows on the page
+    if not property_ids:
+        return {}
+    headline = func.ts_headline(
+        SEARCH_CONFIG,
+        func.concat_ws(" — ", models.Property.title, models.Property.location, models.Property.description),
+        ts_query(q),
+        literal(f'StartSel="{HEADLINE_START}", StopSel="{HEADLINE_STOP}", MaxFragments=2, MaxWords=20, MinWords=5'),
+    )
+    rows = db.query(models.Property.id, headline).filter(models.Property.id.in_(property_ids)).all()
+    return {row[0]: escape_headline(row[1]) for row in rows}
+
+
+def escape_headline(text: str | None) -> str | None:
+    """HTML-escape a ts_headline result and turn its match markers into <b></b>."""
+    if text is None:
+        return None
+    return html.escape(text).replace(HEADLINE_START, "<b>").replace(HEADLINE_STOP, "</b>")
+
+
+def highlight(text: str | None, terms: set[str], max_words: int = 30) -> str | None:
+    """
+    Wrap query terms found in `text` with <b></b>, trimmed to a window around the
+    first match. Mirrors ts_headline output for the in-process fallback.
+    """
+    if not text:
+        return None
+    words = text.split()
+    hits = [i for i, word in enumerate(words) if set(tokenize(word)) & terms]
+    start = max(0, hits[0] - max_words // 3) if hits else 0
+    window = []
+    for word in words[start:start + max_words]:
+        escaped = html.escape(word)
+        window.append(f"<b>{escaped}</b>" if set(tokenize(word)) & terms else escaped)
+    return " ".join(window)
+
+
+class InvertedIndex:
+    """
+    In-process token -> {property_id: term frequency} index with BM25 scoring.
+    Used where the database has no full-text search (SQLite in development and tests).
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._lengths = {}
+        self._terms = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, db: Session):
+        rows = db.query(models.Property.id, models.Property.search_vector).all()
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._terms.clear()
+            for property_id, document in rows:
+                self._add(property_id, document)
+            self.loaded = True
+
+    def _add(self, property_id: int, document: str | None):
+        tokens = (document or "").split()
+        self._lengths[property_id] = len(tokens)
+        counts = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+        for token, count in counts.items():
+            self._postings[token][property_id] = count
+        self._terms[property_id] = set(counts)
+
+    def _remove(self, property_id: int):
+        self._lengths.pop(property_id, None)
+        for token in self._terms.pop(property_id, ()):
+            postings = self._postings[token]
+            postings.pop(property_id, None)
+            if not postings:
+                del self._postings[token]
+
+    def put(self, property_id: int, document: str | None):
+        with self._lock:
+            self._remove(property_id)
+            self._add(property_id, document)
+
+    def remove(self, property_id: int):
+        with self._lock:
+            self._remove(property_id)
+
+    def search(self, q: str) -> dict[int, float]:
+        """Return {property_id: score} for documents containing every query term."""
+        terms = set(tokenize(q))
+        if not terms:
+            return {}
+        with self._lock:
+            postings = [self._postings.get(term, {}) for term in terms]
+            if not all(postings):
+                return {}
+            n_docs = len(self._lengths)
+            avg_length = sum(self._lengths.values()) / n_docs
+            matches = set.intersection(*(set(p) for p in postings))
+            scores = {}
+            for property_id in matches:
+                length = self._lengths[property_id]
+                score = 0.0
+                for p in postings:
+                    tf = p[property_id]
+                    idf = math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5))
+                    score += idf * tf * (self.K1 + 1) / (tf + self.K1 * (1 - self.B + self.B * length / avg_length))
+                scores[property_id] = round(score, 6)
+            return scores
+
+
+fallback_index = InvertedIndex()
+
+
+def index_property(db: Session, db_property: models.Property):
+    # Keep the in-process fallback index in step with writes; PostgreSQL maintains its own GIN index
+    if fallback_index.loaded and not is_postgres(db):
+        fallback_index.put(db_property.id, db_property.search_vector)
+
+
+def unindex_property(db: Session, property_id: int):
+    if fallback_index.loaded and not is_postgres(db):
+        fallback_index.remove(property_id)
+
+
+def reload_index(db: Session):
+    # Bulk inserts bypass index_property; rebuild from the table on the next fallback search
+    if not is_postgres(db):
+        fallback_index.loaded = False
+
+
+def fallback_search(db: Session, q: str) -> dict[int, float]:
+    if not fallback_index.loaded:
+        fallback_index.load(db)
+    return fallback_index.search(q)
@@ -0,0 +1,207 @@
+import binascii
+import base64
+import hashlib
+import os
+import re
+import time
+import uuid
+from typing import NamedTuple
+from datetime import datetime, timedelta
+
+import anyio
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import Session
+
+import models
+
+# Image files are written by streaming the upload to a temporary file in
+# IMAGES_DIR chunk by chunk and renaming it into place once complete, so memory
+# use is bounded by CHUNK_SIZE and readers never see a partial file.
+#
+# Storage is content-addressed: a file is named after the SHA-256 of its bytes
+# and sharded as IMAGES_DIR/ab/cd/abcd....ext, so identical uploads share one
+# file. image_blobs counts the images referencing each file; blobs whose count
+# drops to zero are removed by collect_garbage() (python maintenance.py gc-images)
+# once IMAGE_GC_GRACE_SECONDS have passed.
+
+IMAGES_DIR = "images"
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+IMAGE_GC_GRACE_SECONDS = int(os.getenv("IMAGE_GC_GRACE_SECONDS", "3600"))
+
+_HASH_FILENAME_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,10}$")
+
+# Uploads are stored and served under their extension, so only image types are accepted
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "gif", "webp", "avif")
+_WHITESPACE_RE = re.compile(rb"\s+")
+
+
+def file_extension(filename: str | None) -> str:
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    if extension not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400,
+                            detail=f"Unsupported image type; expected one of: {', '.join(IMAGE_EXTENSIONS)}")
+    return extension
+
+
+def _too_large():
+    return HTTPException(status_code=413, detail=f"Image exceeds the {MAX_IMAGE_UPLOAD_BYTES} byte limit")
+
+
+async def iter_upload_file(upload: UploadFile):
+    if upload.size is not None and upload.size > MAX_IMAGE_UPLOAD_BYTES:
+        raise _too_large()
+    while chunk := await upload.read(CHUNK_SIZE):
+        yield chunk
+
+
+async def iter_base64(data: str):
+    """Decode a base64 string (optionally a data: URL) in CHUNK_SIZE pieces."""
+    head, comma, rest = data[:256].partition(",")
+    start = len(head) + 1 if comma and head.startswith("data:") else 0
+    if (len(data) - start) * 3 // 4 > MAX_IMAGE_UPLOAD_BYTES + 2:
+        raise _too_large()
+
+    carry = b""
+    step = CHUNK_SIZE // 3 * 4
+    for offset in range(start, len(data), step):
+        piece = carry + _WHITESPACE_RE.sub(b"", data[offset:offset + step].encode("ascii", "ignore"))
+        usable = len(piece) - len(piece) % 4
+        carry = piece[usable:]
+        try:
+            yield base64.b64decode(piece[:usable], validate=True)
+        except binascii.Error:
+            raise HTTPException(status_code=400, detail="Invalid base64 image data")
+        await anyio.sleep(0)  # let other requests run between chunks
+    if carry:
+        raise HTTPException(status_code=400, detail="Invalid base64 image data")
+
+
+class StoredFile(NamedTuple):
+    path: str
+    content_hash: str
+    size_bytes: int
+
+
+def blob_path(content_hash: str, extension: str) -> str:
+    return os.path.join(IMAGES_DIR, content_hash[:2], content_hash[2:4], f"{content_hash}.{extension}")
+
+
+def public_url(path: str) -> str:
+    """URL under which GET /images serves a stored file."""
+    normalized = path.replace(os.sep, "/").lstrip("/")
+    if normalized.startswith(IMAGES_DIR + "/"):
+        return "/" + normalized
+    return f"/{IMAGES_DIR}/{os.path.basename(normalized)}"
+
+
+def is_content_addressed(filename: str) -> bool:
+    return bool(_HASH_FILENAME_RE.match(os.path.basename(filename)))
+
+
+async def save_stream(chunks, extension: str) -> StoredFile:
+    """
+    Write an async iterator of byte chunks to content-addressed storage.
+    If identical content is already stored, the existing file is reused.
+    Raises 413 as soon as the stream passes MAX_IMAGE_UPLOAD_BYTES.
+    """
+    temp_path = os.path.join(IMAGES_DIR, f".upload-{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    try:
+        total = 0
+        async with await anyio.open_file(temp_path, "wb") as file_io:
+            async for chunk in chunks:
+                total += len(chunk)
+                if total > MAX_IMAGE_UPLOAD_BYTES:
+                    raise _too_large()
+                digest.update(chunk)
+                await file_io.write(chunk)
+        if total == 0:
+            raise HTTPException(status_code=400, detail="No image data provided")
+        content_hash = digest.hexdigest()
+        final_path = blob_path(content_hash, extension)
+        await anyio.to_thread.run_sync(_move_into_place, temp_path, final_path)
+    except BaseException:
+        await anyio.to_thread.run_sync(_remove_quietly, temp_path)
+        raise
+    return StoredFile(final_path, content_hash, total)
+
+
+def _move_into_place(temp_path: str, final_path: str):
+    if os.path.exists(final_path):
+        os.remove(temp_path)  # duplicate content: keep the stored copy
+        return
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(temp_path, final_path)
+
+
+def collect_garbage(db: Session, grace_seconds: int = IMAGE_GC_GRACE_SECONDS) -> int:
+    """
+    Remove stored files no image references any more: blobs whose reference
+    count has been zero for longer than the grace period, and files in the
+    sharded directories with no blob record at all (e.g. left by a crash
+    between writing the file and recording it). Returns the number of files removed.
+    """
+    import derivatives
+
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    removed = 0
+    unreferenced = db.query(models.ImageBlob.content_hash).filter(
+        models.ImageBlob.ref_count <= 0,
+        models.ImageBlob.updated_at < cutoff
+    ).all()
+    for (content_hash,) in unreferenced:
+        # Conditional delete: skip blobs that gained a reference since the query
+        deleted = db.query(models.ImageBlob).filter(
+            models.ImageBlob.content_hash == content_hash,
+            models.ImageBlob.ref_count <= 0
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            removed += _remove_blob_files(content_hash, derivatives.VARIANTS_DIR)
+
+    # Orphans are decided by hash, not path: the same bytes uploaded under
+    # another extension are stored as a second file while the blob row keeps
+    # the first path, and both are referenced through the one content hash.
+    known = {content_hash for (content_hash,) in db.query(models.ImageBlob.content_hash)}
+    cutoff_timestamp = time.time() - grace_seconds
+    for shard in _shard_dirs():
+        for entry in os.scandir(shard):
+            content_hash = os.path.splitext(entry.name)[0]
+            if (entry.is_file() and is_content_addressed(entry.name) and content_hash not in known
+                    and entry.stat().st_mtime < cutoff_timestamp):
+                removed += _remove_blob_files(content_hash, derivatives.VARIANTS_DIR)
+    return removed
+
+
+def _shard_dirs():
+    for first in os.scandir(IMAGES_DIR):
+        if first.is_dir() and len(first.name) == 2:
+            for second in os.scandir(first.path):
+                if second.is_dir() and len(second.name) == 2:
+                    yield second.path
+
+
+def _remove_blob_files(content_hash: str, variants_dir: str) -> int:
+    # Every stored copy of the content, whatever its extension, and its variants
+    shard = os.path.dirname(blob_path(content_hash, "bin"))
+    removed = 0
+    paths = []
+    if os.path.isdir(shard):
+        paths += [entry.path for entry in os.scandir(shard) if entry.name.startswith(content_hash + ".")]
+    if os.path.isdir(variants_dir):
+        paths += [entry.path for entry in os.scandir(variants_dir) if entry.name.startswith(content_hash + "_")]
+    for candidate in paths:
+        try:
+            os.remove(candidate)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
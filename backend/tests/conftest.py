@@ -0,0 +1,162 @@
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# The app reads its settings at import time, so point it at a scratch SQLite
+# database and working directory (images/ is relative) before importing it.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="reweb-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{WORK_DIR}/test.db"
+os.environ["DATABASE_ASYNC"] = "0"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ["RECOMMENDATIONS_REBUILD_SECONDS"] = "0"
+os.chdir(WORK_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+import pytest  # noqa: E402
+from alembic import command  # noqa: E402
+from alembic.config import Config  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+from cache import response_cache, user_cache  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    # The schema comes from the migrations, as in production
+    command.upgrade(Config(os.path.join(BACKEND_DIR, "alembic.ini")), "head")
+
+
+@pytest.fixture(autouse=True)
+def clean_database(schema):
+    yield
+    with database.engine.begin() as connection:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    response_cache.invalidate()
+    user_cache.clear()
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append((statement, parameters))
+
+
+@pytest.fixture
+def count_statements():
+    """Context manager yielding a counter of the SQL statements executed inside it."""
+    @contextlib.contextmanager
+    def counting():
+        counter = StatementCounter()
+        event.listen(database.engine, "before_cursor_execute", counter)
+        try:
+            yield counter
+        finally:
+            event.remove(database.engine, "before_cursor_execute", counter)
+    return counting
+
+
+def register(client, username: str, role: str = "agent") -> dict:
+    """Register and log in a user; returns their id and authorization headers."""
+    response = client.post("/register", json={"username": username, "password": "secret", "name": "Test",
+                                              "surname": "User", "role": role})
+    assert response.status_code == 200, response.text
+    token = client.post("/token", data={"username": username, "password": "secret"}).json()["access_token"]
+    return {"id": response.json()["id"], "headers": {"Authorization": f"Bearer {token}"}}
+
+
+@pytest.fixture
+def agent(client):
+    return register(client, "agent@example.com")
+
+
+@pytest.fixture
+def visitor(client):
+    return register(client, "visitor@example.com", role="user")
+
+
+def listing(index: int, **fields) -> dict:
+    return {"title": f"House {index}", "description": "Sunny house with a garden", "price": 1000 + index * 10,
+            "location": "Vilnius", "property_type": "house", "bedrooms": 1 + index % 4,
+            "bathrooms": 1 + index % 2, "size": 50 + index, **fields}
+
+
+def create_listings(client, agent: dict, count: int, **fields) -> list[dict]:
+    created = []
+    for index in range(count):
+        response = client.post(f"/users/{agent['id']}/property", headers=agent["headers"],
+                               json=listing(index, **fields))
+        assert response.status_code == 200, response.text
+        created.append(response.json())
+    return created
+
+
+def request_visit(client, visitor: dict, property_id: int, visit_time: datetime) -> dict:
+    """Request a visit as `visitor`; returns the created visit request."""
+    response = client.post(f"/properties/{property_id}/visit-request", headers=visitor["headers"], json={
+        "property_id": property_id, "email": "visitor@example.com",
+        "visit_date": visit_time.isoformat(), "visit_time": visit_time.isoformat()})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def fetch_all_pages(client, path: str, params: dict, headers: dict | None = None, max_pages: int = 100) -> list:
+    """Follow X-Next-Cursor to the last page and return every row."""
+    rows, cursor = [], None
+    for _ in range(max_pages):
+        response = client.get(path, params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        assert response.status_code == 200, response.text
+        rows += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return rows
+    raise AssertionError(f"{path} still returned a cursor after {max_pages} pages")
+
+
+async def max_event_loop_stall(work) -> float:
+    """Run `work` while ticking the event loop; returns the longest gap between ticks in seconds."""
+    longest, done = 0.0, asyncio.Event()
+
+    async def ticker():
+        nonlocal longest
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            longest, last = max(longest, now - last), now
+
+    ticking = asyncio.create_task(ticker())
+    try:
+        await work
+    finally:
+        done.set()
+        await ticking
+    return longest
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import crud
+import crud_async
+import database
+import schemas
+from cache import response_cache
+from conftest import create_listings, listing, max_event_loop_stall
+
+
+async def in_async_session(call):
+    engine = create_async_engine(database.async_database_url(os.environ["DATABASE_URL"]))
+    try:
+        async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+            return await call(session)
+    finally:
+        await engine.dispose()
+
+
+def test_crud_through_an_async_session_matches_the_sync_path(client, agent, db):
+    pytest.importorskip("aiosqlite")
+    create_listings(client, agent, 12)
+    expected, expected_cursor = crud.get_all_properties(db, sort="price", limit=5)
+
+    properties, next_cursor = asyncio.run(in_async_session(
+        lambda session: crud_async.get_all_properties(session, sort="price", limit=5)))
+    assert [p.id for p in properties] == [p.id for p in expected]
+    assert next_cursor == expected_cursor
+
+
+def test_sync_sessions_run_off_the_event_loop(db):
+    def slow_query(session):
+        session.connection().exec_driver_sql("SELECT 1")
+        time.sleep(0.3)
+
+    stall = asyncio.run(max_event_loop_stall(crud_async._awaitable(slow_query)(db)))
+    assert stall < 0.1
+
+
+def test_async_session_writes_invalidate_the_cache_off_the_event_loop(agent, monkeypatch):
+    pytest.importorskip("aiosqlite")
+    invalidated_on = []
+    bump_generation = response_cache.backend.bump_generation
+
+    def slow_bump_generation():
+        # A remote cache backend makes this a network round trip
+        time.sleep(0.3)
+        invalidated_on.append(threading.current_thread())
+        bump_generation()
+
+    monkeypatch.setattr(response_cache.backend, "bump_generation", slow_bump_generation)
+    generation = response_cache.backend.generation()
+
+    async def create(session):
+        return await crud_async.create_property(session, schemas.PropertyCreate(**listing(1)), agent["id"])
+
+    stall = asyncio.run(max_event_loop_stall(in_async_session(create)))
+    assert invalidated_on and threading.main_thread() not in invalidated_on
+    assert response_cache.backend.generation() > generation
+    assert stall < 0.1
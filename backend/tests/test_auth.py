@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+from unittest.mock import Mock
+
+from jose import jwt
+
+import main
+from cache import user_cache
+
+
+def user_lookups(counter) -> int:
+    return sum(1 for statement, _ in counter.statements if "FROM users" in statement)
+
+
+def test_current_user_is_served_from_the_cache(client, agent, count_statements):
+    user_cache.clear()
+    with count_statements() as first:
+        assert client.get("/user/myinfo", headers=agent["headers"]).status_code == 200
+    with count_statements() as second:
+        response = client.get("/user/myinfo", headers=agent["headers"])
+
+    assert response.json()["username"] == "agent@example.com"
+    assert user_lookups(first) == 1
+    assert second.count == 0
+
+
+def test_update_user_invalidates_the_cached_user(client, agent):
+    assert client.get("/user/myinfo", headers=agent["headers"]).json()["name"] == "Test"
+
+    response = client.put(f"/users/{agent['id']}", json={"username": "agent@example.com", "password": "secret",
+                                                         "name": "Renamed", "surname": "User", "role": "agent"})
+    assert response.status_code == 200, response.text
+
+    assert client.get("/user/myinfo", headers=agent["headers"]).json()["name"] == "Renamed"
+
+
+def test_delete_user_invalidates_the_cached_user(client, agent):
+    assert client.get("/user/myinfo", headers=agent["headers"]).status_code == 200
+
+    assert client.delete(f"/users/{agent['id']}").status_code == 200
+
+    assert client.get("/user/myinfo", headers=agent["headers"]).status_code == 404
+
+
+def test_trusted_token_claims_skip_the_user_lookup(client, agent, count_statements, monkeypatch):
+    monkeypatch.setattr(main, "TRUST_TOKEN_CLAIMS", True)
+    user_cache.clear()
+
+    with count_statements() as statements:
+        response = client.get("/user/myinfo", headers=agent["headers"])
+
+    assert response.status_code == 200
+    assert response.json()["id"] == agent["id"] and response.json()["role"] == "agent"
+    assert statements.count == 0
+
+
+def bearer(claims: dict, minutes: float | None) -> dict:
+    if minutes is None:
+        token = jwt.encode(claims, main.SECRET_KEY, algorithm=main.ALGORITHM)
+    else:
+        token = main.create_access_token(claims, timedelta(minutes=minutes))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_new_access_token_is_issued_only_near_expiry(client, agent):
+    claims = {"sub": "agent@example.com"}
+    fresh = client.get("/user/myinfo", headers=bearer(claims, main.ACCESS_TOKEN_EXPIRE_MINUTES))
+    expiring = client.get("/user/myinfo", headers=bearer(claims, main.TOKEN_REFRESH_WINDOW_MINUTES / 2))
+
+    assert fresh.status_code == expiring.status_code == 200
+    assert "x-new-access-token" not in fresh.headers
+    renewed = jwt.decode(expiring.headers["x-new-access-token"], main.SECRET_KEY, algorithms=[main.ALGORITHM])
+    assert renewed["sub"] == "agent@example.com"
+    assert renewed["exp"] - time.time() > main.TOKEN_REFRESH_WINDOW_MINUTES * 60
+
+
+def test_token_without_expiry_is_not_refreshed(client, agent):
+    response = client.get("/user/myinfo", headers=bearer({"sub": "agent@example.com"}, None))
+
+    assert response.status_code == 200
+    assert "x-new-access-token" not in response.headers
+
+
+def test_each_request_decodes_its_token_once(client, agent, monkeypatch):
+    # Per-request auth work: the middleware used to decode the token and sign a new
+    # one, and verify_token decoded it again; now it is one decode and no signing
+    decode, encode = Mock(wraps=jwt.decode), Mock(wraps=jwt.encode)
+    monkeypatch.setattr(main.jwt, "decode", decode)
+    monkeypatch.setattr(main.jwt, "encode", encode)
+
+    for _ in range(5):
+        assert client.get("/user/myinfo", headers=agent["headers"]).status_code == 200
+
+    assert decode.call_count == 5
+    assert encode.call_count == 0
@@ -0,0 +1,52 @@
+from datetime import datetime, time, timedelta
+
+import scheduling
+from conftest import create_listings, register, request_visit
+
+
+def availability(client, ids: list[int], days: int = 3) -> dict[int, list[str]]:
+    response = client.get("/properties/availability", params={"ids": ",".join(map(str, ids)), "days": days})
+    assert response.status_code == 200, response.text
+    return {row["property_id"]: row["slots"] for row in response.json()}
+
+
+def test_slots_cover_opening_hours_from_now():
+    now = datetime(2030, 5, 6, 16, 45)
+
+    slots = scheduling.slots(2, now=now)
+
+    starts = [start for start, _ in slots]
+    assert starts[:3] == [datetime(2030, 5, 6, 17, 0), datetime(2030, 5, 6, 17, 30), datetime(2030, 5, 7, 9, 0)]
+    assert starts[-1] == datetime(2030, 5, 7, 17, 30)
+    assert len(starts) == 2 + 18
+    assert all(end - start == scheduling.VISIT_DURATION for start, end in slots)
+
+
+def test_accepted_visits_block_the_agent_on_every_listing(client, agent, visitor):
+    listings = create_listings(client, agent, 2)
+    other = create_listings(client, register(client, "other-agent@example.com"), 1)[0]
+    visit_day = datetime.utcnow().date() + timedelta(days=2)
+    visit = request_visit(client, visitor, listings[0]["id"], datetime.combine(visit_day, time(10, 15)))
+    request_visit(client, visitor, listings[1]["id"], datetime.combine(visit_day, time(14, 0)))  # stays pending
+    assert client.put(f"/visit-request/{visit['id']}/status", params={"status": "accepted"},
+                      headers=agent["headers"]).status_code == 200
+
+    slots = availability(client, [listings[0]["id"], listings[1]["id"], other["id"], 999999])
+
+    assert set(slots) == {listings[0]["id"], listings[1]["id"], other["id"]}
+    on_visit_day = [slot for slot in slots[listings[1]["id"]] if slot.startswith(visit_day.isoformat())]
+    assert len(on_visit_day) == 18 - 2
+    assert f"{visit_day}T10:00:00" not in on_visit_day and f"{visit_day}T10:30:00" not in on_visit_day
+    assert f"{visit_day}T09:30:00" in on_visit_day and f"{visit_day}T11:00:00" in on_visit_day
+    assert f"{visit_day}T14:00:00" in on_visit_day
+    assert slots[listings[0]["id"]] == slots[listings[1]["id"]]
+    assert f"{visit_day}T10:00:00" in slots[other["id"]]
+
+
+def test_availability_limits(client):
+    assert client.get("/properties/availability", params={"ids": "1,x"}).status_code == 400
+    too_many = ",".join(str(pid) for pid in range(scheduling.MAX_AVAILABILITY_PROPERTIES + 1))
+    assert client.get("/properties/availability", params={"ids": too_many}).status_code == 400
+    for days in (0, scheduling.MAX_AVAILABILITY_DAYS + 1):
+        assert client.get("/properties/availability", params={"ids": "1", "days": days}).status_code == 400
+    assert client.get("/properties/availability", params={"ids": ""}).json() == []
@@ -0,0 +1,68 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import httpx
+from sqlalchemy.pool import QueuePool
+
+import database
+import main
+import metrics
+from conftest import create_listings
+
+
+def test_pool_serves_twice_its_capacity_in_concurrent_requests(client, agent):
+    create_listings(client, agent, 5)
+    capacity = database.DB_POOL_SIZE + database.DB_MAX_OVERFLOW
+    before = metrics.snapshot()
+
+    async def burst():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(
+                http.get(f"/users/{agent['id']}/myproperties", headers=agent["headers"])
+                for _ in range(2 * capacity)))
+
+    responses = asyncio.run(burst())
+
+    assert [response.status_code for response in responses] == [200] * (2 * capacity)
+    after = metrics.snapshot()
+    assert after["db_pool_timeouts_total"] == before["db_pool_timeouts_total"]
+    assert after["db_pool_checkout_seconds"]["count"] >= before["db_pool_checkout_seconds"]["count"] + 2 * capacity
+    assert after["db_pool_checked_out"] == 0
+    assert after["db_pool_waiting"] == 0
+
+
+def test_pool_metrics_are_exported(client):
+    exported = client.get("/metrics").json()
+    for name in ("db_pool_size", "db_pool_checked_out", "db_pool_checked_in", "db_pool_overflow",
+                 "db_pool_waiting", "db_pool_timeouts_total", "db_pool_checkout_seconds"):
+        assert name in exported
+    assert exported["db_pool_size"] == database.DB_POOL_SIZE
+
+
+def test_only_checkouts_from_an_exhausted_pool_count_as_waiting():
+    waiting_while_connecting = []
+
+    def connect():
+        waiting_while_connecting.append(metrics.snapshot()["test_pool_waiting"])
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    pool = database.instrumented_pool(QueuePool, "test_pool")(connect, pool_size=1, max_overflow=1, timeout=5)
+    first, second = pool.connect(), pool.connect()  # opening a connection is not waiting
+    assert waiting_while_connecting == [0, 0]
+
+    third = []
+    blocked = threading.Thread(target=lambda: third.append(pool.connect()))
+    blocked.start()
+    deadline = time.monotonic() + 5
+    while metrics.snapshot()["test_pool_waiting"] != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert metrics.snapshot()["test_pool_waiting"] == 1
+
+    first.close()
+    blocked.join(5)
+    assert third and metrics.snapshot()["test_pool_waiting"] == 0
+    second.close()
+    third[0].close()
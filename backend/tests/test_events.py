@@ -0,0 +1,110 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from jose import jwt
+
+import events
+import main
+import metrics
+from conftest import register
+
+
+def drain(subscription) -> list[str]:
+    messages = []
+    while not subscription._queue.empty():
+        messages.append(subscription._queue.get_nowait())
+    return messages
+
+
+def test_publish_fans_out_to_the_channel_subscribers():
+    async def scenario():
+        broker = events.MemoryBroker()
+        first, second = broker.subscribe("agent:1"), broker.subscribe("agent:1")
+        other = broker.subscribe("agent:2")
+        broker.publish("agent:1", "event: a\n\n")
+        broker.unsubscribe(second)
+        broker.publish("agent:1", "event: b\n\n")
+        await asyncio.sleep(0)  # deliveries are scheduled on the loop
+        return [drain(first), drain(second), drain(other)], broker.subscriber_count()
+
+    received, subscribers = asyncio.run(scenario())
+
+    assert received == [["event: a\n\n", "event: b\n\n"], ["event: a\n\n"], []]
+    assert subscribers == 2
+
+
+def test_a_subscriber_that_falls_behind_gets_one_resync(monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_QUEUE_SIZE", 3)
+    dropped = metrics.snapshot()["events_dropped_total"]
+
+    async def scenario():
+        broker = events.MemoryBroker()
+        subscription = broker.subscribe("agent:1")
+        for index in range(5):
+            broker.publish("agent:1", f"event: {index}\n\n")
+        await asyncio.sleep(0)
+        return drain(subscription)
+
+    assert asyncio.run(scenario()) == [events.RESYNC, "event: 4\n\n"]
+    assert metrics.snapshot()["events_dropped_total"] == dropped + 3
+
+
+def test_redis_listener_logs_and_backs_off(monkeypatch, caplog):
+    class Unreachable:
+        def pubsub(self, **kwargs):
+            raise ConnectionError("redis is down")
+
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        if len(delays) == 4:
+            raise KeyboardInterrupt  # stop the listener loop
+
+    broker = events.RedisBroker.__new__(events.RedisBroker)  # without the redis package
+    events.MemoryBroker.__init__(broker)
+    broker._client = Unreachable()
+    monkeypatch.setattr(events, "EVENTS_RECONNECT_MAX_SECONDS", 3)
+    monkeypatch.setattr(events.time, "sleep", sleep)
+    monkeypatch.setattr(events.logger, "disabled", False)  # the migrations' logging config disables it
+
+    with pytest.raises(KeyboardInterrupt):
+        broker._listen()
+
+    assert delays == [1, 2, 3, 3]
+    assert "redis is down" in caplog.text
+
+
+def stream_path(user: dict) -> str:
+    return f"/users/{user['id']}/agent-visit-requests/events"
+
+
+def test_event_stream_requires_the_agent_itself(client, agent, visitor):
+    other = register(client, "other-agent@example.com")
+
+    assert client.get(stream_path(agent)).status_code == 401
+    assert client.get(stream_path(agent), params={"access_token": "not-a-token"}).status_code == 403
+    assert client.get(stream_path(agent), headers=other["headers"]).status_code == 403
+    assert client.get(stream_path(visitor), headers=visitor["headers"]).status_code == 403
+
+
+@pytest.mark.parametrize("expiring", [True, False])
+def test_event_stream_ends_with_its_token(client, agent, monkeypatch, expiring):
+    if expiring:
+        token = main.create_access_token({"sub": "agent@example.com"}, timedelta(seconds=2))
+    else:
+        # A token without `exp` is held to the access token lifetime
+        monkeypatch.setattr(main, "ACCESS_TOKEN_EXPIRE_MINUTES", 1 / 60)
+        token = jwt.encode({"sub": "agent@example.com"}, main.SECRET_KEY, algorithm=main.ALGORITHM)
+
+    started = time.monotonic()
+    with client.stream("GET", stream_path(agent), params={"access_token": token}) as response:
+        body = "".join(response.iter_text())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert body.startswith("retry: 5000\n\n")
+    assert time.monotonic() - started < 5
+    assert events.broker.subscriber_count() == 0
@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+
+import export
+from conftest import create_listings
+
+
+def test_ndjson_export_streams_every_matching_listing(client, agent):
+    created = create_listings(client, agent, 3) + create_listings(client, agent, 2, location="Kaunas")
+
+    response = client.get("/properties/export", params={"location": "Vilnius"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="properties.ndjson"'
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(record["id"] for record in records) == sorted(row["id"] for row in created[:3])
+    assert all(record["agent"]["username"] == "agent@example.com" for record in records)
+    assert all(record["image_urls"] == [] for record in records)
+
+
+def test_csv_export_writes_one_record_per_listing(client, agent):
+    create_listings(client, agent, 2, description='Sunny, with a "view"\nand a garden')
+
+    response = client.get("/properties/export", params={"format": "csv"})
+
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert tuple(rows[0]) == export.CSV_COLUMNS
+    records = [dict(zip(rows[0], row)) for row in rows[1:]]
+    assert len(records) == 2
+    assert all(record["description"] == 'Sunny, with a "view"\nand a garden' for record in records)
+    assert all(record["agent_username"] == "agent@example.com" for record in records)
+
+
+def test_export_is_produced_in_batches(client, agent, monkeypatch):
+    create_listings(client, agent, 5)
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+
+    chunks = list(export.iter_export("ndjson"))
+
+    assert [chunk.count("\n") for chunk in chunks] == [2, 2, 1]
+
+
+def test_unsupported_format_and_bad_filters_are_rejected(client):
+    assert client.get("/properties/export", params={"format": "xml"}).status_code == 400
+    assert client.get("/properties/export", params={"bbox": "1,2,3"}).status_code == 400
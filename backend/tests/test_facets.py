@@ -0,0 +1,36 @@
+from conftest import create_listings
+
+
+def seed(client, agent):
+    create_listings(client, agent, 3)  # houses in Vilnius for 1000-1020 with 1-3 bedrooms
+    create_listings(client, agent, 2, property_type="apartment", location="Kaunas", price=120000, bedrooms=6,
+                    description="Lakeside apartment")
+
+
+def test_facets_count_every_bucket_in_one_query(client, agent, count_statements):
+    seed(client, agent)
+
+    with count_statements() as statements:
+        facets = client.get("/properties/search/facets").json()
+
+    assert statements.count == 1
+    assert facets["total"] == 5
+    assert facets["property_type"] == {"house": 3, "apartment": 2}
+    assert facets["status"] == {"available": 5, "sold": 0}
+    assert facets["bedrooms"] == {"0": 0, "1": 1, "2": 1, "3": 1, "4": 0, "5+": 2}
+    assert facets["price"]["<50000"] == 3
+    assert facets["price"]["100000-200000"] == 2
+    assert sum(facets["price"].values()) == 5
+
+
+def test_query_and_filters_narrow_the_facets(client, agent):
+    seed(client, agent)
+
+    by_text = client.get("/properties/search/facets", params={"q": "lakeside"}).json()
+    by_filter = client.get("/properties/search/facets", params={"location": "Vilnius", "bedrooms": 2}).json()
+
+    assert by_text["total"] == 2 and by_text["property_type"] == {"house": 0, "apartment": 2}
+    # bedrooms is a minimum
+    assert by_filter["total"] == 2
+    assert (by_filter["bedrooms"]["1"], by_filter["bedrooms"]["2"], by_filter["bedrooms"]["3"]) == (0, 1, 1)
+    assert by_filter["price"]["100000-200000"] == 0
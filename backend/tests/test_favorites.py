@@ -0,0 +1,72 @@
+import models
+from conftest import create_listings
+
+
+def batch(client, user, **body):
+    return client.post(f"/users/{user['id']}/favorites/batch", headers=user["headers"], json=body)
+
+
+def favorites_counts(db, ids: list[int]) -> list[int]:
+    counts = dict(db.query(models.Property.id, models.Property.favorites_count).filter(models.Property.id.in_(ids)))
+    return [counts[pid] for pid in ids]
+
+
+def test_adding_and_removing_is_idempotent(client, agent, visitor, db):
+    ids = [row["id"] for row in create_listings(client, agent, 3)]
+
+    first = batch(client, visitor, add=ids[:2], check=ids).json()
+    again = batch(client, visitor, add=ids[:2], check=ids).json()
+
+    assert first == {"added": ids[:2], "removed": [], "favorited": ids[:2]}
+    assert again == {"added": [], "removed": [], "favorited": ids[:2]}
+    assert favorites_counts(db, ids) == [1, 1, 0]
+
+    removed = batch(client, visitor, remove=ids, check=ids).json()
+    removed_again = batch(client, visitor, remove=ids).json()
+
+    assert removed == {"added": [], "removed": ids[:2], "favorited": []}
+    assert removed_again["removed"] == []
+    db.expire_all()
+    assert favorites_counts(db, ids) == [0, 0, 0]
+
+
+def test_duplicate_ids_in_one_batch_count_once(client, agent, visitor, db):
+    [pid] = [row["id"] for row in create_listings(client, agent, 1)]
+
+    result = batch(client, visitor, add=[pid, pid, pid], check=[pid, pid]).json()
+
+    assert result == {"added": [pid], "removed": [], "favorited": [pid]}
+    assert favorites_counts(db, [pid]) == [1]
+    assert len(client.get(f"/users/{visitor['id']}/favorites", headers=visitor["headers"]).json()) == 1
+
+
+def test_unknown_ids_are_ignored(client, agent, visitor):
+    [pid] = [row["id"] for row in create_listings(client, agent, 1)]
+
+    result = batch(client, visitor, add=[pid, 999999], remove=[888888], check=[999999]).json()
+
+    assert result == {"added": [pid], "removed": [], "favorited": []}
+    single = client.post(f"/users/{visitor['id']}/property/999999/favorites", headers=visitor["headers"])
+    assert single.status_code == 404
+
+
+def test_conflicting_oversized_and_foreign_batches_are_rejected(client, agent, visitor):
+    assert batch(client, visitor, add=[1], remove=[1]).status_code == 400
+    assert batch(client, visitor, check=list(range(501))).status_code == 400
+    assert client.post(f"/users/{visitor['id']}/favorites/batch", headers=agent["headers"],
+                       json={"add": [1]}).status_code == 403
+
+
+def test_lookup_returns_a_bitmap_in_request_order(client, agent, visitor):
+    ids = [row["id"] for row in create_listings(client, agent, 4)]
+    batch(client, visitor, add=[ids[3], ids[1]])
+    requested = [ids[3], ids[0], 999999, ids[1], ids[2]]
+
+    response = client.get(f"/users/{visitor['id']}/favorites/lookup", headers=visitor["headers"],
+                          params={"ids": ",".join(map(str, requested))})
+
+    assert response.json() == {"ids": requested, "bitmap": "10010"}
+    bad = client.get(f"/users/{visitor['id']}/favorites/lookup", headers=visitor["headers"], params={"ids": "1,x"})
+    assert bad.status_code == 400
+    empty = client.get(f"/users/{visitor['id']}/favorites/lookup", headers=visitor["headers"], params={"ids": ""})
+    assert empty.json() == {"ids": [], "bitmap": ""}
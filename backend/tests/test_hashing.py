@@ -0,0 +1,61 @@
+import asyncio
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import hashing
+import main
+from conftest import max_event_loop_stall
+
+
+def test_hash_and_verify_round_trip():
+    hasher = hashing.PasswordHasher(workers=2)
+    try:
+        hashed = asyncio.run(hasher.hash("secret"))
+        assert asyncio.run(hasher.verify("secret", hashed))
+        assert not asyncio.run(hasher.verify("wrong", hashed))
+    finally:
+        hasher.shutdown()
+
+
+def test_requests_beyond_the_queue_limit_get_429():
+    hasher = hashing.PasswordHasher(workers=1, max_pending=2)
+
+    async def burst():
+        return await asyncio.gather(*(hasher.hash("secret") for _ in range(4)), return_exceptions=True)
+
+    try:
+        results = asyncio.run(burst())
+    finally:
+        hasher.shutdown()
+    rejected = [result for result in results if isinstance(result, HTTPException)]
+    assert len(rejected) == 2
+    assert all(error.status_code == 429 and error.headers["Retry-After"] for error in rejected)
+    assert hasher.pending == 0
+
+
+def test_hashing_burst_leaves_the_event_loop_responsive():
+    hasher = hashing.PasswordHasher(workers=2)
+
+    async def burst():
+        await asyncio.gather(*(hasher.hash("secret") for _ in range(8)))
+
+    try:
+        stall = asyncio.run(max_event_loop_stall(burst()))
+    finally:
+        hasher.shutdown()
+    assert stall < 0.1
+
+
+def test_login_burst_is_answered_with_429_not_a_stall(client, agent, monkeypatch):
+    monkeypatch.setattr(hashing.hasher, "max_pending", 0)
+    response = client.post("/token", data={"username": "agent@example.com", "password": "secret"})
+    assert response.status_code == 429
+
+
+def test_app_shutdown_releases_the_hashing_pool():
+    with TestClient(main.app) as client:
+        client.post("/register", json={"username": "pool@example.com", "password": "secret", "name": "Test",
+                                       "surname": "User", "role": "user"})
+        assert hashing.hasher._executor is not None
+    assert hashing.hasher._executor is None
@@ -0,0 +1,112 @@
+import io
+import os
+
+import pytest
+
+import file_responses
+import storage
+from conftest import create_listings
+
+pytest.importorskip("PIL")
+
+
+def jpeg_bytes(width: int = 64, height: int = 48) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 40)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def upload(client, agent, property_id, filename, content) -> dict:
+    response = client.post(f"/users/{agent['id']}/property/{property_id}/image", headers=agent["headers"],
+                           files={"image_file": (filename, content, "image/jpeg")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_garbage_collection_keeps_copies_under_other_extensions(client, agent, db):
+    listing = create_listings(client, agent, 1)[0]
+    content = jpeg_bytes()
+    first = upload(client, agent, listing["id"], "photo.jpg", content)
+    second = upload(client, agent, listing["id"], "photo.jpeg", content)
+    assert first["url"] != second["url"]
+
+    storage.collect_garbage(db, grace_seconds=0)
+
+    for image in (first, second):
+        response = client.get(storage.public_url(image["url"]))
+        assert response.status_code == 200
+        assert response.content == content
+
+
+def test_garbage_collection_removes_every_copy_of_released_content(client, agent, db):
+    listing = create_listings(client, agent, 1)[0]
+    content = jpeg_bytes()
+    images = [upload(client, agent, listing["id"], name, content) for name in ("photo.jpg", "photo.jpeg")]
+    for image in images:
+        response = client.delete(f"/users/{agent['id']}/property/{listing['id']}/image/{image['id']}",
+                                 headers=agent["headers"])
+        assert response.status_code == 200, response.text
+
+    assert storage.collect_garbage(db, grace_seconds=0) >= 2
+
+    for image in images:
+        assert client.get(storage.public_url(image["url"])).status_code == 404
+
+
+def test_only_the_requested_variant_is_cached_as_immutable(client, agent):
+    import derivatives
+
+    listing = create_listings(client, agent, 1)[0]
+    image = upload(client, agent, listing["id"], "large.jpg", jpeg_bytes(width=2000, height=1000))
+    url = storage.public_url(image["url"])
+    largest = derivatives.IMAGE_VARIANT_WIDTHS[-1]
+
+    assert client.get(url).headers["cache-control"] == file_responses.IMMUTABLE_CACHE_CONTROL
+    exact = client.get(url, params={"w": largest, "format": "jpg"})
+    assert exact.headers["content-type"] == "image/jpeg"
+    assert exact.headers["cache-control"] == file_responses.IMMUTABLE_CACHE_CONTROL
+
+    # Until a variant is rendered, the original stands in for it
+    os.remove(os.path.join(derivatives.VARIANTS_DIR,
+                           derivatives.variant_filename(os.path.basename(image["url"]), largest, "jpg")))
+    for params in ({"w": largest, "format": "jpg"}, {"w": largest, "format": "gif"}):
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        assert "immutable" not in response.headers["cache-control"]
+        assert f"max-age={file_responses.IMAGE_FALLBACK_MAX_AGE}" in response.headers["cache-control"]
+
+
+def test_range_and_conditional_requests(client, agent):
+    listing = create_listings(client, agent, 1)[0]
+    content = jpeg_bytes()
+    url = storage.public_url(upload(client, agent, listing["id"], "photo.jpg", content)["url"])
+    full = client.get(url)
+    etag = full.headers["etag"]
+
+    partial = client.get(url, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes 0-9/{len(content)}"
+    assert partial.content == content[:10]
+    suffix = client.get(url, headers={"Range": "bytes=-5"})
+    assert suffix.status_code == 206 and suffix.content == content[-5:]
+    assert client.get(url, headers={"Range": f"bytes={len(content)}-"}).status_code == 416
+
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    assert not_modified.headers["cache-control"] == file_responses.IMMUTABLE_CACHE_CONTROL
+    stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert stale.status_code == 200 and stale.content == content
+
+
+@pytest.mark.parametrize("filename", ["../../evil.php", "photo.html", "photo.svg", "photo"])
+def test_uploads_are_stored_under_image_extensions_only(client, agent, filename):
+    listing = create_listings(client, agent, 1)[0]
+
+    response = client.post(f"/users/{agent['id']}/property/{listing['id']}/image", headers=agent["headers"],
+                           files={"image_file": (filename, jpeg_bytes(), "image/jpeg")})
+
+    assert response.status_code == 400
+    assert not [name for _, _, names in os.walk(storage.IMAGES_DIR) for name in names
+                if not name.endswith(storage.IMAGE_EXTENSIONS)]
@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import create_listings, fetch_all_pages
+
+
+@pytest.mark.parametrize("sort", ["newest", "price", "popular"])
+@pytest.mark.parametrize("path", ["/properties", "/properties/search"])
+def test_cursor_pages_cover_every_listing_once(client, agent, path, sort):
+    created = create_listings(client, agent, 25)
+
+    rows = fetch_all_pages(client, path, {"sort": sort, "limit": 7})
+
+    ids = [row["id"] for row in rows]
+    assert sorted(ids) == sorted(row["id"] for row in created)
+    if sort == "price":
+        assert [row["price"] for row in rows] == sorted(row["price"] for row in rows)
+    if sort == "newest":
+        # Listings created within the same second tie on created_at and fall back to id
+        assert ids == sorted(ids, reverse=True)
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/properties", params={"cursor": "junk"}).status_code == 400
+    assert client.get("/properties", params={"sort": "unknown"}).status_code == 400
+
+
+def test_distance_sort_pages_listings_with_coordinates_only(client, agent):
+    located = [created for index in range(20) for created in create_listings(
+        client, agent, 1, latitude=54.68 + index * 0.01, longitude=25.28)]
+    create_listings(client, agent, 5)  # no coordinates
+
+    rows = fetch_all_pages(client, "/properties/search", {"sort": "distance", "lat": 54.68, "lng": 25.28, "limit": 6})
+
+    assert [row["id"] for row in rows] == [row["id"] for row in located]
+    distances = [row["distance_km"] for row in rows]
+    assert distances == sorted(distances)
@@ -0,0 +1,48 @@
+import pytest
+
+import models
+from cache import response_cache
+from conftest import create_listings
+
+# Statements one request to a list endpoint may run, however many rows it
+# returns: the page query plus one per eager-loaded relationship (see the
+# query-options profiles in crud.py), and the user lookup when authenticated.
+QUERY_BUDGET = 5
+
+LIST_ENDPOINTS = [
+    ("/properties", None),
+    ("/properties/search", None),
+    ("/users/{agent}/myproperties", "agent"),
+    ("/users/{visitor}/favorites", "visitor"),
+]
+
+
+def add_listings(client, db, agent, visitor, count):
+    for created in create_listings(client, agent, count):
+        db.add_all([models.Image(url=f"/images/{created['id']}-{n}.jpg", property_id=created["id"])
+                    for n in range(2)])
+        response = client.post(f"/users/{visitor['id']}/property/{created['id']}/favorites",
+                               headers=visitor["headers"])
+        assert response.status_code == 200, response.text
+    db.commit()
+
+
+@pytest.mark.parametrize("path, user", LIST_ENDPOINTS)
+def test_list_endpoint_statements_do_not_grow_with_rows(client, db, agent, visitor, count_statements, path, user):
+    users = {"agent": agent, "visitor": visitor}
+    url = path.format(agent=agent["id"], visitor=visitor["id"])
+    headers = users[user]["headers"] if user else None
+
+    counts = []
+    for count in (3, 27):
+        add_listings(client, db, agent, visitor, count)
+        response_cache.invalidate()
+        with count_statements() as statements:
+            response = client.get(url, params={"limit": 50}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert all(row["agent"] and len(row["images"]) == 2 for row in response.json())
+        counts.append(statements.count)
+
+    assert len(response.json()) == 30
+    assert counts[1] <= QUERY_BUDGET, f"{url} ran {counts[1]} statements"
+    assert counts[0] == counts[1], f"{url} ran {counts[0]} statements for 3 rows but {counts[1]} for 30"
@@ -0,0 +1,24 @@
+import pytest
+
+import recommendations
+from conftest import create_listings, register
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+
+def test_similar_listings_follow_shared_favorites(client, agent, db):
+    listings = [created["id"] for created in create_listings(client, agent, 4)]
+    fans = [register(client, f"fan{n}@example.com", role="user") for n in range(3)]
+    # Every fan of the first listing also likes the second; one of them the third
+    for fan, favorites in zip(fans, ([0, 1], [0, 1, 2], [3])):
+        for index in favorites:
+            response = client.post(f"/users/{fan['id']}/property/{listings[index]}/favorites",
+                                   headers=fan["headers"])
+            assert response.status_code == 200, response.text
+
+    assert recommendations.rebuild(db) == 4
+    similar = client.get(f"/property/{listings[0]}/similar").json()
+
+    assert [row["id"] for row in similar] == [listings[1], listings[2]]
+    assert recommendations.rebuild(db) == 0  # nothing queued any more
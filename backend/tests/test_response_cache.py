@@ -0,0 +1,39 @@
+from conftest import create_listings
+
+
+def test_etag_revalidation_answers_304(client, agent):
+    create_listings(client, agent, 3)
+    response = client.get("/properties")
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "no-cache"
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        revalidated = client.get("/properties", headers={"If-None-Match": if_none_match})
+        assert revalidated.status_code == 304, if_none_match
+        assert revalidated.content == b"" and revalidated.headers["etag"] == etag
+    assert client.get("/properties", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_equivalent_query_strings_share_one_entry(client, agent, count_statements):
+    create_listings(client, agent, 3)
+    first = client.get("/properties", params=[("sort", "price"), ("limit", "2")])
+
+    with count_statements() as statements:
+        second = client.get("/properties", params=[("limit", "2"), ("location", ""), ("sort", "price")])
+
+    assert statements.count == 0
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["x-next-cursor"] == first.headers["x-next-cursor"]
+
+
+def test_writes_invalidate_cached_responses(client, agent):
+    create_listings(client, agent, 2)
+    before = client.get("/properties")
+
+    create_listings(client, agent, 1)
+    after = client.get("/properties", headers={"If-None-Match": before.headers["etag"]})
+
+    assert after.status_code == 200
+    assert len(after.json()) == 3
+    assert after.headers["etag"] != before.headers["etag"]
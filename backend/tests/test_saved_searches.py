@@ -0,0 +1,66 @@
+from conftest import create_listings, fetch_all_pages, listing
+
+
+def save_search(client, user: dict, **criteria) -> int:
+    response = client.post(f"/users/{user['id']}/saved-searches", headers=user["headers"], json=criteria)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def feed(client, user: dict, saved_search_id: int | None = None) -> list[dict]:
+    params = {"limit": 5, **({"saved_search_id": saved_search_id} if saved_search_id else {})}
+    return fetch_all_pages(client, f"/users/{user['id']}/saved-search-matches", params, headers=user["headers"])
+
+
+def matched_titles(client, user: dict, saved_search_id: int) -> list[str]:
+    return sorted(match["property"]["title"] for match in feed(client, user, saved_search_id))
+
+
+def test_new_listings_are_matched_against_the_criteria(client, agent, visitor):
+    budget = save_search(client, visitor, max_price=1015, location="vilnius")
+    apartments = save_search(client, visitor, property_type="apartment", bedrooms=3)
+    anything = save_search(client, visitor)  # no ceiling: matches every price
+
+    create_listings(client, agent, 3)  # houses in Vilnius for 1000-1020 with 1-3 bedrooms
+    create_listings(client, agent, 1, title="Flat", property_type="apartment", bedrooms=4, price=250000,
+                    location="Kaunas")
+    create_listings(client, agent, 1, title="Studio", property_type="apartment", bedrooms=1)
+
+    assert matched_titles(client, visitor, budget) == ["House 0", "House 1", "Studio"]
+    assert matched_titles(client, visitor, apartments) == ["Flat"]
+    assert matched_titles(client, visitor, anything) == ["Flat", "House 0", "House 1", "House 2", "Studio"]
+    assert len(feed(client, visitor)) == 3 + 1 + 5
+
+
+def test_location_wildcards_are_matched_literally(client, agent, visitor):
+    underscore = save_search(client, visitor, location="a_b")
+    percent = save_search(client, visitor, location="100%")
+    backslash = save_search(client, visitor, location="x\\y")
+
+    for title, location in [("Underscore", "Street A_B 1"), ("Any letter", "Street axb 1"),
+                            ("Percent", "100% Vilnius"), ("Digits", "1000 Vilnius"),
+                            ("Backslash", "Lot x\\y"), ("Plain", "Lot xy")]:
+        create_listings(client, agent, 1, title=title, location=location)
+
+    assert matched_titles(client, visitor, underscore) == ["Underscore"]
+    assert matched_titles(client, visitor, percent) == ["Percent"]
+    assert matched_titles(client, visitor, backslash) == ["Backslash"]
+
+
+def test_updates_rematch_the_listing(client, agent, visitor):
+    cheap = save_search(client, visitor, max_price=1500)
+    kaunas = save_search(client, visitor, location="Kaunas")
+    houses = save_search(client, visitor, property_type="house")
+    [created] = create_listings(client, agent, 1)
+    before = {match["saved_search_id"]: match for match in feed(client, visitor)}
+    assert set(before) == {cheap, houses}
+
+    response = client.put(f"/users/{agent['id']}/property/{created['id']}", headers=agent["headers"],
+                          json=listing(0, price=2000, location="Kaunas"))
+    assert response.status_code == 200, response.text
+
+    after = {match["saved_search_id"]: match for match in feed(client, visitor)}
+    assert set(after) == {kaunas, houses}
+    # A match that still holds keeps its place in the feed
+    assert after[houses]["id"] == before[houses]["id"]
+    assert after[houses]["created_at"] == before[houses]["created_at"]
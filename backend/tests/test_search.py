@@ -0,0 +1,42 @@
+import search
+from conftest import create_listings, fetch_all_pages, listing
+
+
+def test_full_text_search_ranks_matches_and_leaves_out_the_rest(client, agent):
+    once, twice = create_listings(client, agent, 2, description="Lakeside house")
+    response = client.put(f"/users/{agent['id']}/property/{twice['id']}", headers=agent["headers"],
+                          json=listing(1, description="Lakeside house with a lakeside sauna"))
+    assert response.status_code == 200, response.text
+    create_listings(client, agent, 3)
+
+    rows = client.get("/properties/search", params={"q": "lakeside"}).json()
+
+    assert [row["id"] for row in rows] == [twice["id"], once["id"]]
+    assert rows[0]["rank"] > rows[1]["rank"]
+
+
+def test_full_text_search_pages_by_relevance(client, agent):
+    created = create_listings(client, agent, 12, description="Lakeside house")
+
+    rows = fetch_all_pages(client, "/properties/search", {"q": "lakeside", "limit": 5})
+
+    assert sorted(row["id"] for row in rows) == sorted(row["id"] for row in created)
+    keys = [(row["rank"], row["id"]) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_headline_is_escaped_around_the_highlighted_terms(client, agent):
+    create_listings(client, agent, 1, title="<script>alert(1)</script> lakeside")
+
+    headline = client.get("/properties/search", params={"q": "lakeside"}).json()[0]["headline"]
+
+    assert "<script>" not in headline
+    assert "&lt;script&gt;" in headline
+    assert "<b>lakeside</b>" in headline
+
+
+def test_postgres_headline_markers_survive_escaping():
+    marked = f"<i>{search.HEADLINE_START}lakeside{search.HEADLINE_STOP}</i> & more"
+
+    assert search.escape_headline(marked) == "&lt;i&gt;<b>lakeside</b>&lt;/i&gt; &amp; more"
+    assert search.escape_headline(None) is None
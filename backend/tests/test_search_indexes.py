@@ -0,0 +1,51 @@
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+
+import database
+import models
+from cache import response_cache
+
+SEEDED_LISTINGS = 5000
+
+
+def test_migrations_match_the_models():
+    with database.engine.connect() as connection:
+        assert compare_metadata(MigrationContext.configure(connection), models.Base.metadata) == []
+
+
+@pytest.fixture
+def seeded(agent):
+    types, statuses = list(models.PropertyType), list(models.ListingStatus)
+    rows = [{"title": f"House {n}", "description": "d", "location": f"Town {n % 50}", "agent_id": agent["id"],
+             "price": 1000 + n % 997, "property_type": types[n % len(types)], "status": statuses[n % len(statuses)],
+             "bedrooms": n % 5, "bathrooms": n % 3, "size": 50, "favorites_count": n % 7}
+            for n in range(SEEDED_LISTINGS)]
+    with database.engine.begin() as connection:
+        connection.execute(models.Property.__table__.insert(), rows)
+        connection.exec_driver_sql("ANALYZE")
+
+
+def query_plan(statements) -> list[str]:
+    statement, parameters = next((statement, parameters) for statement, parameters in statements
+                                 if statement.lstrip().upper().startswith("SELECT")
+                                 and "FROM properties" in statement)
+    with database.engine.connect() as connection:
+        return [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+
+@pytest.mark.parametrize("params, index", [
+    ({"property_type": "house", "status": "available", "min_price": 1200, "max_price": 1300},
+     "ix_properties_type_status_price_bedrooms"),
+    ({"min_price": 1200, "max_price": 1210, "sort": "price"}, "ix_properties_price_id"),
+    ({"sort": "newest"}, "ix_properties_created_at_id"),
+    ({"sort": "popular"}, "ix_properties_favorites_count_id"),
+])
+def test_search_shapes_use_an_index(client, seeded, count_statements, params, index):
+    response_cache.invalidate()
+    with count_statements() as statements:
+        assert client.get("/properties/search", params={**params, "limit": 20}).status_code == 200
+
+    plan = query_plan(statements.statements)
+    assert any(index in step for step in plan), plan
+    assert not any(step.startswith("SCAN properties") and "INDEX" not in step for step in plan), plan
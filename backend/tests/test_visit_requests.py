@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import crud
+import database
+import models
+from conftest import create_listings, fetch_all_pages, register, request_visit
+
+
+def pending_visits(db, property_id: int) -> int:
+    db.expire_all()
+    return db.get(models.Property, property_id).pending_visits_count
+
+
+def test_status_change_reads_the_current_status_under_the_lock(client, agent, visitor, db):
+    listing = create_listings(client, agent, 1)[0]
+    visit = request_visit(client, visitor, listing["id"], datetime.utcnow() + timedelta(days=1))
+    assert pending_visits(db, listing["id"]) == 1
+
+    # As in the route: the request is loaded (pending) before the status change
+    stale = database.SessionLocal()
+    try:
+        loaded = crud.get_visit_request(stale, visit["id"])
+        assert loaded.status == models.VisitRequestStatus.pending
+        crud.update_visit_request_status(db, visit["id"], models.VisitRequestStatus.accepted)
+        crud.update_visit_request_status(stale, visit["id"], models.VisitRequestStatus.declined)
+    finally:
+        stale.close()
+
+    assert pending_visits(db, listing["id"]) == 0
+
+
+def test_accepting_an_overlapping_visit_conflicts(client, agent, visitor):
+    listings = create_listings(client, agent, 2)
+    visit_time = (datetime.utcnow() + timedelta(days=2)).replace(microsecond=0)
+    first = request_visit(client, visitor, listings[0]["id"], visit_time)
+    second = request_visit(client, visitor, listings[1]["id"], visit_time + timedelta(minutes=10))
+
+    accept = {"status": "accepted"}
+    assert client.put(f"/visit-request/{first['id']}/status", params=accept,
+                      headers=agent["headers"]).status_code == 200
+    assert client.put(f"/visit-request/{second['id']}/status", params=accept,
+                      headers=agent["headers"]).status_code == 409
+
+
+def inbox(agent) -> str:
+    return f"/users/{agent['id']}/agent-visit-requests"
+
+
+def test_inbox_pages_newest_first_without_gaps_or_repeats(client, agent, visitor, db):
+    listing = create_listings(client, agent, 1)[0]
+    start = datetime.utcnow() + timedelta(days=1)
+    ids = [request_visit(client, visitor, listing["id"], start + timedelta(hours=hour))["id"] for hour in range(7)]
+    # Requests created in the same instant are ordered by id
+    db.query(models.VisitRequest).filter(models.VisitRequest.id.in_(ids[2:5])).update(
+        {"created_at": datetime(2030, 1, 1)}, synchronize_session=False)
+    db.commit()
+
+    rows = fetch_all_pages(client, inbox(agent), {"limit": 2}, headers=agent["headers"])
+
+    assert [row["id"] for row in rows] == [ids[4], ids[3], ids[2], ids[6], ids[5], ids[1], ids[0]]
+    last = client.get(inbox(agent), params={"limit": 7}, headers=agent["headers"])
+    assert "X-Next-Cursor" not in last.headers
+    assert client.get(inbox(agent), params={"cursor": "garbage"}, headers=agent["headers"]).status_code == 400
+
+
+def test_inbox_status_filter_and_counts(client, agent, visitor):
+    listing = create_listings(client, agent, 1)[0]
+    start = datetime.utcnow() + timedelta(days=1)
+    visits = [request_visit(client, visitor, listing["id"], start + timedelta(days=day)) for day in range(5)]
+    for visit, status in zip(visits, ["accepted", "accepted", "declined"]):
+        assert client.put(f"/visit-request/{visit['id']}/status", params={"status": status},
+                          headers=agent["headers"]).status_code == 200
+
+    accepted = fetch_all_pages(client, inbox(agent), {"status": "accepted", "limit": 1}, headers=agent["headers"])
+    pending = client.get(inbox(agent), params={"status": "pending"}, headers=agent["headers"]).json()
+    counts = client.get(f"{inbox(agent)}/counts", headers=agent["headers"]).json()
+
+    assert [row["id"] for row in accepted] == [visits[1]["id"], visits[0]["id"]]
+    assert {row["id"] for row in pending} == {visits[3]["id"], visits[4]["id"]}
+    assert counts == {"pending": 2, "accepted": 2, "declined": 1, "total": 5}
+
+
+def test_inbox_is_private_to_its_agent(client, agent, visitor):
+    other = register(client, "other-agent@example.com")
+    listing = create_listings(client, other, 1)[0]
+    request_visit(client, visitor, listing["id"], datetime.utcnow() + timedelta(days=1))
+
+    assert client.get(inbox(agent), headers=agent["headers"]).json() == []
+    assert client.get(f"{inbox(agent)}/counts", headers=agent["headers"]).json()["total"] == 0
+    for path in (inbox(agent), f"{inbox(agent)}/counts"):
+        assert client.get(path, headers=other["headers"]).status_code == 403
+    assert client.get(inbox(visitor), headers=visitor["headers"]).status_code == 403
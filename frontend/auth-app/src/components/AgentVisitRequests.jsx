@@ -1,15 +1,35 @@
-import React, { useContext, useState, useEffect } from 'react';
+import React, { useCallback, useContext, useEffect, useRef, useState } from 'react';
 import { UserContext } from '../context/UserContext';
 import { Link, useParams } from "react-router-dom";
+import { jwtDecode } from "jwt-decode";
+
+const API_URL = "http://localhost:8000";
+const PAGE_SIZE = 50;
+const STATUSES = ["pending", "accepted", "declined"];
+const POLL_INTERVAL_MS = 30000;       // refetch period while the event stream is down
+const MAX_RECONNECT_DELAY_MS = 60000;
+const TOKEN_RENEW_BEFORE_MS = 60000;  // inside the server's sliding refresh window
+
+// Newest first, as the server pages them; `incoming` replaces rows with the same id
+const mergeRequests = (current, incoming) => {
+    const byId = new Map(current.map((request) => [request.id, request]));
+    incoming.forEach((request) => byId.set(request.id, request));
+    return [...byId.values()].sort((a, b) => new Date(b.created_at) - new Date(a.created_at) || b.id - a.id);
+};
 
 const AgentVisitRequests = () => {
-    const [token] = useContext(UserContext);
+    const [token, setToken] = useContext(UserContext);
+    const tokenRef = useRef(token);
     const [visitRequests, setVisitRequests] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [counts, setCounts] = useState(null);
+    const [statusFilter, setStatusFilter] = useState("");
+    const [loadingMore, setLoadingMore] = useState(false);
     const [errorMessage, setErrorMessage] = useState("");
-    const [properties, setProperties] = useState([]);
+    const [propertyTitles, setPropertyTitles] = useState({});
     const { user_id } = useParams();
     const [usernames, setUsernames] = useState({});
-    const [sortOrder, setSortOrder] = useState("newest");
+    const [reloadKey, setReloadKey] = useState(0);
 
     const formatDate = (dateString) => {
         const options = {
@@ -24,60 +44,167 @@ const AgentVisitRequests = () => {
     };
 
     useEffect(() => {
-        const fetchVisitRequests = async () => {
-            const requestOptions = {
-                method: "GET",
-                headers: {
-                    "Content-Type": "application/json",
-                    Authorization: `Bearer ${token}`,
-                },
-            };
+        tokenRef.current = token;
+    }, [token]);
 
-            try {
-                const response = await fetch(`http://localhost:8000/users/${user_id}/agent-visit-requests`, requestOptions);
-                if (!response.ok) throw new Error('Failed to load visit requests.');
-                const data = await response.json();
-                setVisitRequests(data);
-
-                // Now fetch usernames for each visit request
-                const userIds = data.map(request => request.user_id);
-                const uniqueUserIds = [...new Set(userIds)]; // Get unique user IDs
-                const userPromises = uniqueUserIds.map(async (user_id) => {
-                    const userResponse = await fetch(`http://localhost:8000/users/id/${user_id}`, requestOptions);
-                    if (!userResponse.ok) throw new Error("Failed to load user.");
-                    const userData = await userResponse.json();
-                    return { user_id, username: userData.username }; // Return the userId and username
-                });
-
-                // Once all user data is fetched, store it in state
-                const userData = await Promise.all(userPromises);
-                const userMapping = userData.reduce((acc, { user_id, username }) => {
-                    acc[user_id] = username; // Map user_id to username
-                    return acc;
-                }, {});
-
-                console.log('Usernames Mapping:', userMapping); // Debugging line
-                setUsernames(userMapping); // Store the username mapping in state
+    const authFetch = useCallback(async (path, options = {}) => {
+        const response = await fetch(`${API_URL}${path}`, {
+            ...options,
+            headers: {
+                "Content-Type": "application/json",
+                Authorization: `Bearer ${tokenRef.current}`,
+            },
+        });
+        // Sliding refresh: close to expiry the server answers with a new token
+        const newToken = response.headers.get("x-new-access-token");
+        if (newToken) {
+            localStorage.setItem("token", newToken);
+            setToken(newToken);
+        }
+        return response;
+    }, [setToken]);
+
+    // Usernames and property titles of the requests on screen, fetched once per id
+    const requestedDetails = useRef({ users: new Set(), properties: new Set() });
+    const loadDetails = useCallback(async (requests) => {
+        const lookup = async (ids, requested, path, field, setter) => {
+            const missing = [...new Set(ids)].filter((id) => !requested.has(id));
+            missing.forEach((id) => requested.add(id));
+            const entries = await Promise.all(missing.map(async (id) => {
+                const response = await authFetch(path(id));
+                return response.ok ? [id, (await response.json())[field]] : null;
+            }));
+            setter((prev) => ({ ...prev, ...Object.fromEntries(entries.filter(Boolean)) }));
+        };
+        try {
+            await Promise.all([
+                lookup(requests.map((request) => request.user_id), requestedDetails.current.users,
+                    (id) => `/users/id/${id}`, "username", setUsernames),
+                lookup(requests.map((request) => request.property_id), requestedDetails.current.properties,
+                    (id) => `/property/${id}`, "title", setPropertyTitles),
+            ]);
+        } catch (error) {
+            console.error("Failed to load request details:", error);
+        }
+    }, [authFetch]);
 
+    const loadCounts = useCallback(async () => {
+        const response = await authFetch(`/users/${user_id}/agent-visit-requests/counts`);
+        if (response.ok) setCounts(await response.json());
+    }, [authFetch, user_id]);
+
+    // One page of the inbox; without a cursor the first page replaces what is shown,
+    // unless `merge` asks to fold it into the pages already loaded
+    const loadPage = useCallback(async (cursor = null, merge = false) => {
+        const params = new URLSearchParams({ limit: PAGE_SIZE });
+        if (statusFilter) params.set("status", statusFilter);
+        if (cursor) params.set("cursor", cursor);
+        const response = await authFetch(`/users/${user_id}/agent-visit-requests?${params}`);
+        if (!response.ok) throw new Error('Failed to load visit requests.');
+        const page = await response.json();
+        setVisitRequests((prevRequests) => (cursor || merge ? mergeRequests(prevRequests, page) : page));
+        if (!merge) setNextCursor(response.headers.get("X-Next-Cursor"));
+        return page;
+    }, [authFetch, user_id, statusFilter]);
+
+    useEffect(() => {
+        const fetchVisitRequests = async () => {
+            try {
+                setErrorMessage("");
+                const [page] = await Promise.all([loadPage(), loadCounts()]);
+                loadDetails(page);
             } catch (error) {
                 setErrorMessage(error.message || "Failed to load visit requests.");
             }
         };
 
         fetchVisitRequests();
-    }, [token, user_id]);
+    }, [loadPage, loadCounts, loadDetails, reloadKey]);
 
-    const updateRequestStatus = async (requestId, newStatus) => {
-        const requestOptions = {
-            method: "PUT",
-            headers: {
-                "Content-Type": "application/json",
-                Authorization: `Bearer ${token}`,
-            },
+    const loadMore = async () => {
+        setLoadingMore(true);
+        try {
+            loadDetails(await loadPage(nextCursor));
+        } catch (error) {
+            setErrorMessage(error.message || "Failed to load visit requests.");
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
+    // New and updated requests are pushed by the server instead of polled for
+    useEffect(() => {
+        if (!token) return;
+        let source = null;
+        let reconnectTimer = null;
+        let pollTimer = null;
+        let reconnectDelay = 1000;
+
+        const catchUp = async () => {
+            try {
+                const [page] = await Promise.all([loadPage(null, true), loadCounts()]);
+                loadDetails(page);
+            } catch (error) {
+                setErrorMessage(error.message || "Failed to load visit requests.");
+            }
+        };
+        const upsert = (event) => {
+            const request = JSON.parse(event.data);
+            setVisitRequests((prevRequests) => {
+                const others = prevRequests.filter((req) => req.id !== request.id);
+                // A request whose status left the selected tab drops out of it
+                if (statusFilter && request.status !== statusFilter) return others;
+                return mergeRequests(others, [request]);
+            });
+            loadDetails([request]);
+            loadCounts();
+        };
+        const connect = () => {
+            source = new EventSource(
+                `${API_URL}/users/${user_id}/agent-visit-requests/events?access_token=${encodeURIComponent(tokenRef.current)}`
+            );
+            source.onopen = () => {
+                reconnectDelay = 1000;
+                clearInterval(pollTimer);
+                pollTimer = null;
+            };
+            source.addEventListener("visit_request.created", upsert);
+            source.addEventListener("visit_request.updated", upsert);
+            source.addEventListener("resync", () => setReloadKey((key) => key + 1));
+            // The server ends the stream when its token expires, and EventSource would
+            // retry with that same token, get a 403 and give up. Reconnect here instead
+            // with the current token, refetching the inbox until the stream is back.
+            source.onerror = () => {
+                source.close();
+                catchUp();
+                if (pollTimer === null) pollTimer = setInterval(catchUp, POLL_INTERVAL_MS);
+                reconnectTimer = setTimeout(connect, reconnectDelay);
+                reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY_MS);
+            };
+        };
+        connect();
+
+        // Renew the token before it expires: any authenticated request made then is
+        // answered with a new one, and the new token restarts this effect
+        let renewTimer = null;
+        try {
+            const { exp } = jwtDecode(token);
+            renewTimer = setTimeout(loadCounts, Math.max(0, exp * 1000 - Date.now() - TOKEN_RENEW_BEFORE_MS));
+        } catch (error) {
+            console.error("Could not read the token expiry:", error);
+        }
+
+        return () => {
+            source.close();
+            clearTimeout(reconnectTimer);
+            clearInterval(pollTimer);
+            clearTimeout(renewTimer);
         };
+    }, [token, user_id, statusFilter, loadPage, loadDetails, loadCounts]);
 
+    const updateRequestStatus = async (requestId, newStatus) => {
         try {
-            const response = await fetch(`http://127.0.0.1:8000/visit-request/${requestId}/status?status=${newStatus}`, requestOptions);
+            const response = await authFetch(`/visit-request/${requestId}/status?status=${newStatus}`, { method: "PUT" });
             if (!response.ok) {
                 const errorData = await response.json();
                 throw new Error(errorData.detail || "Failed to update status");
@@ -88,45 +215,16 @@ const AgentVisitRequests = () => {
                     req.id === requestId ? { ...req, status: updatedRequest.status } : req
                 )
             );
+            loadCounts();
         } catch (error) {
             console.error("Error updating status:", error.message);
             setErrorMessage(error.message || "Failed to update status");
         }
     };
 
-    useEffect(() => {
-        const fetchProperties = async () => {
-            const requestOptions = {
-                method: "GET",
-                headers: {
-                    "Content-Type": "application/json",
-                    Authorization: `Bearer ${token}`,
-                },
-            };
+    const getPropertyTitle = (propertyId) => propertyTitles[propertyId] || "Title Not Available";
 
-            try {
-                const response = await fetch(`http://localhost:8000/properties`, requestOptions);
-                if (!response.ok) throw new Error("Failed to load properties.");
-                const data = await response.json();
-                setProperties(data);
-            } catch (error) {
-                setErrorMessage("Failed to load properties. Please try again later.");
-            }
-        };
-
-        fetchProperties();
-    }, [token]);
-
-    const getPropertyTitle = (propertyId) => {
-        const property = properties.find((prop) => prop.id === propertyId);
-        return property ? property.title : "Title Not Available";
-    };
-
-    const sortedVisitRequests = [...visitRequests].sort((a, b) => {
-        const dateA = new Date(a.created_at);
-        const dateB = new Date(b.created_at);
-        return sortOrder === "newest" ? dateB - dateA : dateA - dateB;
-    });
+    const countFor = (status) => (counts ? counts[status || "total"] : null);
 
     return (
         <div className="container">
@@ -135,22 +233,28 @@ const AgentVisitRequests = () => {
             <h1 className="title is-3">Visit Requests for Your Properties</h1>
             {errorMessage && <p className="has-text-danger">{errorMessage}</p>}
 
-            <div className="sort-options">
-                <label className="label">Sort by: </label>
-                <div className="control">
-                    <div className="select">
-                        <select value={sortOrder} onChange={(e) => setSortOrder(e.target.value)}>
-                            <option value="newest">Newest</option>
-                            <option value="oldest">Oldest</option>
-                        </select>
-                    </div>
-                </div>
+            <div className="tabs">
+                <ul>
+                    {["", ...STATUSES].map((status) => (
+                        <li key={status || "all"} className={statusFilter === status ? "is-active" : ""}>
+                            <a href="#!" onClick={(e) => { e.preventDefault(); setStatusFilter(status); }}>
+                                {status ? status.charAt(0).toUpperCase() + status.slice(1) : "All"}
+                                {countFor(status) !== null && ` (${countFor(status)})`}
+                            </a>
+                        </li>
+                    ))}
+                </ul>
             </div>
-            <br /><br />
+            {countFor(statusFilter) !== null && (
+                <p className="has-text-grey">
+                    Showing {visitRequests.length} of {countFor(statusFilter)}, newest first
+                </p>
+            )}
+            <br />
 
             <div className="scrollable-container">
-                {sortedVisitRequests.length > 0 ? (
-                    sortedVisitRequests.map((request) => (
+                {visitRequests.length > 0 ? (
+                    visitRequests.map((request) => (
                         <div key={request.id} className="box" style={{position: 'relative'}}>
                             <span style={{
                                 position: 'absolute',
@@ -202,6 +306,15 @@ const AgentVisitRequests = () => {
                 ) : (
                     <p>No visit requests found.</p>
                 )}
+                {nextCursor && (
+                    <button
+                        onClick={loadMore}
+                        className={`button is-link is-light ${loadingMore ? "is-loading" : ""}`}
+                        disabled={loadingMore}
+                    >
+                        Load more
+                    </button>
+                )}
             </div>
         </div>
     );